@@ -0,0 +1,87 @@
+#
+#  bench/records.py
+#
+#  Compare the memory used to hold 10k instances as describe_instances
+#  response dicts against the core.models records made from them.
+#
+#  python bench/records.py
+#
+
+import datetime
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from sawsc.core.models import Instance
+
+COUNT = 10000
+
+
+def raw_instance(n):
+    # the parts of a describe_instances result for a typical instance
+    iid = f'i-{n:017x}'
+    eni = f'eni-{n:017x}'
+    ip = f'10.0.{n//256%256}.{n%256}'
+    return {
+        'AmiLaunchIndex': 0, 'ImageId': 'ami-0123456789abcdef0',
+        'InstanceId': iid, 'InstanceType': 't3a.medium', 'KeyName': 'dev-key',
+        'LaunchTime': datetime.datetime(2023, 5, 1, 10, n % 60, tzinfo=datetime.timezone.utc),
+        'Monitoring': {'State': 'disabled'},
+        'Placement': {'AvailabilityZone': 'ap-southeast-2a', 'GroupName': '', 'Tenancy': 'default'},
+        'PrivateDnsName': f'ip-{ip.replace(".", "-")}.ap-southeast-2.compute.internal',
+        'PrivateIpAddress': ip, 'ProductCodes': [],
+        'PublicDnsName': f'ec2-3-25-{n//256%256}-{n%256}.ap-southeast-2.compute.amazonaws.com',
+        'PublicIpAddress': f'3.25.{n//256%256}.{n%256}',
+        'State': {'Code': 16, 'Name': 'running'},
+        'StateTransitionReason': '', 'SubnetId': 'subnet-0123456789abcdef0',
+        'VpcId': 'vpc-0123456789abcdef0', 'Architecture': 'x86_64',
+        'BlockDeviceMappings': [{'DeviceName': '/dev/xvda', 'Ebs': {
+            'AttachTime': datetime.datetime(2023, 5, 1, tzinfo=datetime.timezone.utc),
+            'DeleteOnTermination': True, 'Status': 'attached', 'VolumeId': f'vol-{n:017x}'}}],
+        'ClientToken': '', 'EbsOptimized': False, 'EnaSupport': True, 'Hypervisor': 'xen',
+        'NetworkInterfaces': [{
+            'Attachment': {'AttachTime': datetime.datetime(2023, 5, 1, tzinfo=datetime.timezone.utc),
+                           'AttachmentId': f'eni-attach-{n:017x}', 'DeleteOnTermination': True,
+                           'DeviceIndex': 0, 'Status': 'attached', 'NetworkCardIndex': 0},
+            'Description': '', 'Groups': [{'GroupName': 'dev-ssh', 'GroupId': 'sg-0123456789abcdef0'}],
+            'Ipv6Addresses': [{'Ipv6Address': f'2406:da1c:1:2::{n:x}'}],
+            'MacAddress': '06:00:00:00:00:00', 'NetworkInterfaceId': eni, 'OwnerId': '123456789012',
+            'PrivateDnsName': f'ip-{ip.replace(".", "-")}.ap-southeast-2.compute.internal',
+            'PrivateIpAddress': ip,
+            'PrivateIpAddresses': [{'Primary': True, 'PrivateIpAddress': ip,
+                'PrivateDnsName': f'ip-{ip.replace(".", "-")}.ap-southeast-2.compute.internal'}],
+            'SourceDestCheck': True, 'Status': 'in-use',
+            'SubnetId': 'subnet-0123456789abcdef0', 'VpcId': 'vpc-0123456789abcdef0',
+            'InterfaceType': 'interface'}],
+        'RootDeviceName': '/dev/xvda', 'RootDeviceType': 'ebs',
+        'SecurityGroups': [{'GroupName': 'dev-ssh', 'GroupId': 'sg-0123456789abcdef0'}],
+        'SourceDestCheck': True,
+        'Tags': [{'Key': 'Name', 'Value': f'dev-{n}'}, {'Key': 'env', 'Value': 'dev'}],
+        'VirtualizationType': 'hvm',
+        'CpuOptions': {'CoreCount': 1, 'ThreadsPerCore': 2},
+        'CapacityReservationSpecification': {'CapacityReservationPreference': 'open'},
+        'HibernationOptions': {'Configured': False},
+        'MetadataOptions': {'State': 'applied', 'HttpTokens': 'optional',
+                            'HttpPutResponseHopLimit': 1, 'HttpEndpoint': 'enabled'},
+        'EnclaveOptions': {'Enabled': False}, 'PlatformDetails': 'Linux/UNIX',
+        'UsageOperation': 'RunInstances',
+        }
+
+
+def measure(make):
+    tracemalloc.start()
+    items = make()
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return items, used
+
+
+if __name__ == '__main__':
+    raw, raw_size = measure(lambda: [raw_instance(n) for n in range(COUNT)])
+    del raw
+    # each response is dropped once its record is made, as fetch_instances does
+    recs, rec_size = measure(lambda: [Instance.from_api(raw_instance(n)) for n in range(COUNT)])
+    for txt,size in [('response dicts', raw_size), ('records', rec_size)]:
+        print(f'{txt:>15}: {size/1024/1024:7.2f} MiB per {COUNT} instances, {size/COUNT:7.0f} bytes each')
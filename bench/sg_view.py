@@ -0,0 +1,133 @@
+#
+#  bench/sg_view.py
+#
+#  Compare the widgets and time taken to show a large account's security
+#  groups with a framed row and a button per rule detail, as the view
+#  used to, against the Treeview which only adds the rules of an opened
+#  group. Needs a display, without one run it under a virtual X display.
+#
+#  python bench/sg_view.py [groups] [rules per group]
+#  xvfb-run -s '-screen 0 1920x1080x24' python bench/sg_view.py
+#
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+import tkinter as tk
+import ttkbootstrap as ttk
+from ttkbootstrap.tooltip import ToolTip
+
+from sawsc.core.models import Rule, SecurityGroup
+from sawsc.service import aws_vpc_sg
+
+GROUPS = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+RULES = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+PADDING = 2
+
+
+def make_groups():
+    groups = []
+    for g in range(GROUPS):
+        ingress = tuple(Rule(protocol='tcp', from_port=1000+r, to_port=1000+r,
+                             ipv4=tuple((f'10.{g%256}.{r}.{c}/32', f'host {c}') for c in range(3)),
+                             ipv6=(), groups=())
+                        for r in range(RULES))
+        egress = (Rule(protocol='-1', from_port='', to_port='',
+                       ipv4=(('0.0.0.0/0', ''),), ipv6=(), groups=()),)
+        groups.append(SecurityGroup(id=f'sg-{g:017x}', name=f'group {g}',
+                                    group_name=f'group-{g}', vpc='vpc-0123456789abcdef0',
+                                    description='synthetic group', ingress=ingress,
+                                    egress=egress, tags=()))
+    return groups
+
+
+def framed_rules(par, rules):
+    for r,rule in enumerate(rules):
+        r_frame = ttk.Frame(par, borderwidth=1, relief=tk.SOLID, padding=1)
+        r_frame.grid(row=r+1, column=0)
+        for n,(txt,val) in enumerate([('From port:', rule.from_port),
+                                    ('To port:', rule.to_port),
+                                    ('Protocol:', rule.protocol)]):
+            ttk.Label(r_frame, text=txt).grid(row=n, column=0, sticky=tk.E, padx=PADDING)
+            if val != '':
+                ttk.Button(r_frame, text=val, bootstyle='link').grid(row=n, column=1)
+        for row,cidrs in [(3, rule.ipv4), (5, rule.ipv6)]:
+            c_frame = ttk.Frame(r_frame)
+            c_frame.grid(row=row, column=0, columnspan=5)
+            for ir,(cidr,desc) in enumerate(cidrs):
+                l = ttk.Button(c_frame, text=cidr, bootstyle='link')
+                l.grid(row=ir, column=0, padx=PADDING)
+                tt = ToolTip(l, text='CIDR block')
+                if desc:
+                    ttk.Button(c_frame, text=desc, bootstyle='link').grid(row=ir, column=1)
+
+
+def framed(par, groups):
+    # the layout of the view before it used a Treeview
+    for g in groups:
+        item = ttk.Frame(par, borderwidth=2, relief=tk.RIDGE)
+        item.pack(side=tk.TOP, expand=True, fill=tk.X)
+        for c,txt in enumerate([g.name, g.id, g.vpc, g.description]):
+            l = ttk.Button(item, text=txt, bootstyle='link')
+            l.grid(row=0 if c < 3 else 2, column=c if c < 3 else 0, sticky=tk.W)
+            tt = ToolTip(l, text='detail')
+        rules_frame = ttk.Frame(item)
+        rules_frame.grid(row=10, column=0, columnspan=10, sticky=tk.EW)
+        for c,(txt,rules) in enumerate([('Inbound Allow:', g.ingress),
+                                        ('Outbound Allow:', g.egress)]):
+            ttk.Label(rules_frame, text=txt).grid(row=0, column=c, sticky=tk.W)
+            frame = ttk.Frame(rules_frame)
+            frame.grid(row=1, column=c, sticky=tk.NW)
+            framed_rules(frame, rules)
+
+
+class TreeView(aws_vpc_sg.ListFrame):
+    # nothing is fetched, the groups are added by the benchmark
+    def refresh(self, force=True):
+        pass
+
+
+def treeview(par, groups):
+    view = TreeView(par)
+    view.pack(expand=True, fill=tk.BOTH)
+    view.begin_update()
+    for g in groups:
+        view.update_item(g)
+    view.end_update()
+    return view
+
+
+def widget_count(w):
+    return sum(1 + widget_count(c) for c in w.winfo_children())
+
+
+def run(name, build, groups):
+    root = ttk.Window()
+    frame = ttk.Frame(root)
+    frame.pack(expand=True, fill=tk.BOTH)
+    started = time.perf_counter()
+    view = build(frame, groups)
+    root.update()
+    secs = time.perf_counter() - started
+    print(f'{name:>8}: {widget_count(frame):7d} widgets, {secs*1000:9.1f} ms to show')
+    if view is not None:
+        started = time.perf_counter()
+        view.open_row(iid=groups[0].id)
+        root.update()
+        secs = time.perf_counter() - started
+        rows = len(view.tree.get_children(groups[0].id))
+        print(f'{"":>8}  {secs*1000:9.1f} ms to open a group of {rows} rule rows')
+    root.destroy()
+
+
+if __name__ == '__main__':
+    if sys.platform.startswith('linux') and not os.environ.get('DISPLAY'):
+        sys.exit('No display, run it with xvfb-run, see the top of this file.')
+    groups = make_groups()
+    print(f'{GROUPS} groups of {RULES} inbound rules with 3 cidrs each')
+    run('framed', framed, groups)
+    run('treeview', treeview, groups)
@@ -0,0 +1,44 @@
+#
+#  bench/startup.py
+#
+#  Compare the cost of finding the gui services by reading their
+#  labels against importing every service module at startup.
+#
+#  python bench/startup.py
+#
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+# the service modules create boto3 clients which need a region
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+from importlib import import_module
+
+service_dir = os.path.join(os.path.dirname(os.path.dirname(
+                            os.path.realpath(__file__))), 'sawsc', 'service')
+service_names = [s[:-3] for s in sorted(os.listdir(service_dir))
+                    if s.endswith('.py') and s != '__init__.py']
+
+
+def eager():
+    # what gui.py used to do, clear the module cache to repeat the cost
+    for s in service_names:
+        sys.modules.pop('sawsc.service.'+s, None)
+    return {s: import_module('sawsc.service.'+s) for s in service_names}
+
+
+def lazy():
+    from sawsc.gui import ServiceRegistry
+    return ServiceRegistry(service_dir)
+
+
+if __name__ == '__main__':
+    # import the shared modules first so only the service cost is measured
+    import sawsc.gui
+    import sawsc.service
+    for f in [eager, lazy]:
+        t = min(timeit.repeat(f, number=1, repeat=5))
+        print(f'{f.__name__:>6}: {t*1000:8.2f} ms for {len(service_names)} services')
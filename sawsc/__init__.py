@@ -75,6 +75,13 @@ class CLIOptions:
         self.remember_service = False
         self.run_tmux = True
         self.terminal = ''
+        self.max_pool_connections = 10
+        self.page_size = 200
+        self.max_workers = 8
+        self.transfer_part_size = 8
+        self.transfer_concurrency = 10
+        self.profiles = []
+        self.cache_ttl = {}
         self.known_keys = {}
 
     @property
@@ -86,14 +93,27 @@ class CLIOptions:
     def config_file(self):
         return os.path.join(self.config_dir, 'config.json')
 
+    @property
+    def cache_file(self):
+        return os.path.join(self.config_dir, 'cache.sqlite')
+
     def defaults(self):
         return {'Appearance': {'theme': 'darkly',},
                 'State': {  'service': 'aws_ec2',
                             'remember': False,
                             'run_tmux': True,
                             },
-                'Accounts': {'aws_customer_id': '123465',},
-                'Options': {'terminal': 'xterm',},
+                'Accounts': {'aws_customer_id': '123465',
+                             'profiles': [], # aws profile names, none for the default
+                             },
+                'Options': {'terminal': 'xterm',
+                            'max_pool_connections': 10,
+                            'page_size': 200,
+                            'max_workers': 8, # profiles and regions fetched at once
+                            'transfer_part_size': 8, # MiB of each part of s3 transfers
+                            'transfer_concurrency': 10, # parts of a file sent at once
+                            },
+                'Cache': {'ttl': {}}, # as - resource type: seconds
                 'SSH_keys': {}, # as - inst_id: [user, key_path]
                 }
 
@@ -104,7 +124,14 @@ class CLIOptions:
         config['State']['remember'] = self.remember_service
         config['State']['run_tmux'] = self.run_tmux
         config['Accounts']['aws_customer_id'] = self.aws_customer_id
+        config['Accounts']['profiles'] = self.profiles
         config['Options']['terminal'] = self.terminal
+        config['Options']['max_pool_connections'] = self.max_pool_connections
+        config['Options']['page_size'] = self.page_size
+        config['Options']['max_workers'] = self.max_workers
+        config['Options']['transfer_part_size'] = self.transfer_part_size
+        config['Options']['transfer_concurrency'] = self.transfer_concurrency
+        config['Cache']['ttl'] = self.cache_ttl
         config['SSH_keys'] = self.known_keys
         if not os.path.exists(os.path.dirname(self.config_file)):
             os.makedirs(os.path.dirname(self.config_file))
@@ -120,13 +147,21 @@ class CLIOptions:
         if 'State' not in config: config['State'] = {}
         if 'Accounts' not in config: config['Accounts'] = {}
         if 'Options' not in config: config['Options'] = {}
+        if 'Cache' not in config: config['Cache'] = {}
         self.active_theme = config['Appearance'].get('theme', 'darkly')
         self.remember_service = config['State'].get('remember', False)
         if self.remember_service:
             self.active_choice = config['State'].get('service', 'aws_ec2')
         self.run_tmux = config['State'].get('run_tmux', True)
         self.aws_customer_id = config['Accounts'].get('aws_customer_id', '123456')
+        self.profiles = config['Accounts'].get('profiles', [])
         self.terminal = config['Options'].get('terminal', 'xterm')
+        self.max_pool_connections = config['Options'].get('max_pool_connections', 10)
+        self.page_size = config['Options'].get('page_size', 200)
+        self.max_workers = config['Options'].get('max_workers', 8)
+        self.transfer_part_size = config['Options'].get('transfer_part_size', 8)
+        self.transfer_concurrency = config['Options'].get('transfer_concurrency', 10)
+        self.cache_ttl = config['Cache'].get('ttl', {})
         self.known_keys = config.get('SSH_keys', {})
 
 
@@ -148,6 +183,13 @@ class GUIOptions(CLIOptions):
         self._run_tmux.set(True)
         self._aws_customer_id = tk.StringVar()
         self._terminal = tk.StringVar()
+        self.max_pool_connections = 10
+        self.page_size = 200
+        self.max_workers = 8
+        self.transfer_part_size = 8
+        self.transfer_concurrency = 10
+        self.profiles = []
+        self.cache_ttl = {}
         self.known_keys = {}
 
     @property
@@ -32,45 +32,216 @@
 
 
 import argparse
-import boto3
 from os.path import join, exists, expanduser
 from pprint import pp
 import signal
 import subprocess as sp
 import sys
+import threading as thr
+import time
 
 from . import CLIOptions
+from .core import cache
+from .core.clients import configure
+from .core.catalog import type_choices
+from .core.ec2 import (States, change_instances, change_type, instance_filters, load_instances,
+                       parse_choices)
+from .core.exposure import WORLD, load_index
+from .core.inventory import gather, targets
+from .core.models import Instance
+from .core.s3 import (Progress, download_jobs, split_url, transfer, transfer_config,
+                        upload_jobs)
 from .__version__ import __version__ as vers
-from .service.aws_ec2 import States, TYPE_CHOICES
 
-Opts = CLIOptions()
-Opts.load()
+Opts = CLIOptions() # loaded in main()
 
 NAMELEN = 24
 
 
 def signal_handler(signal, frame):
     sys.exit(0)
-signal.signal(signal.SIGINT, signal_handler)
-signal.signal(signal.SIGQUIT, signal_handler)
-signal.signal(signal.SIGTERM, signal_handler)
-signal.signal(signal.SIGTSTP, signal_handler)
+
+
+def install_signal_handlers():
+    signal.signal(signal.SIGINT, signal_handler)
+    signal.signal(signal.SIGQUIT, signal_handler)
+    signal.signal(signal.SIGTERM, signal_handler)
+    signal.signal(signal.SIGTSTP, signal_handler)
 
 
 def list_instances(ki):
+    # the account and region columns are only shown when there are several
+    acct = max(len(ki[idx].account) for idx in ki) if len(ki) else 0
+    regions = len(set(ki[idx].region for idx in ki)) > 1
+    rlen = max(len(ki[idx].region) for idx in ki) if regions else 0
     for idx in sorted(ki):
         kiip = ''
-        if ki[idx]['state'] == States.RUNNING:
-            kiip = ki[idx]['ip']
-            if len(ki[idx]['ipv6']):
-                for ip6 in ki[idx]['ipv6']:
-                    kiip += f' - {ip6}'
-        print(f'''{idx: 4d}: {ki[idx]['name'].ljust(NAMELEN, ' ')}'''
-                f''' - {ki[idx]['id']} - {ki[idx]['st_name']} {kiip}''')
+        if ki[idx].state == States.RUNNING:
+            kiip = ki[idx].public_ip
+            for ip6 in ki[idx].ipv6:
+                kiip += f' - {ip6}'
+        account = f'''{ki[idx].account.ljust(acct, ' ')} - ''' if acct else ''
+        if regions:
+            account += f'''{ki[idx].region.ljust(rlen, ' ')} - '''
+        print(f'''{idx: 4d}: {account}{ki[idx].name.ljust(NAMELEN, ' ')}'''
+                f''' - {ki[idx].id} - {ki[idx].state_name} {kiip}''')
+
+
+def choose_instances(prompt, ki):
+    '''
+    Ask for one or more list numbers, eg 1,3,5-20
+
+    returns: list of the chosen list numbers that are in ki
+    '''
+    try:
+        choices = parse_choices(input(prompt))
+    except (ValueError, EOFError):
+        print()
+        return []
+    for c in choices:
+        if c not in ki:
+            print(f'{c} is not listed, skipped.')
+    return [c for c in choices if c in ki]
+
+
+def apply_state(action, ki, force=False):
+    '''
+    Send the state change for every instance in ki and show how each went.
+
+    returns: True when every instance changed
+    '''
+    by_id = {ki[idx].id: idx for idx in ki}
+    results = change_instances(action, ki.values(), force)
+    for inst_id,(ok,msg) in results.items():
+        print(f'''{by_id[inst_id]: 4d}: {ki[by_id[inst_id]].name.ljust(NAMELEN, ' ')}'''
+                f''' - {inst_id} - {msg if ok else 'failed: '+msg}''')
+    return all(r[0] for r in results.values())
+
+
+def print_permissions(idx, perms, verb='from'):
+    '''
+    List the matching permissions under their group, followed by the
+    interfaces using the group.
+    '''
+    by_group = {}
+    for p in perms:
+        by_group.setdefault(p.group, []).append(p)
+    for gid in sorted(by_group):
+        g = idx.groups[gid]
+        print(f'{gid} - {g.name or g.group_name} - {g.vpc}')
+        for p in sorted(by_group[gid], key=lambda p: (p.protocol, p.low)):
+            proto = 'all' if p.protocol == '-1' else p.protocol
+            print(f'    {proto} {p.ports} {verb} {p.peer} {p.description}')
+        for n in idx.users(gid):
+            print(f'      used by {n.instance or n.id} {n.description}')
+
+
+def sg_main(argv):
+    parser = argparse.ArgumentParser(prog='sawsc sg',
+                    description='''Find what security groups let in, or out.''')
+    parser.add_argument('--refresh', help='fetch from aws instead of using cached data', action='store_true')
+    parser.add_argument('--profile', help='aws profile to use', type=str)
+    parser.add_argument('--region', help='region to use', type=str)
+    parser.add_argument('--proto', help='protocol, default tcp', type=str, default='tcp')
+    queries = parser.add_subparsers(dest='query', required=True)
+    q = queries.add_parser('open', help='''what allows a port from every address of the
+                    --from cidrs, which default to the whole internet''')
+    q.add_argument('port', type=int)
+    q.add_argument('--from', help='cidr or ip, can be repeated', dest='peers', action='append')
+    q.add_argument('--egress', help='check outbound rules', action='store_true')
+    q = queries.add_parser('reach', help='what can reach an ip address on a port')
+    q.add_argument('ip', type=str)
+    q.add_argument('port', type=int)
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    try:
+        idx = load_index(not args.refresh, args.region, args.profile)
+    except Exception as e:
+        print(f'Unable to get security groups: {e}')
+        exit(6)
+    loaded = time.perf_counter()
+    try:
+        if args.query == 'open':
+            perms = idx.exposed(args.port, args.proto, args.peers or WORLD,
+                                'egress' if args.egress else 'ingress')
+        else:
+            perms = idx.reaching(args.ip, args.port, args.proto)
+    except ValueError as e:
+        print(e)
+        exit(6)
+    done = time.perf_counter()
+    print_permissions(idx, perms, 'to' if args.query == 'open' and args.egress else 'from')
+    print(f'{len(perms)} of {idx.rule_count} rules match, loaded in {loaded-started:.2f}s,'
+            f' queried in {(done-loaded)*1000:.1f}ms', file=sys.stderr)
+    if len(perms) < 1 and args.query == 'reach' and len(idx.groups_of(args.ip)) < 1:
+        print(f'No network interface has the address {args.ip}')
+
+
+def s3_main(argv):
+    parser = argparse.ArgumentParser(prog='sawsc s3',
+                    description='''Copy files to and from s3, several files at once
+                    and large files in parts.''')
+    parser.add_argument('--profile', help='aws profile to use', type=str)
+    parser.add_argument('--part-size', help='MiB in each part of a large file',
+                    type=int, default=Opts.transfer_part_size)
+    parser.add_argument('--concurrency', help='parts of a file sent at once',
+                    type=int, default=Opts.transfer_concurrency)
+    parser.add_argument('--workers', help='files sent at once',
+                    type=int, default=Opts.max_workers)
+    cmds = parser.add_subparsers(dest='cmd', required=True)
+    c = cmds.add_parser('get', help='download an object, or every object under a prefix ending in /')
+    c.add_argument('url', help='s3://bucket/key')
+    c.add_argument('dest', help='file or directory to save to', nargs='?', default='.')
+    c = cmds.add_parser('put', help='upload a file, or every file in a directory')
+    c.add_argument('src', help='file or directory to upload')
+    c.add_argument('url', help='s3://bucket/key, or s3://bucket/prefix/ to keep the file name')
+    args = parser.parse_args(argv)
+
+    bucket, key = split_url(args.url)
+    try:
+        if args.cmd == 'get':
+            jobs = download_jobs(bucket, key, args.dest, profile=args.profile)
+        else:
+            jobs = upload_jobs(args.src, bucket, key)
+    except Exception as e:
+        print(f'Unable to find what to {args.cmd}: {e}')
+        exit(7)
+    if len(jobs) < 1:
+        print('Nothing to copy')
+        return
+
+    progress = Progress(jobs)
+    done = thr.Event()
+    def show_progress():
+        while not done.wait(0.5):
+            print('\r'+progress.summary(), end='', file=sys.stderr, flush=True)
+    ticker = thr.Thread(target=show_progress, daemon=True)
+    ticker.start()
+    failed = []
+    for job,err in transfer(jobs, args.cmd == 'put',
+                            transfer_config(args.part_size, args.concurrency),
+                            args.workers, progress, profile=args.profile):
+        if err is not None:
+            failed.append((job, err))
+    done.set()
+    ticker.join()
+    print(f'\r{progress.summary()} in {progress.seconds:.1f}s', file=sys.stderr)
+    for (path,bucket,key,size),err in failed:
+        print(f'Failed {path} {"to" if args.cmd == "put" else "from"} s3://{bucket}/{key}: {err}')
+    if len(failed):
+        exit(7)
 
 
 def main():
-    ec2 = boto3.client('ec2')
+    Opts.load()
+    install_signal_handlers()
+    configure(Opts.max_pool_connections, Opts.page_size)
+    cache.configure(Opts.cache_file, Opts.cache_ttl)
+    if len(sys.argv) > 1 and sys.argv[1] == 'sg':
+        return sg_main(sys.argv[2:])
+    if len(sys.argv) > 1 and sys.argv[1] == 's3':
+        return s3_main(sys.argv[2:])
     known_instances = {}
     run_count = 0
 
@@ -80,81 +251,101 @@ def main():
     parser.add_argument('-l', '--list', help='list all instances', action='store_true')
     parser.add_argument('-r', '--run', help='start an instance', action='store_true')
     parser.add_argument('-f', '--force', help='force reboot an instance', action='store_true')
+    parser.add_argument('-x', '--stop', help='stop an instance', action='store_true')
     parser.add_argument('-s', '--ssh', help='ssh into an instance', action='store_true')
     parser.add_argument('-c', '--change', help='chnage instance type', action='store_true')
     parser.add_argument('-k', '--key', help='ssh key file', type=str, default='')
+    parser.add_argument('--refresh', help='fetch from aws instead of using cached data', action='store_true')
+    parser.add_argument('--profile', help='''aws profile to use, can be repeated,
+                    defaults to the profiles in config.json''', action='append')
+    parser.add_argument('-a', '--all-regions', help='use every enabled region', action='store_true')
+    selector = parser.add_argument_group('selectors', '''Only use matching instances,
+                    -r, -x and -f act on every match without asking.''')
+    selector.add_argument('--state', help='instance state/s eg running,stopped', type=str)
+    selector.add_argument('--tag', help='tag Key=Value or Key, can be repeated', action='append')
+    selector.add_argument('--vpc', help='VPC ID', type=str)
+    selector.add_argument('--name', help='Name tag, * and ? match any text', metavar='GLOB', type=str)
     parser.add_argument('ids', metavar='Id', type=str, nargs='*', help='Instance Id/s to start')
     args = parser.parse_args()
+    listing = args.list or not any([args.run, args.force, args.stop, args.ssh, args.change])
+    filters = instance_filters(args.state.split(',') if args.state else None,
+                                args.tag, args.vpc, args.name)
+    selected = len(filters) > 0
+    profiles = list(dict.fromkeys(args.profile or Opts.profiles or [None]))
 
     if len(args.ids):
         print('Starting:')
         for i in args.ids:
             print(i)
-        ec2.start_instances(InstanceIds=args.ids)
+        if not apply_state('start', {n+1: Instance(id=i, account=profiles[0] or '')
+                                        for n,i in enumerate(args.ids)}):
+            exit(2)
         return
 
-    response = ec2.describe_instances()
-    for r in response['Reservations']:
-        for i in r['Instances']:
-            # if i['State']['Code'] > 255: # clear top byte
-            k_idx = len(known_instances) + 1
-            known_instances[k_idx] = {  'state': i['State']['Code'],
-                                        'st_name': i['State']['Name'],
-                                        'id': i['InstanceId'],
-                                        'type': i['InstanceType'],
-                                        'arch': i['Architecture'],
-                                        'name': '',
-                                        'dnsname': '',
-                                        'ip': '',
-                                        'ipv6': [],}
-            if 'Tags' in i:
-                for t in i['Tags']:
-                    if 'Key' in t and t['Key'] == 'Name':
-                        known_instances[k_idx]['name'] = t['Value']
-
-            if i['State']['Code'] == States.RUNNING:
-                run_count += 1
-                for ni in i['NetworkInterfaces']:
-                    #pp(ni['Ipv6Addresses'])
-                    for i6 in ni['Ipv6Addresses']:
-                        known_instances[k_idx]['ipv6'] += [i6['Ipv6Address']]
-                known_instances[k_idx]['dnsname'] = i['PublicDnsName']
-                if 'PublicIpAddress' in i:
-                    known_instances[k_idx]['ip'] = i['PublicIpAddress']
+    # listing can use fresh cached data, other actions need the current state
+    use_cache = listing and not args.refresh
+    started = time.perf_counter()
+    fetch_from, failed = targets(profiles, args.all_regions, Opts.max_workers)
+    results = {}
+    for res in gather(lambda p,r: load_instances(filters, use_cache, r, p),
+                        fetch_from, Opts.max_workers):
+        results[(res.profile, res.region)] = res
+    # each profile's time, or why it failed, every region is too many to show
+    for res in failed + [results[t] for t in fetch_from]:
+        if not res.ok or (len(profiles) > 1 and not args.all_regions):
+            print(res.summary(), file=sys.stderr)
+    if args.all_regions:
+        print(f'{len(fetch_from)} regions in {time.perf_counter()-started:.2f}s', file=sys.stderr)
+    instances = [i for t in fetch_from for i in results[t].items]
+
+    for i in instances:
+        # if i.state > 255: # clear top byte
+        known_instances[len(known_instances) + 1] = i
+        if i.state == States.RUNNING:
+            run_count += 1
 
     if len(known_instances) < 1:
-        print('No known ec2 instances.')
+        print('No matching ec2 instances.' if selected else 'No known ec2 instances.')
         return
 
-    if args.list or not any(vars(args).values()):
+    if listing:
         list_instances(known_instances)
         return
 
     # do I want to renumber this list?
-    running_instances = {i: known_instances[i] for i in known_instances if known_instances[i]['state'] == States.RUNNING}
+    running_instances = {i: known_instances[i] for i in known_instances if known_instances[i].state == States.RUNNING}
 
     if args.run:
         # only list stopped instances that we can start now
         # do I want to renumber this list?
-        stopd_instances = {i: known_instances[i] for i in known_instances if known_instances[i]['state'] == States.STOPPED}
+        stopd_instances = {i: known_instances[i] for i in known_instances if known_instances[i].state == States.STOPPED}
+        if len(stopd_instances) < 1:
+            print('No matching stopped instances.' if selected else 'No stopped instances.')
+            exit(2)
         list_instances(stopd_instances)
-        try:
-            choice = int(input('Start: '))
-        except:
-            choice = 0
-        if choice > 0 and choice in stopd_instances:
-            if stopd_instances[choice]['state'] == States.RUNNING:
-                print(f'''{stopd_instances[choice]['name']} already running.''')
-                exit(2)
-            if stopd_instances[choice]['state'] == States.STOPPED:
-                print(f'''Starting {stopd_instances[choice]['name']}''')
-            else:
-                print(f'''Unable to start {stopd_instances[choice]['name']} while {stopd_instances[choice]['st_name']}''')
-                exit(2)
-            try:
-                ec2.start_instances(InstanceIds=[stopd_instances[choice]['id']])
-            except Exception as e:
-                print(e)
+        if not selected:
+            chosen = choose_instances('Start (eg 1,3,5-20): ', stopd_instances)
+            stopd_instances = {i: stopd_instances[i] for i in chosen}
+            if len(stopd_instances) < 1:
+                return
+        print('Starting:')
+        if not apply_state('start', stopd_instances):
+            exit(2)
+        return
+
+    if args.stop:
+        if run_count < 1:
+            print('No running instances.')
+            exit(3)
+        list_instances(running_instances)
+        if not selected:
+            chosen = choose_instances('Stop (eg 1,3,5-20): ', running_instances)
+            running_instances = {i: running_instances[i] for i in chosen}
+            if len(running_instances) < 1:
+                return
+        print('Stopping:')
+        if not apply_state('stop', running_instances):
+            exit(3)
         return
 
     if args.force:
@@ -162,50 +353,55 @@ def main():
             print('No running instances.')
             exit(3)
         list_instances(running_instances)
-        try:
-            choice = int(input('Reboot: '))
-        except:
-            choice = 0
-        if choice > 0 and choice in running_instances:
-            ec2.reboot_instances(InstanceIds=[known_instances[choice]['id']])
+        if not selected:
+            chosen = choose_instances('Reboot (eg 1,3,5-20): ', running_instances)
+            running_instances = {i: running_instances[i] for i in chosen}
+            if len(running_instances) < 1:
+                return
+        print('Rebooting:')
+        if not apply_state('reboot', running_instances):
+            exit(3)
         return
 
     if args.change:
         for idx in sorted(known_instances):
             c_state = ''
-            if known_instances[idx]['state'] != States.STOPPED:
-                c_state = f''' - {known_instances[idx]['st_name']}'''
-            print(f'''{idx: 4d}: {known_instances[idx]['name'].ljust(NAMELEN, ' ')} - {known_instances[idx]['type']} {c_state}''')
+            if known_instances[idx].state != States.STOPPED:
+                c_state = f''' - {known_instances[idx].state_name}'''
+            print(f'''{idx: 4d}: {known_instances[idx].name.ljust(NAMELEN, ' ')} - {known_instances[idx].type} {c_state}''')
         try:
             choice = int(input('Change: '))
         except:
             print()
             exit(4)
 
-        if known_instances[choice]['arch'] in ['i386', 'x86_64']:
-            if known_instances[choice]['type'].startswith('g5'):
-                avail_instances = TYPE_CHOICES['gpu']
-            else:
-                avail_instances = TYPE_CHOICES['x86']
-        elif known_instances[choice]['arch'] in ['arm64',]:
-            avail_instances = TYPE_CHOICES['arm']
-        elif known_instances[choice]['arch'] in ['x86_64_mac','arm64_mac']:
-            avail_instances = TYPE_CHOICES['mac']
-        for i in range(len(avail_instances)):
-            print(f'''{i: 4d}: {avail_instances[i]}''')
-
+        if choice not in known_instances:
+            exit(4)
+        inst = known_instances[choice]
         try:
-            n_type = int(input(f'''Change {known_instances[choice]['name']} to: '''))
-        except:
-            print()
+            avail_types = type_choices(inst.type, inst.arch, inst.az, inst.region or None, inst.profile)
+        except Exception as e:
+            print(f'Unable to get instance types: {e}')
+            exit(4)
+        if len(avail_types) < 1:
+            print(f'''No other types available for {inst.name}''')
+            exit(4)
+        for i in range(len(avail_types)):
+            print(f'''{i: 4d}: {avail_types[i][1]}''')
+
+        n_type = input(f'''Change {inst.name} from {inst.type} to (number or type): ''').strip()
+        names = [t[0] for t in avail_types]
+        if n_type in names:
+            new_type = n_type
+        elif n_type.isdigit() and int(n_type) < len(avail_types):
+            new_type = names[int(n_type)]
+        else:
+            print(f'{n_type} is not available.')
             exit(4)
 
         try:
-            print(f'''Changing {known_instances[choice]['name']} to {avail_instances[n_type].split(' ')[0]}''')
-            ec2.modify_instance_attribute(
-                            InstanceId=known_instances[choice]['id'],
-                            InstanceType={'Value': avail_instances[n_type].split(' ')[0]},
-                            )
+            print(f'''Changing {inst.name} to {new_type}''')
+            change_type(inst.id, new_type, inst.region or None, inst.profile)
         except Exception as e:
             print(e)
             exit(4)
@@ -225,37 +421,37 @@ def main():
             except:
                 choice = 0
         if choice > 0 and choice in running_instances:
-            if running_instances[choice]['state'] == States.RUNNING:
-                print(f'''Connecting to {running_instances[choice]['name']}...''')
+            if running_instances[choice].state == States.RUNNING:
+                print(f'''Connecting to {running_instances[choice].name}...''')
             else:
-                print(f'''{running_instances[choice]['name']} not running.''')
+                print(f'''{running_instances[choice].name} not running.''')
                 exit(5)
             try:
                 if args.key:
                     keyfile = args.key
                 else:
-                    if running_instances[choice]['id'] in Opts.known_keys:
-                        username = Opts.known_keys[running_instances[choice]['id']][0]
-                        keyfile = Opts.known_keys[running_instances[choice]['id']][1]
+                    if running_instances[choice].id in Opts.known_keys:
+                        username = Opts.known_keys[running_instances[choice].id][0]
+                        keyfile = Opts.known_keys[running_instances[choice].id][1]
                     else:
                         username = 'ec2-user'
                         keyfile = '~/.ssh/aws_bb_sydney'
                 cmd = ''
                 if Opts.run_tmux:
                     cmd = 'tmux'
-                if len(running_instances[choice]['ipv6']):
+                if len(running_instances[choice].ipv6):
                     sh_args = ['ssh', '-6', '-t',
                                 '-i', keyfile,
                                 '-o ', 'IdentitiesOnly=yes',
-                                f'{username}@'+running_instances[choice]['ipv6'][0],
+                                f'{username}@'+running_instances[choice].ipv6[0],
                                 cmd]
                     if args.debug:
                         sh_args.insert(1, '-vvv')
-                elif 'dnsname' in running_instances[choice]:
+                elif running_instances[choice].public_dns:
                     sh_args = ['ssh', '-t',
                                 '-i', keyfile,
                                 '-o ', 'IdentitiesOnly=yes',
-                                f'{username}@'+running_instances[choice]['dnsname'],
+                                f'{username}@'+running_instances[choice].public_dns,
                                 cmd]
                 #pp(sargs)
                 sp.call(' '.join(sh_args), shell=True)
@@ -0,0 +1,181 @@
+#
+#  core/cache.py
+#
+#  Copyright (c)2023 Shane Ambler <Develop@ShaneWare.biz>
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are
+#  met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following disclaimer
+#    in the documentation and/or other materials provided with the
+#    distribution.
+#  * Neither the name of the  nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+#  A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+#  OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+#  SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+#  LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+#  DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+#  THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+#  (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+#  OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+import json
+import os
+import sqlite3
+import threading as thr
+import time
+import zlib
+
+# seconds before cached data of each type should be fetched again
+DEFAULT_TTL = {
+    'instances': 300,
+    'security_groups': 900,
+    'security_group_names': 900,
+    'network_interfaces': 300,
+    'vpcs': 3600,
+    'snapshots': 900,
+    'buckets': 3600,
+    'bucket_details': 6 * 3600, # storage metrics are daily
+    'instance_types': 7 * 24 * 3600, # a week
+    'regions': 24 * 3600,
+    }
+
+# change this when the cached data changes shape, older caches are dropped
+VERSION = 2
+
+cache_path = None # caching is off until configure() is called
+ttl = dict(DEFAULT_TTL)
+
+_lock = thr.Lock()
+_db = None
+
+
+def configure(path, ttls=None):
+    '''
+    Set the cache file and the ttl for each resource type.
+    '''
+    global cache_path, _db
+    with _lock:
+        if _db is not None and path != cache_path:
+            _db.close()
+            _db = None
+        cache_path = path
+        if ttls:
+            ttl.update(ttls)
+
+
+def current_account(account=None, region=None):
+    '''
+    The profile and region the cache is keyed by. Those not given are the
+    ones the boto3 session for the profile uses, including a region only
+    set in ~/.aws/config, so items saved with no region and expired with
+    the region a client reported share one key.
+
+    returns: (profile, region)
+    '''
+    from .clients import session
+    try:
+        s = session(account)
+        return account or s.profile_name or 'default', region or s.region_name or ''
+    except Exception:
+        # an unknown profile, the environment is all there is to go on
+        return (account or os.environ.get('AWS_PROFILE', 'default'),
+                region or os.environ.get('AWS_REGION', os.environ.get('AWS_DEFAULT_REGION', '')))
+
+
+def _connect():
+    global _db
+    if _db is None:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        _db = sqlite3.connect(cache_path, check_same_thread=False)
+        if _db.execute('PRAGMA user_version').fetchone()[0] != VERSION:
+            _db.execute('DROP TABLE IF EXISTS inventory')
+            _db.execute(f'PRAGMA user_version = {VERSION}')
+        _db.execute('''CREATE TABLE IF NOT EXISTS inventory (
+                        account TEXT, region TEXT, rtype TEXT,
+                        fetched REAL, data BLOB,
+                        PRIMARY KEY (account, region, rtype))''')
+    return _db
+
+
+def load(rtype, account=None, region=None):
+    '''
+    Get the cached items for a resource type.
+
+    returns: (items, age in seconds) or (None, None) when not cached
+    '''
+    if cache_path is None:
+        return None, None
+    account, region = current_account(account, region)
+    try:
+        with _lock:
+            row = _connect().execute('''SELECT fetched, data FROM inventory
+                        WHERE account=? AND region=? AND rtype=?''',
+                        (account, region, rtype)).fetchone()
+    except sqlite3.Error:
+        return None, None
+    if row is None:
+        return None, None
+    return json.loads(zlib.decompress(row[1])), time.time() - row[0]
+
+
+def fresh(rtype, account=None, region=None):
+    '''
+    Get the cached items if they are younger than the ttl of the type.
+
+    returns: items or None
+    '''
+    items, age = load(rtype, account, region)
+    if items is None or age > ttl.get(rtype, 0):
+        return None
+    return items
+
+
+def save(rtype, items, account=None, region=None):
+    '''
+    Store the items for a resource type. Values json can't store,
+    like datetimes, are stored as strings.
+    '''
+    if cache_path is None:
+        return
+    account, region = current_account(account, region)
+    data = zlib.compress(json.dumps(items, default=str).encode('utf-8'))
+    try:
+        with _lock:
+            db = _connect()
+            db.execute('''INSERT OR REPLACE INTO inventory VALUES (?,?,?,?,?)''',
+                        (account, region, rtype, time.time(), data))
+            db.commit()
+    except sqlite3.Error as e:
+        print(f'Unable to save {rtype} cache: {e}')
+
+
+def expire(rtype, account=None, region=None):
+    '''
+    Mark the cached items as outdated after a change, they can still be
+    shown until fetched again.
+    '''
+    if cache_path is None:
+        return
+    account, region = current_account(account, region)
+    try:
+        with _lock:
+            db = _connect()
+            db.execute('''UPDATE inventory SET fetched=0
+                        WHERE account=? AND region=? AND rtype=?''',
+                        (account, region, rtype))
+            db.commit()
+    except sqlite3.Error as e:
+        print(f'Unable to expire {rtype} cache: {e}')
@@ -0,0 +1,247 @@
+#
+#  core/catalog.py
+#
+#  Copyright (c)2023 Shane Ambler <Develop@ShaneWare.biz>
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are
+#  met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following disclaimer
+#    in the documentation and/or other materials provided with the
+#    distribution.
+#  * Neither the name of the  nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+#  A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+#  OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+#  SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+#  LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+#  DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+#  THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+#  (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+#  OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+
+from bisect import bisect_left, bisect_right
+import time
+
+from . import cache
+from .clients import client, paginate
+
+
+# catalog columns - (name, type), every value is a plain int, float or str
+# so the columns can be compared without parsing
+COLUMNS = [
+    ('type', str),
+    ('arch', str),
+    ('manufacturer', str),
+    ('vcpus', int),
+    ('cores', int),
+    ('threads', int),
+    ('ram_gib', float),
+    ('inst_storage', str),
+    ('storage_gb', int),
+    ('gpu_name', str),
+    ('gpu_manufacturer', str),
+    ('gpu_count', int),
+    ('gpu_ram_gib', float),
+    ]
+COLUMN_NAMES = [c[0] for c in COLUMNS]
+
+# (expires, catalog) for each (profile, region) loaded
+_loaded = {}
+# the most types describe_instance_types gives in one page
+TYPES_PAGE_SIZE = 100
+
+
+def type_values(inst):
+    '''
+    The catalog values of one describe_instance_types result.
+    '''
+    gpus = inst.get('GpuInfo', {}).get('Gpus', [])
+    vcpu = inst['VCpuInfo']
+    return [inst['InstanceType'],
+            ','.join(inst['ProcessorInfo']['SupportedArchitectures']),
+            inst['ProcessorInfo'].get('Manufacturer', ''),
+            vcpu['DefaultVCpus'],
+            vcpu.get('DefaultCores', vcpu['DefaultVCpus']),
+            vcpu.get('DefaultThreadsPerCore', 1),
+            round(inst['MemoryInfo']['SizeInMiB'] / 1024, 3),
+            'yes' if inst.get('InstanceStorageSupported') else 'no',
+            inst.get('InstanceStorageInfo', {}).get('TotalSizeInGB', 0),
+            ','.join(g['Name'] for g in gpus),
+            ','.join(g['Manufacturer'] for g in gpus),
+            sum(g['Count'] for g in gpus),
+            round(sum(g['Count'] * g['MemoryInfo']['SizeInMiB'] for g in gpus) / 1024, 3),
+            ]
+
+
+class Catalog:
+    '''
+    Every instance type of a region stored as one list per column, this
+    is also how it is cached so loading needs no reformatting.
+    '''
+    def __init__(self, columns=None):
+        self.columns = columns or {c: [] for c in COLUMN_NAMES}
+        self.indexed = False
+
+    def build_index(self):
+        '''
+        Index the catalog by type, arch, GPU, vCPU and memory so queries
+        don't scan every type.
+        '''
+        cols = self.columns
+        self.by_type = {t: n for n,t in enumerate(cols['type'])}
+        self.by_arch = {}
+        for n,archs in enumerate(cols['arch']):
+            for a in archs.split(','):
+                self.by_arch.setdefault(a, set()).add(n)
+        self.with_gpu = {n for n,c in enumerate(cols['gpu_count']) if c > 0}
+        # (sorted values, row indexes in the same order) for range lookups
+        self.sorted = {}
+        for c in ['vcpus', 'ram_gib']:
+            order = sorted(range(len(self)), key=cols[c].__getitem__)
+            self.sorted[c] = ([cols[c][n] for n in order], order)
+        self.indexed = True
+
+    def in_range(self, col, lo=None, hi=None):
+        '''
+        returns: set of row indexes with lo <= value <= hi
+        '''
+        if not self.indexed: self.build_index()
+        vals, order = self.sorted[col]
+        first = 0 if lo is None else bisect_left(vals, lo)
+        last = len(vals) if hi is None else bisect_right(vals, hi)
+        return set(order[first:last])
+
+    def query(self, arch=None, gpu=None, types=None, **ranges):
+        '''
+        Find types matching all the given conditions.
+
+        arch   -- cpu architecture eg 'arm64'
+        gpu    -- True for types with a GPU, False for those without
+        types  -- only include these type names, eg from type_offerings()
+        ranges -- column=(lo, hi) for vcpus and ram_gib, None is unbounded
+
+        returns: set of row indexes
+        '''
+        if not self.indexed: self.build_index()
+        rows = set(range(len(self)))
+        if arch is not None:
+            rows &= self.by_arch.get(arch, set())
+        if gpu is not None:
+            rows = rows & self.with_gpu if gpu else rows - self.with_gpu
+        if types is not None:
+            rows &= {self.by_type[t] for t in types if t in self.by_type}
+        for c,(lo,hi) in ranges.items():
+            rows &= self.in_range(c, lo, hi)
+        return rows
+
+    def value(self, inst_type, col):
+        if not self.indexed: self.build_index()
+        return self.columns[col][self.by_type[inst_type]]
+
+    def __len__(self):
+        return len(self.columns['type'])
+
+    def append(self, values):
+        for c,v in zip(COLUMN_NAMES, values):
+            self.columns[c].append(v)
+
+    def row(self, idx):
+        return [self.columns[c][idx] for c in COLUMN_NAMES]
+
+    def rows(self, idxs=None):
+        if idxs is None:
+            idxs = range(len(self))
+        return [self.row(i) for i in idxs]
+
+
+def fetch_catalog(region=None, profile=None):
+    '''
+    Get every instance type, all pages of them.
+    '''
+    cat = Catalog()
+    for page in paginate(client('ec2', region, profile), 'describe_instance_types',
+                            'InstanceTypes', TYPES_PAGE_SIZE):
+        for inst in page:
+            cat.append(type_values(inst))
+    return cat
+
+
+def load_catalog(force=False, region=None, profile=None):
+    '''
+    Get the instance type catalog, the cached copy is used until it is
+    older than the instance_types ttl, which is days not minutes. The
+    catalog is also kept in memory so its index is only built once.
+    '''
+    key = (profile, region)
+    if not force:
+        if key in _loaded and _loaded[key][0] > time.time():
+            return _loaded[key][1]
+        cached, age = cache.load('instance_types', profile, region)
+        if (cached is not None and list(cached) == COLUMN_NAMES
+                and age <= cache.ttl.get('instance_types', 0)):
+            cat = Catalog(cached)
+            _loaded[key] = (time.time() + cache.ttl['instance_types'] - age, cat)
+            return cat
+    cat = fetch_catalog(region, profile)
+    cache.save('instance_types', cat.columns, profile, region)
+    _loaded[key] = (time.time() + cache.ttl.get('instance_types', 0), cat)
+    return cat
+
+
+def type_offerings(az, region=None, profile=None):
+    '''
+    The names of the instance types that can run in an availability zone,
+    cached along with the catalog.
+
+    returns: set of type names
+    '''
+    key = f'instance_types:{az}'
+    cached, age = cache.load(key, profile, region)
+    if cached is not None and age <= cache.ttl.get('instance_types', 0):
+        return set(cached)
+    offered = []
+    for page in paginate(client('ec2', region, profile), 'describe_instance_type_offerings',
+                            'InstanceTypeOfferings', LocationType='availability-zone',
+                            Filters=[{'Name': 'location', 'Values': [az]}]):
+        offered.extend(o['InstanceType'] for o in page)
+    cache.save(key, offered, profile, region)
+    return set(offered)
+
+
+def type_label(cat, idx):
+    row = dict(zip(COLUMN_NAMES, cat.row(idx)))
+    label = f'''{row['type']} - {row['vcpus']}cpu {row['ram_gib']:g}G'''
+    if row['gpu_count']:
+        label += f''' +{row['gpu_count']} GPU'''
+    return label
+
+
+def type_choices(inst_type, arch, az, region=None, profile=None):
+    '''
+    The types an instance can be changed to, those with the same
+    architecture, with a GPU when the current type has one, that are
+    offered in the instance's availability zone.
+
+    returns: list of (type name, label) sorted by vcpus then memory
+    '''
+    cat = load_catalog(region=region, profile=profile)
+    if not cat.indexed: cat.build_index()
+    offered = type_offerings(az, region, profile) if az else None
+    gpu = cat.value(inst_type, 'gpu_count') > 0 if inst_type in cat.by_type else None
+    rows = cat.query(arch=arch, gpu=gpu, types=offered)
+    cols = cat.columns
+    rows = sorted(rows, key=lambda n: (cols['vcpus'][n], cols['ram_gib'][n], cols['type'][n]))
+    return [(cols['type'][n], type_label(cat, n)) for n in rows]
@@ -0,0 +1,146 @@
+#
+#  core/clients.py
+#
+#  Copyright (c)2023 Shane Ambler <Develop@ShaneWare.biz>
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are
+#  met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following disclaimer
+#    in the documentation and/or other materials provided with the
+#    distribution.
+#  * Neither the name of the  nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+#  A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+#  OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+#  SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+#  LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+#  DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+#  THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+#  (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+#  OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+import threading as thr
+
+# boto3 is imported when the first client is made so that importing
+# this module stays cheap
+
+max_pool_connections = 10
+page_size = 200 # MaxResults asked for with each page
+# request members holding the page size, the paginators' limit keys
+LIMIT_KEYS = ('MaxResults', 'MaxKeys', 'MaxItems', 'MaxRecords', 'Limit')
+
+_lock = thr.RLock()
+_sessions = {}
+_clients = {}
+
+
+def configure(pool_connections=None, results_per_page=None):
+    '''
+    Set the connection pool size used for new clients and the page size
+    used by paginate(). Existing clients are dropped so they get recreated
+    with the new settings.
+    '''
+    global max_pool_connections, page_size
+    with _lock:
+        if pool_connections:
+            max_pool_connections = int(pool_connections)
+        if results_per_page:
+            page_size = int(results_per_page)
+        _clients.clear()
+
+
+def session(profile=None):
+    '''
+    Get the shared boto3 session for a profile, None being the default.
+    '''
+    with _lock:
+        if profile not in _sessions:
+            import boto3
+            _sessions[profile] = boto3.session.Session(profile_name=profile)
+        return _sessions[profile]
+
+
+def client(service, region=None, profile=None):
+    '''
+    Get a cached client for the service, clients are thread safe so one
+    client and its keep-alive connections are shared by all threads.
+
+    service -- boto3 service name eg 'ec2'
+    region  -- region name, None for the session default
+    profile -- aws profile name, None for the default
+    '''
+    key = (profile, region, service)
+    c = _clients.get(key)
+    if c is not None:
+        return c
+    with _lock:
+        # sessions are not thread safe, so clients are only made in the lock
+        if key not in _clients:
+            from botocore.config import Config
+            _clients[key] = session(profile).client(service, region_name=region,
+                        config=Config(max_pool_connections=max_pool_connections))
+        return _clients[key]
+
+
+def own_client(service, region=None, profile=None, pool_connections=None):
+    '''
+    Make a client that isn't shared, for work needing a bigger connection
+    pool than the shared clients have, without changing theirs.
+
+    pool_connections -- connection pool size, None for max_pool_connections
+    '''
+    with _lock:
+        from botocore.config import Config
+        return session(profile).client(service, region_name=region,
+                    config=Config(max_pool_connections=pool_connections or max_pool_connections))
+
+
+def fit_page_size(c, operation, size):
+    '''
+    Keep a page size in the range the service model gives the operation,
+    eg describe_instance_types takes 5 to 100. botocore doesn't check the
+    maximum but aws rejects a call going over it.
+
+    returns: page size, or None when the operation takes none
+    '''
+    shape = c.meta.service_model.operation_model(
+                        c.meta.method_to_api_mapping[operation]).input_shape
+    for name in LIMIT_KEYS:
+        if shape is not None and name in shape.members:
+            meta = shape.members[name].metadata
+            return max(meta.get('min', size), min(meta.get('max', size), size))
+    return None
+
+
+def paginate(c, operation, result_key, per_page=None, **kwargs):
+    '''
+    Yield the list of results from each page as it arrives, using the
+    boto3 paginator for the operation so every page is fetched.
+
+    c          -- client to use
+    operation  -- client method name eg 'describe_instances'
+    result_key -- key of the result list in each response
+    per_page   -- results asked for with each page, None for page_size,
+                  either is kept within what the operation takes
+    kwargs     -- arguments for the operation
+    '''
+    if c.can_paginate(operation):
+        size = fit_page_size(c, operation, per_page or page_size)
+        pages = c.get_paginator(operation).paginate(
+                        PaginationConfig={'PageSize': size} if size else {}, **kwargs)
+        for page in pages:
+            yield page.get(result_key, [])
+    else:
+        yield getattr(c, operation)(**kwargs).get(result_key, [])
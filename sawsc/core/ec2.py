@@ -0,0 +1,292 @@
+#
+#  core/ec2.py
+#
+#  Copyright (c)2023 Shane Ambler <Develop@ShaneWare.biz>
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are
+#  met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following disclaimer
+#    in the documentation and/or other materials provided with the
+#    distribution.
+#  * Neither the name of the  nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+#  A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+#  OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+#  SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+#  LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+#  DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+#  THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+#  (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+#  OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+import re
+import time
+
+from . import cache
+from .clients import client, paginate
+from .models import Instance
+
+
+class States:
+    # https://docs.aws.amazon.com/AWSEC2/latest/APIReference/API_InstanceState.html
+    PENDING = 0
+    RUNNING = 16
+    SHUTTING_DOWN = 32
+    TERMINATED = 48
+    STOPPING = 64
+    STOPPED = 80
+
+# states that change without being asked
+TRANSITIONAL = (States.PENDING, States.STOPPING, States.SHUTTING_DOWN)
+
+
+def instance_filters(states=None, tags=None, vpc=None, name=None):
+    '''
+    Build describe_instances Filters so aws only sends matching instances.
+
+    states -- list of state names eg ['running', 'stopped']
+    tags   -- list of 'Key=Value' strings, 'Key' alone matches any value
+    vpc    -- vpc id
+    name   -- Name tag, may use * and ? wildcards
+
+    returns: list of filters
+    '''
+    filters = []
+    if states:
+        filters.append({'Name': 'instance-state-name', 'Values': list(states)})
+    for t in tags or []:
+        k,_,v = t.partition('=')
+        if v:
+            filters.append({'Name': f'tag:{k}', 'Values': [v]})
+        else:
+            filters.append({'Name': 'tag-key', 'Values': [k]})
+    if vpc:
+        filters.append({'Name': 'vpc-id', 'Values': [vpc]})
+    if name:
+        filters.append({'Name': 'tag:Name', 'Values': [name]})
+    return filters
+
+
+def fetch_instances(filters=None, region=None, profile=None):
+    '''
+    Yield an Instance for each instance, a page at a time as they arrive.
+
+    filters -- describe_instances Filters, see instance_filters()
+    '''
+    kwargs = {'Filters': filters} if filters else {}
+    ec2 = client('ec2', region, profile)
+    for page in paginate(ec2, 'describe_instances', 'Reservations', **kwargs):
+        for r in page:
+            for i in r['Instances']:
+                yield Instance.from_api(i, profile or '', ec2.meta.region_name)
+
+
+def enabled_regions(profile=None):
+    '''
+    Names of the regions enabled for the profile's account, cached as
+    they rarely change.
+    '''
+    regions = cache.fresh('regions', profile)
+    if regions is None:
+        regions = sorted(r['RegionName'] for r in
+                        client('ec2', profile=profile).describe_regions()['Regions'])
+        cache.save('regions', regions, profile)
+    return regions
+
+
+def load_instances(filters=None, use_cache=True, region=None, profile=None):
+    '''
+    Get the instances of a profile. Fresh cached instances are used when
+    use_cache is True and there are no filters, an unfiltered fetch is
+    cached.
+
+    returns: list of Instance
+    '''
+    if use_cache and not filters:
+        cached = cache.fresh('instances', profile, region)
+        if cached is not None:
+            return [Instance.from_dict(i) for i in cached]
+    instances = list(fetch_instances(filters, region, profile))
+    if not filters:
+        cache.save('instances', [i.to_dict() for i in instances], profile, region)
+    return instances
+
+
+# most ids to send in one start/stop/reboot call
+BATCH_SIZE = 50
+# most ids to send in one describe call, aws won't page a call listing ids
+DESCRIBE_SIZE = 200
+# describe errors in a row before follow_transitions() gives up
+FOLLOW_ERRORS = 3
+
+STATE_ACTIONS = {
+    'start': ('start_instances', 'StartingInstances'),
+    'stop': ('stop_instances', 'StoppingInstances'),
+    'reboot': ('reboot_instances', None),
+    }
+
+
+def _state_call(ec2, action, inst_ids, force=False):
+    method, result_key = STATE_ACTIONS[action]
+    kwargs = {'InstanceIds': inst_ids}
+    if force and action == 'stop':
+        kwargs['Force'] = True
+    resp = getattr(ec2, method)(**kwargs)
+    if result_key is None:
+        # reboot_instances doesn't list the instances
+        return {i: (True, 'rebooting') for i in inst_ids}
+    return {r['InstanceId']: (True, r['CurrentState']['Name']) for r in resp[result_key]}
+
+
+def change_states(action, inst_ids, force=False, region=None, profile=None):
+    '''
+    Start, stop or reboot instances using as few calls as possible.
+
+    The ids are sent in chunks of BATCH_SIZE, aws rejects the whole call
+    when one instance can't change so a failed chunk is tried again one
+    instance at a time to find which failed.
+
+    action   -- 'start', 'stop' or 'reboot'
+    inst_ids -- list of instance ids
+    force    -- force a stop
+
+    returns: dict of instance id: (ok, new state name or error text)
+    '''
+    ec2 = client('ec2', region, profile)
+    results = {}
+    inst_ids = list(dict.fromkeys(inst_ids))
+    for n in range(0, len(inst_ids), BATCH_SIZE):
+        chunk = inst_ids[n:n+BATCH_SIZE]
+        try:
+            results.update(_state_call(ec2, action, chunk, force))
+        except Exception:
+            for i in chunk:
+                try:
+                    results.update(_state_call(ec2, action, [i], force))
+                except Exception as e:
+                    results[i] = (False, str(e))
+    if any(r[0] for r in results.values()):
+        cache.expire('instances', profile, region)
+    return results
+
+
+def change_instances(action, instances, force=False, region=None):
+    '''
+    change_states() for Instance records that may be from several
+    profiles and regions, the instances are changed with the client of
+    their profile and region.
+
+    returns: dict of instance id: (ok, new state name or error text)
+    '''
+    by_target = {}
+    for i in instances:
+        by_target.setdefault((i.profile, i.region or region), []).append(i.id)
+    results = {}
+    for (profile,region),inst_ids in by_target.items():
+        results.update(change_states(action, inst_ids, force, region, profile))
+    return results
+
+
+def change_type(inst_id, inst_type, region=None, profile=None):
+    '''
+    Change the type of a stopped instance, the cached instances are
+    expired so they aren't listed with the old type.
+    '''
+    client('ec2', region, profile).modify_instance_attribute(InstanceId=inst_id,
+                    InstanceType={'Value': inst_type})
+    cache.expire('instances', profile, region)
+
+
+def parse_choices(txt):
+    '''
+    Read the list numbers typed at a prompt, eg '1,3,5-20'
+
+    returns: sorted list of ints
+    raises: ValueError when txt isn't a list of numbers and ranges
+    '''
+    choices = set()
+    for part in txt.replace(' ', '').split(','):
+        if part == '': continue
+        first,_,last = part.partition('-')
+        if last:
+            first, last = int(first), int(last)
+            if first > last: first, last = last, first
+            choices.update(range(first, last+1))
+        else:
+            choices.add(int(first))
+    return sorted(choices)
+
+
+def describe_ids(inst_ids, region=None, profile=None):
+    '''
+    Yield an Instance with the current details of each given instance.
+    '''
+    ec2 = client('ec2', region, profile)
+    for n in range(0, len(inst_ids), DESCRIBE_SIZE):
+        resp = ec2.describe_instances(InstanceIds=inst_ids[n:n+DESCRIBE_SIZE])
+        for r in resp['Reservations']:
+            for i in r['Instances']:
+                yield Instance.from_api(i, profile or '', ec2.meta.region_name)
+
+
+def _missing_ids(err):
+    '''
+    returns: set of the instance ids a not found error names
+    '''
+    code = getattr(err, 'response', {}).get('Error', {}).get('Code', '')
+    if not code.startswith('InvalidInstanceID'):
+        return set()
+    return set(re.findall(r'\bi-[0-9a-f]+\b', str(err)))
+
+
+def follow_transitions(inst_ids, on_update, delay=2, max_delay=30, timeout=900,
+                        region=None, profile=None):
+    '''
+    Poll changed instances until none are pending, stopping or shutting
+    down. Each poll only asks for the instances still changing and the
+    wait between polls doubles up to max_delay. This blocks so run it in
+    a worker thread.
+
+    inst_ids  -- ids of the changed instances, each is fetched at least once
+    on_update -- called from this thread with each instance as it is fetched
+    timeout   -- seconds before giving up on instances that don't settle
+
+    Instances aws says don't exist are no longer followed, other errors
+    are tried again at the next poll until FOLLOW_ERRORS happen in a row.
+    '''
+    waiting = list(dict.fromkeys(inst_ids))
+    give_up = time.monotonic() + timeout
+    errors = 0
+    while len(waiting) and time.monotonic() < give_up:
+        time.sleep(delay)
+        delay = min(delay*2, max_delay)
+        changing = []
+        try:
+            for i in describe_ids(waiting, region, profile):
+                on_update(i)
+                if i.state in TRANSITIONAL:
+                    changing.append(i.id)
+        except Exception as e:
+            missing = _missing_ids(e)
+            if missing.intersection(waiting):
+                waiting = [i for i in waiting if i not in missing]
+                continue
+            errors += 1
+            if errors >= FOLLOW_ERRORS:
+                print(f'Unable to follow instance changes: {e}')
+                return
+            continue
+        errors = 0
+        waiting = changing
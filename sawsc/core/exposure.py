@@ -0,0 +1,317 @@
+#
+#  core/exposure.py
+#
+#  Copyright (c)2023 Shane Ambler <Develop@ShaneWare.biz>
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are
+#  met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following disclaimer
+#    in the documentation and/or other materials provided with the
+#    distribution.
+#  * Neither the name of the  nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+#  A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+#  OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+#  SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+#  LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+#  DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+#  THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+#  (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+#  OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+
+from bisect import bisect_right
+import ipaddress
+
+from botocore.exceptions import ClientError
+
+from . import cache
+from .clients import client, paginate
+from .models import NetworkInterface, SecurityGroup
+
+ALL_PORTS = (0, 65535)
+# ip protocol numbers aws may use in place of the names
+PROTOCOLS = {'6': 'tcp', '17': 'udp', '1': 'icmp', '58': 'icmpv6'}
+WORLD = ('0.0.0.0/0', '::/0')
+# group ids asked for in one describe_security_groups call
+NAMES_SIZE = 200
+
+
+def protocol_name(proto):
+    proto = str(proto).lower()
+    return PROTOCOLS.get(proto, proto)
+
+
+class Permission:
+    '''
+    One source or destination of a rule, ie a rule with several cidrs
+    becomes several permissions.
+    '''
+    __slots__ = ('group', 'direction', 'protocol', 'low', 'high', 'network',
+                 'peer_group', 'description')
+
+    def __init__(self, group, direction, protocol, low, high, network=None,
+                 peer_group='', description=''):
+        self.group = group
+        self.direction = direction
+        self.protocol = protocol
+        self.low = low
+        self.high = high
+        self.network = network
+        self.peer_group = peer_group
+        self.description = description
+
+    @property
+    def ports(self):
+        if (self.low, self.high) == ALL_PORTS:
+            return 'all'
+        return str(self.low) if self.low == self.high else f'{self.low}-{self.high}'
+
+    @property
+    def peer(self):
+        return str(self.network) if self.network is not None else self.peer_group
+
+
+def rule_permissions(group_id, direction, rule):
+    '''
+    Split a Rule record into Permissions.
+    '''
+    proto = protocol_name(rule.protocol)
+    if proto == '-1' or rule.from_port in ('', None, -1):
+        low, high = ALL_PORTS
+    elif proto in ('icmp', 'icmpv6'):
+        # icmp rules hold the type and code, not ports
+        low, high = ALL_PORTS
+    else:
+        low, high = int(rule.from_port), int(rule.to_port)
+    for cidr,desc in rule.ipv4 + rule.ipv6:
+        yield Permission(group_id, direction, proto, low, high,
+                         ipaddress.ip_network(cidr, strict=False), description=desc)
+    for peer in rule.groups:
+        yield Permission(group_id, direction, proto, low, high, peer_group=peer)
+
+
+class PortTree:
+    '''
+    Interval tree of Permissions by their port range. Each node keeps the
+    permissions that include its center port, sorted by first and by last
+    port, the others go to the subtree on their side of the center. A
+    lookup follows one path down the tree and only takes permissions that
+    allow the port, so it costs O(log n + the number found).
+    '''
+    __slots__ = ('center', 'lows', 'by_low', 'highs', 'by_high', 'left', 'right')
+
+    def __init__(self, perms):
+        ends = sorted(p for perm in perms for p in (perm.low, perm.high))
+        self.center = ends[len(ends)//2]
+        here, left, right = [], [], []
+        for perm in perms:
+            if perm.high < self.center:
+                left.append(perm)
+            elif perm.low > self.center:
+                right.append(perm)
+            else:
+                here.append(perm)
+        self.by_low = sorted(here, key=lambda p: p.low)
+        self.lows = [p.low for p in self.by_low]
+        # negated so bisect finds the last ports at or above a port
+        self.by_high = sorted(here, key=lambda p: -p.high)
+        self.highs = [-p.high for p in self.by_high]
+        self.left = PortTree(left) if left else None
+        self.right = PortTree(right) if right else None
+
+    def find(self, port):
+        '''
+        returns: list of the Permissions whose range includes the port
+        '''
+        found = []
+        node = self
+        while node is not None:
+            if port < node.center:
+                found.extend(node.by_low[:bisect_right(node.lows, port)])
+                node = node.left
+            elif port > node.center:
+                found.extend(node.by_high[:bisect_right(node.highs, -port)])
+                node = node.right
+            else:
+                found.extend(node.by_low)
+                break
+        return found
+
+
+class ExposureIndex:
+    '''
+    Answers which security groups, and which interfaces and instances
+    using them, let traffic in or out.
+
+    Permissions are kept in a PortTree per direction and protocol, so a
+    port lookup only visits the rules that allow it. The interfaces are
+    indexed by ip address and by group.
+    '''
+    def __init__(self, groups, interfaces):
+        self.groups = {g.id: g for g in groups}
+        self.interfaces = {n.id: n for n in interfaces}
+        self.rule_count = 0
+        # (direction, protocol): PortTree
+        self.ports = {}
+        buckets = {}
+        for g in groups:
+            for direction,rules in [('ingress', g.ingress), ('egress', g.egress)]:
+                for rule in rules:
+                    for perm in rule_permissions(g.id, direction, rule):
+                        buckets.setdefault((direction, perm.protocol), []).append(perm)
+                        self.rule_count += 1
+        for key,perms in buckets.items():
+            self.ports[key] = PortTree(perms)
+        self.by_ip = {}
+        self.by_group = {}
+        for n in interfaces:
+            for ip in [ip for ip,_ in n.private_ips] + list(n.ipv6) + [n.public_ip]:
+                if ip:
+                    self.by_ip.setdefault(ipaddress.ip_address(ip), []).append(n)
+            for gid,_ in n.groups:
+                self.by_group.setdefault(gid, []).append(n)
+
+    def allowing(self, port, protocol='tcp', direction='ingress'):
+        '''
+        returns: list of Permissions that allow the port
+        '''
+        protocol = protocol_name(protocol)
+        found = []
+        # an all traffic rule allows any protocol
+        for proto in {protocol, '-1'}:
+            tree = self.ports.get((direction, proto))
+            if tree is not None:
+                found.extend(tree.find(port))
+        return found
+
+    def groups_of(self, ip):
+        '''
+        returns: set of the group ids of the interfaces with the ip
+        '''
+        return {gid for n in self.by_ip.get(ipaddress.ip_address(ip), []) for gid,_ in n.groups}
+
+    def exposed(self, port, protocol='tcp', peer=WORLD, direction='ingress'):
+        '''
+        Find what allows traffic on a port from (or to, for egress) every
+        address in the peer cidrs, eg exposed(22) finds ssh open to the
+        world. A single address also matches rules naming a group of an
+        interface with that address.
+
+        returns: list of Permissions
+        '''
+        if isinstance(peer, str):
+            peer = [peer]
+        nets = [ipaddress.ip_network(p, strict=False) for p in peer]
+        peer_groups = set()
+        for net in nets:
+            if net.num_addresses == 1:
+                peer_groups |= self.groups_of(net.network_address)
+        found = []
+        for perm in self.allowing(port, protocol, direction):
+            if perm.network is None:
+                if perm.peer_group in peer_groups:
+                    found.append(perm)
+            elif any(net.version == perm.network.version and net.subnet_of(perm.network)
+                        for net in nets):
+                found.append(perm)
+        return found
+
+    def reaching(self, ip, port, protocol='tcp'):
+        '''
+        What can reach an address on a port, from the ingress rules of
+        the groups of the interfaces with that address.
+
+        returns: list of Permissions
+        '''
+        groups = self.groups_of(ip)
+        return [p for p in self.allowing(port, protocol) if p.group in groups]
+
+    def users(self, group_id):
+        '''
+        returns: list of the interfaces using a group
+        '''
+        return self.by_group.get(group_id, [])
+
+
+def fetch_interfaces(region=None, profile=None):
+    for page in paginate(client('ec2', region, profile), 'describe_network_interfaces',
+                            'NetworkInterfaces'):
+        for n in page:
+            yield NetworkInterface.from_api(n)
+
+
+def fetch_groups(region=None, profile=None):
+    for page in paginate(client('ec2', region, profile), 'describe_security_groups',
+                            'SecurityGroups'):
+        for g in page:
+            yield SecurityGroup.from_api(g)
+
+
+def _describe_groups(ec2, group_ids):
+    try:
+        resp = ec2.describe_security_groups(GroupIds=group_ids)
+    except ClientError:
+        # a deleted group fails the whole call, the filter skips it
+        resp = ec2.describe_security_groups(Filters=[{'Name': 'group-id', 'Values': group_ids}])
+    return [SecurityGroup.from_api(g) for g in resp['SecurityGroups']]
+
+
+def group_names(group_ids, region=None, profile=None):
+    '''
+    Map security group ids to their Name tags. Fresh names from the cached
+    groups of the security group view and from earlier lookups are used,
+    only the other ids are asked for, in batches of NAMES_SIZE.
+
+    returns: dict of group id: name
+    '''
+    names = cache.fresh('security_group_names', profile, region) or {}
+    groups = cache.fresh('security_groups', profile, region)
+    if groups is not None:
+        names.update((g['id'], g['name']) for g in groups)
+    missing = sorted(set(group_ids) - set(names))
+    if len(missing):
+        ec2 = client('ec2', region, profile)
+        for n in range(0, len(missing), NAMES_SIZE):
+            for g in _describe_groups(ec2, missing[n:n+NAMES_SIZE]):
+                names[g.id] = g.name
+        # groups that no longer exist aren't asked for again until expired
+        for gid in missing:
+            names.setdefault(gid, '')
+        cache.save('security_group_names', names, profile, region)
+    return {gid: names.get(gid, '') for gid in group_ids}
+
+
+def _load(rtype, record_type, fetch, use_cache, region, profile):
+    cached = cache.fresh(rtype, profile, region) if use_cache else None
+    if cached is not None:
+        return [record_type.from_dict(i) for i in cached]
+    items = list(fetch(region, profile))
+    cache.save(rtype, [i.to_dict() for i in items], profile, region)
+    return items
+
+
+def load_index(use_cache=True, region=None, profile=None, groups=None):
+    '''
+    Build an ExposureIndex from the security groups and network
+    interfaces of a profile and region, cached lists are used while fresh.
+
+    groups -- SecurityGroups already at hand, eg those listed in a view
+    '''
+    if groups is None:
+        groups = _load('security_groups', SecurityGroup, fetch_groups, use_cache, region, profile)
+    interfaces = _load('network_interfaces', NetworkInterface, fetch_interfaces,
+                        use_cache, region, profile)
+    return ExposureIndex(groups, interfaces)
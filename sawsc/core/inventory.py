@@ -0,0 +1,120 @@
+#
+#  core/inventory.py
+#
+#  Copyright (c)2023 Shane Ambler <Develop@ShaneWare.biz>
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are
+#  met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following disclaimer
+#    in the documentation and/or other materials provided with the
+#    distribution.
+#  * Neither the name of the  nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+#  A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+#  OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+#  SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+#  LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+#  DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+#  THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+#  (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+#  OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import time
+
+from .ec2 import enabled_regions
+
+
+class Result:
+    '''
+    What one profile and region returned, or why it didn't, and how long
+    it took.
+    '''
+    __slots__ = ('profile', 'region', 'items', 'error', 'seconds')
+
+    def __init__(self, profile, region=None, items=(), error=None, seconds=0.0):
+        self.profile = profile
+        self.region = region
+        self.items = items
+        self.error = error
+        self.seconds = seconds
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    @property
+    def name(self):
+        name = self.profile or 'default'
+        return f'{name} {self.region}' if self.region else name
+
+    def summary(self):
+        if not self.ok:
+            return f'{self.name}: failed after {self.seconds:.2f}s - {self.error}'
+        return f'{self.name}: {len(self.items)} in {self.seconds:.2f}s'
+
+
+def _timed(fetch, profile, region):
+    start = time.perf_counter()
+    try:
+        items = list(fetch(profile, region))
+    except Exception as e:
+        return Result(profile, region, error=str(e), seconds=time.perf_counter()-start)
+    return Result(profile, region, items, seconds=time.perf_counter()-start)
+
+
+def gather(fetch, targets, max_workers=8):
+    '''
+    Run fetch(profile, region) for each target at the same time, no more
+    than max_workers at once. A failing target doesn't stop the others.
+
+    fetch   -- returns the items of a profile and region
+    targets -- list of (profile, region), None is the default of either
+
+    returns: yields a Result for each target as it finishes
+    '''
+    targets = list(targets) or [(None, None)]
+    if len(targets) == 1:
+        yield _timed(fetch, *targets[0])
+        return
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(targets))) as pool:
+        futures = [pool.submit(_timed, fetch, p, r) for p,r in targets]
+        for f in as_completed(futures):
+            yield f.result()
+
+
+def targets(profiles, all_regions=False, max_workers=8):
+    '''
+    The (profile, region) pairs to fetch, with all_regions each profile is
+    paired with every region enabled for its account.
+
+    returns: (list of targets, list of Results for profiles whose regions
+              couldn't be found)
+    '''
+    profiles = list(profiles) or [None]
+    if not all_regions:
+        return [(p, None) for p in profiles], []
+    found, failed = [], []
+    for res in gather(lambda p, r: enabled_regions(p), [(p, None) for p in profiles],
+                        max_workers):
+        if res.ok:
+            found += [(res.profile, r) for r in res.items]
+        else:
+            failed.append(res)
+    # keep the profiles in the order given
+    order = {p: n for n,p in enumerate(profiles)}
+    found.sort(key=lambda t: (order[t[0]], t[1]))
+    return found, failed
@@ -0,0 +1,252 @@
+#
+#  core/models.py
+#
+#  Copyright (c)2023 Shane Ambler <Develop@ShaneWare.biz>
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are
+#  met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following disclaimer
+#    in the documentation and/or other materials provided with the
+#    distribution.
+#  * Neither the name of the  nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+#  A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+#  OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+#  SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+#  LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+#  DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+#  THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+#  (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+#  OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+
+'''
+Records holding the parts of each aws resource that sawsc uses. They are
+made once from the api response, which can then be dropped, and are what
+the cli, the gui and the cache work with.
+
+Records use __slots__ and tuples so thousands of them stay small, and
+compare equal when their values match so the lists can diff them.
+'''
+
+
+def _tuples(v):
+    # json gives back lists, records hold tuples
+    if isinstance(v, list):
+        return tuple(_tuples(i) for i in v)
+    return v
+
+
+def _tags(d):
+    return tuple((t['Key'], t['Value']) for t in d.get('Tags', []))
+
+
+class Record:
+    __slots__ = ()
+    # fields holding other records - field: record class
+    nested = {}
+
+    def __init__(self, **kwargs):
+        for f in self.__slots__:
+            setattr(self, f, kwargs.get(f, ''))
+
+    def __eq__(self, other):
+        return (type(self) is type(other)
+                and all(getattr(self, f) == getattr(other, f) for f in self.__slots__))
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.key!r})'
+
+    @property
+    def key(self):
+        return self.id
+
+    def tag(self, key):
+        return next((v for k,v in self.tags if k == key), '')
+
+    def copy(self, **changes):
+        '''
+        returns: a new record of the same values apart from the changes
+        '''
+        values = {f: getattr(self, f) for f in self.__slots__}
+        values.update(changes)
+        return type(self)(**values)
+
+    def to_dict(self):
+        d = {f: getattr(self, f) for f in self.__slots__}
+        for f in self.nested:
+            d[f] = [r.to_dict() for r in d[f]]
+        return d
+
+    @classmethod
+    def from_dict(cls, d):
+        '''
+        Make a record from to_dict() output, eg from the cache.
+        '''
+        vals = {f: _tuples(d[f]) for f in cls.__slots__ if f in d}
+        for f,rtype in cls.nested.items():
+            vals[f] = tuple(rtype.from_dict(r) for r in d.get(f, []))
+        return cls(**vals)
+
+
+class NetworkInterface(Record):
+    # instance is the id of the attached instance, when listed by
+    # describe_network_interfaces, which also lists the interfaces of
+    # load balancers, databases and the like
+    __slots__ = ('id', 'subnet', 'private_ips', 'ipv6', 'groups', 'public_ip',
+                 'instance', 'description')
+
+    @classmethod
+    def from_api(cls, d):
+        return cls(id=d['NetworkInterfaceId'],
+                   subnet=d.get('SubnetId', ''),
+                   # (ip, dns name)
+                   private_ips=tuple((p['PrivateIpAddress'], p.get('PrivateDnsName', ''))
+                                    for p in d.get('PrivateIpAddresses', [])),
+                   ipv6=tuple(p['Ipv6Address'] for p in d.get('Ipv6Addresses', [])),
+                   # (group id, group name)
+                   groups=tuple((g['GroupId'], g['GroupName']) for g in d.get('Groups', [])),
+                   public_ip=d.get('Association', {}).get('PublicIp', ''),
+                   instance=d.get('Attachment', {}).get('InstanceId', ''),
+                   description=d.get('Description', ''))
+
+
+class Instance(Record):
+    # account is the profile the instance was listed with, '' for the default
+    __slots__ = ('id', 'name', 'state', 'state_name', 'type', 'arch', 'cpus',
+                 'az', 'vpc', 'key_name', 'public_ip', 'public_dns', 'ipv6',
+                 'launch_time', 'interfaces', 'tags', 'account', 'region')
+    nested = {'interfaces': NetworkInterface}
+
+    @property
+    def profile(self):
+        return self.account or None
+
+    @classmethod
+    def from_api(cls, d, account='', region=''):
+        cpu = d.get('CpuOptions', {})
+        interfaces = tuple(NetworkInterface.from_api(n) for n in d.get('NetworkInterfaces', []))
+        tags = _tags(d)
+        return cls(id=d['InstanceId'],
+                   name=next((v for k,v in tags if k == 'Name'), ''),
+                   state=d['State']['Code'],
+                   state_name=d['State']['Name'],
+                   type=d['InstanceType'],
+                   arch=d.get('Architecture', ''),
+                   cpus=cpu.get('CoreCount', 0) * cpu.get('ThreadsPerCore', 1),
+                   az=d.get('Placement', {}).get('AvailabilityZone', ''),
+                   vpc=d.get('VpcId', ''),
+                   key_name=d.get('KeyName', ''),
+                   public_ip=d.get('PublicIpAddress', ''),
+                   public_dns=d.get('PublicDnsName', ''),
+                   ipv6=tuple(ip for n in interfaces for ip in n.ipv6),
+                   launch_time=str(d.get('LaunchTime', '')),
+                   interfaces=interfaces,
+                   tags=tags,
+                   account=account,
+                   region=region)
+
+
+class Rule(Record):
+    '''
+    One ip permission of a security group
+    '''
+    __slots__ = ('protocol', 'from_port', 'to_port', 'ipv4', 'ipv6', 'groups')
+
+    @property
+    def key(self):
+        return (self.protocol, self.from_port, self.to_port)
+
+    @classmethod
+    def from_api(cls, d):
+        return cls(protocol=d['IpProtocol'],
+                   from_port=d.get('FromPort', ''),
+                   to_port=d.get('ToPort', ''),
+                   # (cidr, description)
+                   ipv4=tuple((r['CidrIp'], r.get('Description', '')) for r in d.get('IpRanges', [])),
+                   ipv6=tuple((r['CidrIpv6'], r.get('Description', '')) for r in d.get('Ipv6Ranges', [])),
+                   # ids of the groups allowed
+                   groups=tuple(g['GroupId'] for g in d.get('UserIdGroupPairs', []) if 'GroupId' in g))
+
+
+class SecurityGroup(Record):
+    __slots__ = ('id', 'name', 'group_name', 'vpc', 'description',
+                 'ingress', 'egress', 'tags')
+    nested = {'ingress': Rule, 'egress': Rule}
+
+    @classmethod
+    def from_api(cls, d):
+        tags = _tags(d)
+        return cls(id=d['GroupId'],
+                   name=next((v for k,v in tags if k == 'Name'), ''),
+                   group_name=d.get('GroupName', ''),
+                   vpc=d.get('VpcId', ''),
+                   description=d.get('Description', ''),
+                   ingress=tuple(Rule.from_api(r) for r in d.get('IpPermissions', [])),
+                   egress=tuple(Rule.from_api(r) for r in d.get('IpPermissionsEgress', [])),
+                   tags=tags)
+
+
+class Vpc(Record):
+    __slots__ = ('id', 'name', 'cidr', 'ipv6_cidrs', 'tags')
+
+    @classmethod
+    def from_api(cls, d):
+        tags = _tags(d)
+        return cls(id=d['VpcId'],
+                   name=next((v for k,v in tags if k == 'Name'), ''),
+                   cidr=d.get('CidrBlock', ''),
+                   ipv6_cidrs=tuple(a['Ipv6CidrBlock'] for a in d.get('Ipv6CidrBlockAssociationSet', [])),
+                   tags=tags)
+
+
+class Snapshot(Record):
+    __slots__ = ('id', 'name', 'volume', 'size', 'start_time', 'state', 'description', 'tags')
+
+    @classmethod
+    def from_api(cls, d):
+        tags = _tags(d)
+        return cls(id=d['SnapshotId'],
+                   name=next((v for k,v in tags if k == 'Name'), ''),
+                   volume=d.get('VolumeId', ''),
+                   size=d.get('VolumeSize', 0),
+                   start_time=str(d.get('StartTime', '')),
+                   state=d.get('State', ''),
+                   description=d.get('Description', ''),
+                   tags=tags)
+
+
+class Bucket(Record):
+    __slots__ = ('name', 'created')
+
+    @property
+    def key(self):
+        return self.name
+
+    @classmethod
+    def from_api(cls, d):
+        return cls(name=d['Name'], created=str(d.get('CreationDate', '')))
+
+
+class BucketDetails(Record):
+    '''
+    What is found about a bucket after listing it, counted is where the
+    size and object count came from - metrics, scan or partial scan.
+    '''
+    __slots__ = ('name', 'region', 'versioning', 'objects', 'size', 'counted', 'error')
+
+    @property
+    def key(self):
+        return self.name
@@ -0,0 +1,431 @@
+#
+#  core/s3.py
+#
+#  Copyright (c)2023 Shane Ambler <Develop@ShaneWare.biz>
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are
+#  met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following disclaimer
+#    in the documentation and/or other materials provided with the
+#    distribution.
+#  * Neither the name of the  nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+#  A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+#  OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+#  SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+#  LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+#  DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+#  THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+#  (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+#  OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import datetime
+import os
+import threading as thr
+import time
+
+from .. import hs
+from . import cache, clients
+from .clients import client, paginate
+from .models import BucketDetails
+
+# most objects counted by listing a bucket without storage metrics
+SCAN_LIMIT = 10000
+# keys asked for with each page when listing every key under a prefix,
+# the most aws gives, whatever page size the views use
+LIST_PAGE_SIZE = 1000
+# keys listed with each page when browsing a bucket
+LEVEL_PAGE_SIZE = 1000
+# most browsed prefixes, and keys of them, kept by a LevelCache
+LEVEL_CACHE_SIZE = 256
+LEVEL_CACHE_ENTRIES = 200000
+MIB = 1024 * 1024
+
+
+def bucket_region(s3, name):
+    loc = s3.get_bucket_location(Bucket=name).get('LocationConstraint')
+    # older regions give None and EU for their original names
+    return {None: 'us-east-1', '': 'us-east-1', 'EU': 'eu-west-1'}.get(loc, loc)
+
+
+def bucket_versioning(s3, name):
+    return s3.get_bucket_versioning(Bucket=name).get('Status', 'Disabled')
+
+
+def _latest_metric(cw, name, metric, storage, end):
+    resp = cw.get_metric_statistics(Namespace='AWS/S3', MetricName=metric,
+                Dimensions=[{'Name': 'BucketName', 'Value': name},
+                            {'Name': 'StorageType', 'Value': storage}],
+                StartTime=end - datetime.timedelta(days=3), EndTime=end,
+                Period=86400, Statistics=['Average'])
+    points = sorted(resp['Datapoints'], key=lambda p: p['Timestamp'])
+    return int(points[-1]['Average']) if len(points) else None
+
+
+def storage_metrics(name, region, profile=None):
+    '''
+    Get the latest daily size and object count cloudwatch has for a
+    bucket. The size is the total of every storage type the bucket
+    uses, eg standard, infrequent access and glacier.
+
+    returns: (objects, size in bytes) or None without metrics
+    '''
+    cw = client('cloudwatch', region, profile)
+    end = datetime.datetime.now(datetime.timezone.utc)
+    objects = _latest_metric(cw, name, 'NumberOfObjects', 'AllStorageTypes', end)
+    if objects is None:
+        return None
+    storage = set()
+    # list_metrics takes no page size, so paginate() can't be used
+    for page in cw.get_paginator('list_metrics').paginate(Namespace='AWS/S3',
+                    MetricName='BucketSizeBytes',
+                    Dimensions=[{'Name': 'BucketName', 'Value': name}]):
+        for m in page['Metrics']:
+            storage.update(d['Value'] for d in m['Dimensions'] if d['Name'] == 'StorageType')
+    size = 0
+    for s in sorted(storage):
+        size += _latest_metric(cw, name, 'BucketSizeBytes', s, end) or 0
+    return objects, size
+
+
+def scan_objects(name, region, profile=None, limit=SCAN_LIMIT):
+    '''
+    Count the objects of a bucket by listing them, stopping after limit.
+
+    returns: (objects, size in bytes, True if all were counted)
+    '''
+    count = size = 0
+    for page in paginate(client('s3', region, profile), 'list_objects_v2', 'Contents',
+                            LIST_PAGE_SIZE, Bucket=name):
+        count += len(page)
+        size += sum(o['Size'] for o in page)
+        if count >= limit:
+            return count, size, False
+    return count, size, True
+
+
+def bucket_details(name, profile=None):
+    try:
+        s3 = client('s3', None, profile)
+        region = bucket_region(s3, name)
+        # each bucket is best asked in its own region
+        s3 = client('s3', region, profile)
+        versioning = bucket_versioning(s3, name)
+    except Exception as e:
+        return BucketDetails(name=name, error=str(e))
+    try:
+        found = storage_metrics(name, region, profile)
+    except Exception:
+        # no cloudwatch access, counting the objects may still work
+        found = None
+    try:
+        if found is not None:
+            objects, size = found
+            counted = 'metrics'
+        else:
+            objects, size, done = scan_objects(name, region, profile)
+            counted = 'scan' if done else 'partial scan'
+    except Exception as e:
+        return BucketDetails(name=name, region=region, versioning=versioning, error=str(e))
+    return BucketDetails(name=name, region=region, versioning=versioning,
+                         objects=objects, size=size, counted=counted)
+
+
+def load_details(names, use_cache=True, profile=None, max_workers=8):
+    '''
+    Yield the BucketDetails of each bucket, fresh cached details first and
+    then the others as they are fetched, no more than max_workers at once.
+    Failed buckets aren't cached so they are tried again next time.
+    '''
+    names = set(names)
+    cached = cache.fresh('bucket_details', profile) if use_cache else None
+    known = {d['name']: BucketDetails.from_dict(d) for d in cached or []}
+    fetch = []
+    for name in names:
+        if name in known:
+            yield known[name]
+        else:
+            fetch.append(name)
+    if not len(fetch):
+        return
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(bucket_details, n, profile) for n in fetch]
+        for f in as_completed(futures):
+            d = f.result()
+            if not d.error:
+                known[d.name] = d
+            yield d
+    cache.save('bucket_details', [d.to_dict() for n,d in known.items() if n in names], profile)
+
+
+def list_level(name, prefix='', token=None, region=None, profile=None,
+                max_keys=LEVEL_PAGE_SIZE):
+    '''
+    Get one page of what is directly under a prefix of a bucket, deeper
+    keys are rolled up into their next prefix by aws.
+
+    returns: (prefixes, objects as (key, size, modified), next page token
+              or None at the end)
+    '''
+    kwargs = {'Bucket': name, 'Prefix': prefix, 'Delimiter': '/', 'MaxKeys': max_keys}
+    if token:
+        kwargs['ContinuationToken'] = token
+    resp = client('s3', region, profile).list_objects_v2(**kwargs)
+    prefixes = [p['Prefix'] for p in resp.get('CommonPrefixes', [])]
+    objects = [(o['Key'], o['Size'], str(o['LastModified'])) for o in resp.get('Contents', [])]
+    return prefixes, objects, resp.get('NextContinuationToken') if resp.get('IsTruncated') else None
+
+
+class Level:
+    '''
+    The pages loaded so far of one prefix of a bucket.
+    '''
+    __slots__ = ('prefixes', 'objects', 'token', 'pages')
+
+    def __init__(self):
+        self.prefixes = []
+        self.objects = []
+        self.token = None
+        self.pages = 0
+
+    def __len__(self):
+        return len(self.prefixes) + len(self.objects)
+
+    @property
+    def more(self):
+        return self.token is not None
+
+
+class LevelCache:
+    '''
+    Keeps the levels of the most recently browsed prefixes, the least
+    recently used are dropped when there are more than size levels or
+    entries keys in them, so browsing never holds a whole bucket. Pinned
+    levels, eg those open in a view, are never dropped so their next page
+    follows on from what was shown.
+    '''
+    def __init__(self, size=LEVEL_CACHE_SIZE, entries=LEVEL_CACHE_ENTRIES):
+        self.size = size
+        self.entries = entries
+        self.levels = OrderedDict() # (bucket, prefix): Level
+        self.count = 0
+        self.pinned = set() # (bucket, prefix)
+        self.lock = thr.Lock()
+
+    def get(self, bucket, prefix):
+        with self.lock:
+            level = self.levels.get((bucket, prefix))
+            if level is not None:
+                self.levels.move_to_end((bucket, prefix))
+            return level
+
+    def load(self, bucket, prefix='', more=False, region=None, profile=None):
+        '''
+        Get a level, its first page is listed when it isn't cached and with
+        more the next page is added to it.
+        '''
+        key = (bucket, prefix)
+        level = self.get(bucket, prefix)
+        if level is None:
+            level = Level()
+        elif not more or not level.more:
+            return level
+        prefixes, objects, token = list_level(bucket, prefix, level.token, region, profile)
+        with self.lock:
+            if key in self.levels:
+                self.count -= len(self.levels[key])
+            level.prefixes += prefixes
+            level.objects += objects
+            level.token = token
+            level.pages += 1
+            self.levels[key] = level
+            self.levels.move_to_end(key)
+            self.count += len(level)
+            # the level just loaded is always kept
+            while len(self.levels) > 1 and (len(self.levels) > self.size
+                                            or self.count > self.entries):
+                old = next((k for k in self.levels if k != key and k not in self.pinned), None)
+                if old is None:
+                    break
+                self.count -= len(self.levels.pop(old))
+        return level
+
+    def pin(self, bucket, prefix):
+        with self.lock:
+            self.pinned.add((bucket, prefix))
+
+    def unpin(self, bucket, prefix):
+        with self.lock:
+            self.pinned.discard((bucket, prefix))
+
+    def drop(self, bucket, prefix=''):
+        '''
+        Forget the levels of a bucket at and below a prefix, the whole
+        bucket by default.
+        '''
+        def under(k):
+            return k[0] == bucket and k[1].startswith(prefix)
+        with self.lock:
+            for key in [k for k in self.levels if under(k)]:
+                self.count -= len(self.levels.pop(key))
+            self.pinned = {k for k in self.pinned if not under(k)}
+
+
+def split_url(url):
+    '''
+    Split s3://bucket/key, or bucket/key, into (bucket, key).
+    '''
+    if url.startswith('s3://'):
+        url = url[5:]
+    bucket, _, key = url.partition('/')
+    return bucket, key
+
+
+def transfer_config(part_size=8, concurrency=10):
+    '''
+    Make the boto3 TransferConfig for uploads and downloads, files larger
+    than a part are sent in parts with concurrency parts at once.
+
+    part_size   -- MiB in each part
+    concurrency -- parts of one file sent at once
+    '''
+    from boto3.s3.transfer import TransferConfig
+    return TransferConfig(multipart_threshold=part_size*MIB, multipart_chunksize=part_size*MIB,
+                          max_concurrency=concurrency, use_threads=True)
+
+
+def upload_jobs(src, bucket, prefix=''):
+    '''
+    List what to upload, the files in a directory are put under the
+    prefix with their path in the directory.
+
+    returns: list of (path, bucket, key, size)
+    '''
+    if os.path.isdir(src):
+        if prefix and not prefix.endswith('/'):
+            prefix += '/'
+        jobs = []
+        for root,dirs,files in os.walk(src):
+            dirs.sort()
+            for f in sorted(files):
+                path = os.path.join(root, f)
+                key = prefix + os.path.relpath(path, src).replace(os.sep, '/')
+                jobs.append((path, bucket, key, os.path.getsize(path)))
+        return jobs
+    key = prefix
+    if not key or key.endswith('/'):
+        key += os.path.basename(src)
+    return [(src, bucket, key, os.path.getsize(src))]
+
+
+def download_jobs(bucket, key, dest, region=None, profile=None):
+    '''
+    List what to download, an empty key or one ending in / gets every
+    object under it into the dest directory.
+
+    returns: list of (path, bucket, key, size)
+    '''
+    s3 = client('s3', region, profile)
+    if key and not key.endswith('/'):
+        size = s3.head_object(Bucket=bucket, Key=key)['ContentLength']
+        if os.path.isdir(dest) or dest.endswith(os.sep):
+            dest = os.path.join(dest, key.rsplit('/', 1)[-1])
+        return [(dest, bucket, key, size)]
+    top = os.path.abspath(dest)
+    jobs = []
+    for page in paginate(s3, 'list_objects_v2', 'Contents', LIST_PAGE_SIZE,
+                            Bucket=bucket, Prefix=key):
+        for o in page:
+            path = os.path.abspath(os.path.join(top, *o['Key'][len(key):].split('/')))
+            # folder markers have no file, and keys with .. can't leave dest
+            if o['Key'].endswith('/') or not path.startswith(top + os.sep):
+                continue
+            jobs.append((path, bucket, o['Key'], o['Size']))
+    return jobs
+
+
+class Progress:
+    '''
+    Totals of a transfer, added to by the transfer threads as each chunk
+    of a file is sent or received.
+    '''
+    def __init__(self, jobs):
+        self.total = sum(j[3] for j in jobs)
+        self.files = len(jobs)
+        self.moved = 0
+        self.finished = 0
+        self.failed = 0
+        self.started = time.perf_counter()
+        self.lock = thr.Lock()
+
+    def add(self, count):
+        with self.lock:
+            self.moved += count
+
+    def finish(self, ok=True):
+        with self.lock:
+            self.finished += 1
+            if not ok:
+                self.failed += 1
+
+    @property
+    def seconds(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def rate(self):
+        return self.moved / max(self.seconds, 0.001)
+
+    def summary(self):
+        pct = self.moved * 100 // self.total if self.total else 100
+        txt = (f'{hs(self.moved, 1)} of {hs(self.total, 1)} ({pct}%),'
+               f' {self.finished} of {self.files} files, {hs(self.rate, 1)}/s')
+        return txt + f', {self.failed} failed' if self.failed else txt
+
+
+def transfer(jobs, upload, config=None, max_workers=8, progress=None, region=None,
+             profile=None):
+    '''
+    Upload or download the jobs, max_workers files at once and each file
+    in parts as set by the config. This blocks so run it in a worker
+    thread.
+
+    yields: (job, exception or None) as each file finishes
+    '''
+    # every part in flight needs a connection, a client of its own gets a
+    # big enough pool so the shared clients are left as they are
+    needed = max_workers * (config.max_concurrency if config is not None else 10)
+    if needed > clients.max_pool_connections:
+        s3 = clients.own_client('s3', region, profile, needed)
+    else:
+        s3 = client('s3', region, profile)
+    if progress is None:
+        progress = Progress(jobs)
+
+    def run(job):
+        path, bucket, key, size = job
+        if upload:
+            s3.upload_file(path, bucket, key, Config=config, Callback=progress.add)
+        else:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            s3.download_file(bucket, key, path, Config=config, Callback=progress.add)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(run, j): j for j in jobs}
+        for f in as_completed(futures):
+            err = f.exception()
+            progress.finish(err is None)
+            yield futures[f], err
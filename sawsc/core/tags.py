@@ -0,0 +1,125 @@
+#
+#  core/tags.py
+#
+#  Copyright (c)2023 Shane Ambler <Develop@ShaneWare.biz>
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are
+#  met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following disclaimer
+#    in the documentation and/or other materials provided with the
+#    distribution.
+#  * Neither the name of the  nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+#  A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+#  OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+#  SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+#  LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+#  DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+#  THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+#  (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+#  OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+from . import cache
+from .clients import client
+
+# most resources aws takes in one create_tags or delete_tags call
+TAG_BATCH = 1000
+
+# cached resource types holding the tags of each id prefix
+CACHED_TYPES = {
+    'i-': ['instances'],
+    'sg-': ['security_groups', 'security_group_names'],
+    'vpc-': ['vpcs'],
+    'snap-': ['snapshots'],
+    }
+
+
+def _tag_call(ec2, ids, set_tags=None, remove_keys=()):
+    # one of set_tags or remove_keys, so a failure is from only one of them
+    if set_tags:
+        ec2.create_tags(Resources=ids, Tags=[{'Key': k, 'Value': v} for k,v in set_tags.items()])
+    if len(remove_keys):
+        ec2.delete_tags(Resources=ids, Tags=[{'Key': k} for k in remove_keys])
+
+
+def _tag_ids(ec2, ids, failed, set_tags=None, remove_keys=()):
+    '''
+    Send the ids in chunks of TAG_BATCH, aws rejects the whole call when
+    one resource can't be tagged so a failed chunk is split in halves
+    until the resources that fail are found. A few bad ids in a chunk of
+    n take about log2(n) calls each to find, not n.
+
+    failed -- dict the error text of each failed id is added to
+    '''
+    chunks = [ids[n:n+TAG_BATCH] for n in range(0, len(ids), TAG_BATCH)]
+    while len(chunks):
+        chunk = chunks.pop()
+        try:
+            _tag_call(ec2, chunk, set_tags, remove_keys)
+        except Exception as e:
+            if len(chunk) == 1:
+                failed[chunk[0]] = str(e)
+            else:
+                half = len(chunk) // 2
+                chunks += [chunk[half:], chunk[:half]]
+
+
+def change_tags(resource_ids, set_tags=None, remove_keys=(), region=None, profile=None):
+    '''
+    Add or overwrite set_tags and delete the remove_keys tags of ec2
+    resources, eg instances, volumes, snapshots, security groups and vpcs.
+
+    The tags are set first, then the keys are deleted from the resources
+    that took the new tags, see _tag_ids() for how failures are found.
+
+    set_tags    -- dict of key: value
+    remove_keys -- tag keys to delete
+
+    returns: dict of resource id: (tags set, error text) of the resources
+             not fully changed, tags set is True when set_tags were added
+             but the remove_keys could not be deleted
+    '''
+    ec2 = client('ec2', region, profile)
+    resource_ids = list(dict.fromkeys(resource_ids))
+    not_set = {}
+    if set_tags:
+        _tag_ids(ec2, resource_ids, not_set, set_tags=set_tags)
+    not_removed = {}
+    if len(remove_keys):
+        _tag_ids(ec2, [r for r in resource_ids if r not in not_set], not_removed,
+                    remove_keys=remove_keys)
+    failed = {r: (False, err) for r,err in not_set.items()}
+    failed.update((r, (bool(set_tags), err)) for r,err in not_removed.items())
+    changed = [r for r in resource_ids if r not in not_set
+                and (set_tags or r not in not_removed)]
+    for prefix,rtypes in CACHED_TYPES.items():
+        if any(r.startswith(prefix) for r in changed):
+            for rtype in rtypes:
+                cache.expire(rtype, profile, region)
+    return failed
+
+
+def retag(record, set_tags=None, remove_keys=()):
+    '''
+    Make a copy of a record with its tags changed as change_tags() did
+    in aws, the name follows the Name tag.
+    '''
+    tags = dict(record.tags)
+    tags.update(set_tags or {})
+    for k in remove_keys:
+        tags.pop(k, None)
+    changes = {'tags': tuple(tags.items())}
+    if 'name' in record.__slots__:
+        changes['name'] = tags.get('Name', '')
+    return record.copy(**changes)
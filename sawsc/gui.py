@@ -31,30 +31,66 @@
 #
 
 
-import boto3
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from importlib import import_module
 import os
+import re
 import sawsc
 import sys
-import threading as thr
 import tkinter as tk
 import ttkbootstrap as ttk
 from ttkbootstrap.dialogs import Messagebox as mb
 from ttkbootstrap.scrolled import ScrolledFrame
 from ttkbootstrap.tableview import Tableview
+from ttkbootstrap.tooltip import ToolTip
 
-from . import hs, GUIOptions
+from . import GUIOptions
+from .core import cache
+from .core.catalog import load_catalog
+from .core.clients import client, configure
+from .service import RenderQueue
 from .__version__ import __version__ as vers
 
 PADDING = 5
+REGION_WORKERS = 8 # regions queried at the same time
 
 App = None # created in main()
 
-service = {s[:-3]: import_module('sawsc.service.'+s[:-3]) for
-                s in sorted(os.listdir(os.path.join(os.path.dirname(
-                                    os.path.realpath(__file__)), 'service')))
-                if s not in ['__init__.py', '__pycache__']
-                }
+
+class ServiceRegistry:
+    '''
+    Find the available services without importing them. A service module
+    (and the boto3 client it creates) is only imported when it is first used.
+    '''
+    name_match = re.compile(r'''^name\s*=\s*['"](.+)['"]\s*$''', re.MULTILINE)
+
+    def __init__(self, service_dir):
+        self.labels = {}
+        self.modules = {}
+        for s in sorted(os.listdir(service_dir)):
+            if not s.endswith('.py') or s == '__init__.py': continue
+            self.labels[s[:-3]] = self.read_label(os.path.join(service_dir, s), s[:-3])
+
+    def read_label(self, path, default):
+        # the display name is the module level `name = '...'`
+        with open(path, 'r') as src:
+            m = self.name_match.search(src.read())
+        return m.group(1) if m else default
+
+    def keys(self):
+        return self.labels.keys()
+
+    def __contains__(self, key):
+        return key in self.labels
+
+    def __getitem__(self, key):
+        if key not in self.modules:
+            self.modules[key] = import_module('sawsc.service.'+key)
+        return self.modules[key]
+
+
+service = ServiceRegistry(os.path.join(os.path.dirname(
+                                    os.path.realpath(__file__)), 'service'))
 
 
 class tspinner(ttk.Label):
@@ -195,9 +231,12 @@ class SawscPrefs(tk.Toplevel):
         self.destroy()
 
 
-class SawscRegions(tk.Toplevel):
+class SawscRegions(RenderQueue, tk.Toplevel):
+    ZONE_INDENT = 5
+
     def __init__(self):
         super().__init__()
+        self.init_render()
         self.title('AWS Regions')
         self.geometry('300x600')
         self.protocol("WM_DELETE_WINDOW", self.close_window)
@@ -219,16 +258,29 @@ class SawscRegions(tk.Toplevel):
         for w in self.tree.winfo_children():
             w.destroy()
         self.show_check['state'] = tk.DISABLED
-        t=thr.Thread(target=self.refresh_thread)
-        t.daemon = True
         self.progress.start()
-        t.start()
-
-    def refresh_thread(self):
-        ZONE_INDENT = 5
-        ec2 = boto3.client('ec2')
-        regions = ec2.describe_regions(AllRegions=self.show_all.get())
-        for r_row,rgn in enumerate(sorted(regions['Regions'], key=lambda k: k['RegionName'])):
+        self.run_worker(self.refresh_thread, self.show_all.get())
+
+    def refresh_thread(self, show_all):
+        ec2 = client('ec2')
+        regions = ec2.describe_regions(AllRegions=show_all)
+        regions = sorted(regions['Regions'], key=lambda k: k['RegionName'])
+        self.queue_render(self.show_regions, regions)
+        # query the zones of each region in parallel and show each
+        # region as it answers
+        with ThreadPoolExecutor(max_workers=REGION_WORKERS) as pool:
+            jobs = {pool.submit(self.region_zones, r['RegionName'], show_all):
+                        r['RegionName'] for r in regions}
+            for job in as_completed(jobs):
+                try:
+                    self.queue_render(self.show_zones, jobs[job], job.result(), None)
+                except Exception as e:
+                    self.queue_render(self.show_zones, jobs[job], [], e)
+        self.queue_render(self.refresh_done)
+
+    def show_regions(self, regions):
+        self.zone_frames = {}
+        for r_row,rgn in enumerate(regions):
             f = ttk.Frame(self.tree)
             f.grid(row=r_row*2, column=0, sticky=tk.NSEW)
             l = ttk.Label(f, text=rgn['RegionName'])
@@ -236,49 +288,73 @@ class SawscRegions(tk.Toplevel):
             if rgn['OptInStatus'] not in ['opted-in', 'opt-in-not-required', ]:
                 l = ttk.Label(f, text=rgn['OptInStatus'])
                 l.grid(row=0, column=1, sticky=tk.W, padx=PADDING)
-            try:
-                z = ttk.Frame(f)
-                z.grid(row=(r_row*2)+1, column=0, columnspan=3, sticky=tk.NW)
-                zec2 = boto3.client('ec2', region_name=rgn['RegionName'])
-                avail_zones = zec2.describe_availability_zones(
-                                    AllAvailabilityZones=self.show_all.get())
-                for z_row,zone in enumerate(sorted(avail_zones['AvailabilityZones'],
-                                                key = lambda k: k['ZoneName'])):
-                    l = ttk.Label(z, text='', width=ZONE_INDENT)
-                    l.grid(row=z_row, column=0)
-                    l = ttk.Label(z, text=zone['ZoneName'])
-                    l.grid(row=z_row, column=1, sticky=tk.NW, padx=PADDING)
-                    if zone['State'] not in ['available', 'information']:
-                        l = ttk.Label(z, text=zone['State'])
-                        l.grid(row=z_row, column=2, sticky=tk.W, padx=PADDING)
-            except:
-                l = ttk.Label(z, text='', width=ZONE_INDENT)
-                l.grid(row=0, column=0)
-                l = ttk.Label(z, text='Unavailable')
-                l.grid(row=0, column=1, sticky=tk.NW, padx=PADDING)
+            z = ttk.Frame(f)
+            z.grid(row=1, column=0, columnspan=3, sticky=tk.NW)
+            self.zone_frames[rgn['RegionName']] = z
+
+    def show_zones(self, region, avail_zones, err):
+        z = self.zone_frames[region]
+        if err is not None:
+            l = ttk.Label(z, text='', width=self.ZONE_INDENT)
+            l.grid(row=0, column=0)
+            l = ttk.Label(z, text='Unavailable')
+            l.grid(row=0, column=1, sticky=tk.NW, padx=PADDING)
+            tt = ToolTip(l, text=str(err))
+            return
+        for z_row,zone in enumerate(avail_zones):
+            l = ttk.Label(z, text='', width=self.ZONE_INDENT)
+            l.grid(row=z_row, column=0)
+            l = ttk.Label(z, text=zone['ZoneName'])
+            l.grid(row=z_row, column=1, sticky=tk.NW, padx=PADDING)
+            if zone['State'] not in ['available', 'information']:
+                l = ttk.Label(z, text=zone['State'])
+                l.grid(row=z_row, column=2, sticky=tk.W, padx=PADDING)
+
+    def refresh_done(self):
         self.progress.stop()
         self.show_check['state'] = tk.NORMAL
 
+    def region_zones(self, region, show_all):
+        zec2 = client('ec2', region=region)
+        avail_zones = zec2.describe_availability_zones(AllAvailabilityZones=show_all)
+        return sorted(avail_zones['AvailabilityZones'], key=lambda k: k['ZoneName'])
+
     def close_window(self, evnt=None):
         App.after(100, App.check_windows())
         self.destroy()
 
 
-class SawscEC2Types(tk.Toplevel):
+class SawscEC2Types(RenderQueue, tk.Toplevel):
     def __init__(self):
         super().__init__()
+        self.init_render()
+        self.catalog = None
         self.title('AWS EC2 Types')
         self.geometry('1080x605')
         self.protocol("WM_DELETE_WINDOW", self.close_window)
         self.bind('<F5>', self.refresh)
         self.options = ttk.Frame(self)
         self.options.grid(row=0, column=0, sticky=tk.EW)
+        # numeric filters - (label, catalog column, from var, to var)
+        self.ranges = [('VCPUs:', 'vcpus', tk.StringVar(), tk.StringVar()),
+                       ('RAM GiB:', 'ram_gib', tk.StringVar(), tk.StringVar())]
+        for n,(txt,_,lo,hi) in enumerate(self.ranges):
+            l = ttk.Label(self.options, text=txt)
+            l.grid(row=0, column=n*4+2, sticky=tk.E, padx=PADDING)
+            for c,v in enumerate([lo, hi]):
+                e = ttk.Entry(self.options, textvariable=v, width=6)
+                e.grid(row=0, column=n*4+3+c*2, padx=PADDING)
+                e.bind('<Return>', self.show_types)
+            l = ttk.Label(self.options, text='to')
+            l.grid(row=0, column=n*4+4)
+        b = ttk.Button(self.options, text='Filter', bootstyle='primary-outline', command=self.show_types)
+        b.grid(row=0, column=20, padx=PADDING)
         self.progress = tspinner(self.options)
         self.progress.grid(row=0, column=1, sticky=tk.E, padx=PADDING)
         st = ttk.Style()
         cols = ['Type', 'arch', 'Manuf.', 'VCPUs', 'Cores', 'Threads',
-                'RAM', 'Inst Stg', 'Stg Size',
-                'GPU Name', 'GPU Manuf', 'GPU count', 'GPU RAM',
+                'RAM GiB', 'Inst Stg', 'Stg GB',
+                'GPU Name', 'GPU Manuf', 'GPU count', 'GPU RAM GiB',
                 ]
         self.tree = Tableview(self, coldata=cols, searchable=True,
                                 autofit=True,
@@ -286,66 +362,44 @@ class SawscEC2Types(tk.Toplevel):
         self.tree.grid(row=1, column=0, sticky=tk.NSEW)
         self.rowconfigure(1, weight=1)
         self.columnconfigure(0, weight=1)
-        self.refresh()
+        self.refresh(force=False)
 
-    def refresh(self, evnt=None):
-        self.tree.delete_rows()
-        t=thr.Thread(target=self.refresh_thread)
-        t.daemon = True
+    def refresh(self, evnt=None, force=True):
         self.progress.start()
-        t.start()
-
-    def refresh_thread(self):
-        ec2 = boto3.client('ec2')
-        inst_types = ec2.describe_instance_types()
-        types_data = []
-        for inst in inst_types['InstanceTypes']:
-            tr = []
-            # Type
-            tr.append(inst['InstanceType'])
-            # arch
-            tr.append(','.join(inst['ProcessorInfo']['SupportedArchitectures']))
-            # Manufacturer
-            tr.append(inst['ProcessorInfo']['Manufacturer'])
-            # VCPUs
-            tr.append(inst['VCpuInfo']['DefaultVCpus'])
-            # Cores
-            tr.append(inst['VCpuInfo']['DefaultCores'])
-            # Threads
-            tr.append(inst['VCpuInfo']['DefaultThreadsPerCore'])
-            # RAM - MiB
-            tr.append(hs(inst['MemoryInfo']['SizeInMiB']*1024*1024))
-            # Inst Storage
-            tr.append(inst['InstanceStorageSupported'])
-            # Inst Storage size GB
-            if 'InstanceStorageInfo' in inst:
-                tr.append(hs(inst['InstanceStorageInfo']['TotalSizeInGB']*1024*1024*1024, a_k_is_1024=False))
-            else:
-                tr.append('')
-            # GPU Name
-            have_gpuinfo = 'GpuInfo' in inst
-            if have_gpuinfo:
-                tr.append(','.join([g['Name'] for g in inst['GpuInfo']['Gpus']]))
-                # GPU Manuf
-                tr.append(','.join([g['Manufacturer'] for g in inst['GpuInfo']['Gpus']]))
-                # GPU count
-                tr.append(','.join([str(g['Count']) for g in inst['GpuInfo']['Gpus']]))
-                # GPU RAM MiB
-                tr.append(','.join([hs(g['MemoryInfo']['SizeInMiB']*1024*1024) for g in inst['GpuInfo']['Gpus']]))
-            else:
-                tr.append('')
-                tr.append('')
-                tr.append('')
-                tr.append('')
-            types_data.append(tr)
-
-        self.tree.insert_rows('end', types_data)
+        self.run_worker(self.refresh_thread, force)
+
+    def refresh_thread(self, force):
+        # the catalog is cached for days, only fetched when old or forced
+        try:
+            cat = load_catalog(force)
+        except Exception as e:
+            print(f'Unable to get instance types: {e}')
+            cat = None
+        self.queue_render(self.set_catalog, cat)
+
+    def set_catalog(self, cat):
+        self.progress.stop()
+        if cat is None: return
+        self.catalog = cat
+        self.show_types()
+
+    def show_types(self, evnt=None):
+        if self.catalog is None: return
+        ranges = {}
+        for _,col,lo,hi in self.ranges:
+            try:
+                ranges[col] = tuple(float(v.get()) if v.get().strip() else None
+                                    for v in [lo, hi])
+            except ValueError:
+                mb.ok(f'{col} range needs numbers.', title='Filter', parent=self)
+                return
+        self.tree.delete_rows()
+        # in catalog order, the set from query() has none
+        self.tree.insert_rows('end', self.catalog.rows(sorted(self.catalog.query(**ranges))))
         self.tree.reset_table()
         self.tree.autofit_columns()
-        self.tree.align_column_right(cid=6)
-        self.tree.align_column_right(cid=8)
-        self.tree.align_column_right(cid=12)
-        self.progress.stop()
+        for c in [3, 4, 5, 6, 8, 11, 12]:
+            self.tree.align_column_right(cid=c)
 
     def close_window(self, evnt=None):
         App.after(100, App.check_windows())
@@ -359,12 +413,13 @@ class SawscGUI(tk.Toplevel):
         self.minsize(width=500, height=400)
         self.geometry('850x850')
         self.develop_notice = None
+        self.view = None
         self.active_choice = tk.StringVar()
         self.active_choice.set(App.opts.active_choice)
         self.bind('<Control-n>', self.menu_new_window)
         self.bind('<Control-q>', self.quitkey)
         self.bind('<Control-w>', self.menu_close_window)
-        self.bind('<F5>', self.change_service)
+        self.bind('<F5>', self.refresh_service)
         self.protocol("WM_DELETE_WINDOW", self.menu_close_window)
         self.add_menus()
         self.layout()
@@ -408,7 +463,7 @@ class SawscGUI(tk.Toplevel):
 
         max_b_width = 0
         for r,s in enumerate(service.keys()):
-            b = ttk.Radiobutton(self.button_list, text=service[s].name, value=s,
+            b = ttk.Radiobutton(self.button_list, text=service.labels[s], value=s,
                             variable=self.active_choice,
                             command=self.change_service,
                             bootstyle='toolbutton')
@@ -419,6 +474,10 @@ class SawscGUI(tk.Toplevel):
 
         self.info_view = ScrolledFrame(self)
         self.info_view.grid(row=0, column=1, sticky=tk.NSEW)
+        # for services that scroll their own list
+        self.info_frame = ttk.Frame(self)
+        self.info_frame.rowconfigure(0, weight=1)
+        self.info_frame.columnconfigure(0, weight=1)
 
         self.rowconfigure(0, weight=1)
         self.columnconfigure(1, weight=10)
@@ -426,16 +485,31 @@ class SawscGUI(tk.Toplevel):
         self.change_service()
 
     def change_service(self, evnt=None):
-        for c in self.info_view.winfo_children():
+        for c in self.info_view.winfo_children() + self.info_frame.winfo_children():
             c.destroy()
-        service[self.active_choice.get()].Opts = App.opts
-        service[self.active_choice.get()].PADDING = PADDING
-        nview = service[self.active_choice.get()].ListFrame(self.info_view)
-        nview.grid(row=0, column=1, sticky=tk.NSEW)
+        if self.active_choice.get() not in service:
+            self.active_choice.set(list(service.keys())[0])
+        svc = service[self.active_choice.get()]
+        svc.Opts = App.opts
+        svc.PADDING = PADDING
+        if svc.ListFrame.scrolled:
+            self.info_frame.grid_remove()
+            self.info_view.grid()
+            self.view = svc.ListFrame(self.info_view)
+            self.view.grid(row=0, column=1, sticky=tk.NSEW)
+        else:
+            self.info_view.grid_remove()
+            self.info_frame.grid(row=0, column=1, sticky=tk.NSEW)
+            self.view = svc.ListFrame(self.info_frame)
+            self.view.grid(row=0, column=0, sticky=tk.NSEW)
         if App.opts.remember_service:
             App.opts.active_choice = self.active_choice.get()
             App.opts.save()
 
+    def refresh_service(self, evnt=None):
+        if self.view is not None:
+            self.view.refresh()
+
     def about_me(self, evnt=None):
         mb.ok('Setup and manage AWS resources.', title='About SawsC v'+vers, parent = self)
 
@@ -478,6 +552,8 @@ class AppWindow(tk.Tk):
         super().__init__()
         self.opts = GUIOptions()
         self.opts.load()
+        configure(self.opts.max_pool_connections, self.opts.page_size)
+        cache.configure(self.opts.cache_file, self.opts.cache_ttl)
         App = self
 
     def check_windows(self):
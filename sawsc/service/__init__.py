@@ -30,42 +30,351 @@
 #  OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 #
 
+import queue
 import threading as thr
+import time
+import traceback
 import tkinter as tk
 import ttkbootstrap as ttk
+from ttkbootstrap.dialogs import Messagebox as mb
+from ttkbootstrap.tooltip import ToolTip
 
+from ..core import cache
+from ..core.clients import client, paginate
+from ..core.tags import change_tags, retag
+
+PADDING = 2
+
+
+class RenderQueue:
+    '''
+    Tk widgets should only be changed from the main thread. Worker threads
+    started with run_worker() fetch data and use queue_render() to pass
+    calls back, the Tk main loop then runs the queued calls in batches of
+    no more than frame_budget seconds so the ui stays responsive while a
+    large result is shown.
+    '''
+    frame_budget = 0.008 # seconds of queued calls run per tick
+    tick = 15 # ms between ticks
+
+    def init_render(self):
+        self.render_q = queue.SimpleQueue()
+        self.render_workers = 0
+        self.render_running = False
+
+    def run_worker(self, target, *args):
+        def work():
+            try:
+                target(*args)
+            finally:
+                self.render_q.put(None) # tells drain_render this worker is done
+        self.render_workers += 1
+        t = thr.Thread(target=work)
+        t.daemon = True
+        t.start()
+        if not self.render_running:
+            self.render_running = True
+            self.after(self.tick, self.drain_render)
+
+    def queue_render(self, func, *args):
+        self.render_q.put((func, args))
+
+    def drain_render(self):
+        if not self.winfo_exists(): return
+        deadline = time.perf_counter() + self.frame_budget
+        while time.perf_counter() < deadline:
+            try:
+                job = self.render_q.get_nowait()
+            except queue.Empty:
+                break
+            if job is None:
+                self.render_workers -= 1
+                continue
+            try:
+                job[0](*job[1])
+            except Exception:
+                # one bad call mustn't stop the calls queued after it
+                traceback.print_exc()
+        if self.render_workers > 0 or not self.render_q.empty():
+            self.after(self.tick, self.drain_render)
+        else:
+            self.render_running = False
+
+
+class ListBase(RenderQueue, ttk.Frame):
+    # False when the list scrolls itself, eg with a Treeview, instead
+    # of being placed in a ScrolledFrame
+    scrolled = True
+
+    # key used to cache the listed items, None to not cache them
+    resource_type = None
+    # the core.models record class of the listed items
+    record_type = None
 
-class ListBase(ttk.Frame):
     def __init__(self, par, **kwargs):
         super().__init__(par, **kwargs)
-        self.refresh()
+        self.init_render()
+        self.rows = {} # item key: (item, row widget)
+        self.seen = set()
+        # each refresh gets the next generation, updates queued by the
+        # worker of an older refresh are ignored once a newer one started
+        self.generation = 0
+        self.layout()
+        self.refresh(force=False)
+
+    def layout(self):
+        '''
+        Override this to create widgets that stay between refreshes
+        '''
+        pass
 
     def clear_list(self):
         for c in self.winfo_children():
             c.destroy()
+        self.rows = {}
 
     def copy_to_clip(self, txt):
-        self.master.master.master.clipboard_clear()
-        self.master.master.master.clipboard_append(txt)
-        self.master.master.master.update()
+        self.clipboard_clear()
+        self.clipboard_append(txt)
+        self.update()
 
-    def tag_name(self, inst):
-        if 'Tags' not in inst: return ''
-        return [t['Value'] for t in inst['Tags'] if t['Key'] == 'Name'][0]
+    def refresh(self, force=True):
+        '''
+        Show the items, when force is False fresh cached items are shown
+        without asking aws.
+        '''
+        self.generation += 1
+        self.run_worker(self.thr_get_data, force, self.generation)
 
-    def refresh(self):
-        t = thr.Thread(target=self.thr_get_data)
-        t.daemon = True
-        t.start()
+    def thr_get_data(self, force=True, gen=None):
+        '''
+        Runs in a worker thread. Unless forced any cached items are shown
+        first and only fetched again when older than their ttl.
+
+        returns: list of the items listed last
+        '''
+        key = self.cache_key()
+        if key is not None and not force:
+            cached, age = cache.load(key)
+            if cached is not None:
+                items = self.queue_items((self.record_type.from_dict(i) for i in cached), gen)
+                if age <= cache.ttl.get(key, 0):
+                    return items
+        items = self.queue_items(self.fetch_data(), gen)
+        if key is not None:
+            cache.save(key, [i.to_dict() for i in items])
+        return items
+
+    def cache_key(self):
+        return self.resource_type
+
+    def queue_items(self, items, gen=None):
+        '''
+        Queue a full result set to be merged into the list.
+
+        gen -- generation of the refresh the items are from
+
+        returns: list of the items
+        '''
+        listed = []
+        self.queue_render(self.begin_update, gen)
+        for item in items:
+            self.queue_render(self.update_item, item, gen)
+            listed.append(item)
+        # only reached once every item is fetched, so a failed fetch
+        # leaves the old rows in place
+        self.queue_render(self.end_update, gen)
+        return listed
+
+    def is_stale(self, gen):
+        '''
+        True when gen is from a refresh that a newer one replaced, None
+        is never stale so changes made outside a refresh always show.
+        '''
+        return gen is not None and gen != self.generation
 
-    def thr_get_data(self):
+    def begin_update(self, gen=None):
+        if self.is_stale(gen): return
+        self.seen = set()
+
+    def update_item(self, item, gen=None):
+        '''
+        Add a row for a new item or update the row of a changed item,
+        unchanged items keep their row.
+        '''
+        if self.is_stale(gen): return
+        key = self.item_key(item)
+        self.seen.add(key)
+        if key not in self.rows:
+            self.rows[key] = (item, self.add_row(item))
+        elif self.rows[key][0] != item:
+            row = self.rows[key][1]
+            self.update_row(row, item)
+            self.rows[key] = (item, row)
+
+    def end_update(self, gen=None):
+        if self.is_stale(gen): return
+        for key in [k for k in self.rows if k not in self.seen]:
+            self.remove_row(self.rows.pop(key)[1])
+
+    def item_key(self, item):
+        return item.key
+
+    def replace_item(self, item):
+        '''
+        Show a local change to a listed item without fetching the list.
+        '''
+        key = self.item_key(item)
+        if key in self.rows and self.rows[key][0] != item:
+            row = self.rows[key][1]
+            self.update_row(row, item)
+            self.rows[key] = (item, row)
+
+    def add_row(self, item):
+        row = ttk.Frame(self, borderwidth=2, relief=tk.RIDGE)
+        row.pack(side=tk.TOP, expand=True, fill=tk.X)
+        self.fill_row(row, item)
+        return row
+
+    def update_row(self, row, item):
+        for c in row.winfo_children():
+            c.destroy()
+        self.fill_row(row, item)
+
+    def remove_row(self, row):
+        row.destroy()
+
+    def fetch_data(self):
+        '''
+        Override this to yield the records to list, runs in a worker
+        thread so it must not touch any widgets.
+        '''
+        return []
+
+    def fetch_records(self, service, operation, result_key, **kwargs):
         '''
-        Override this to get and display specific data
+        Yield a record_type record for each result of a paginated aws call,
+        only the record is kept of each response item.
         '''
-        self.clear_list()
-        l = ttk.Label(self, text=' display data here')
+        for item in self.fetch_pages(service, operation, result_key, **kwargs):
+            yield self.record_type.from_api(item)
+
+    def fetch_pages(self, service, operation, result_key, **kwargs):
+        '''
+        Yield each result of a paginated aws call, the items of each page
+        are passed on as soon as the page arrives.
+        '''
+        for page in paginate(client(service), operation, result_key, **kwargs):
+            yield from page
+
+    def fill_row(self, row, item):
+        '''
+        Override this to display an item in its row frame, runs in the
+        main thread.
+        '''
+        l = ttk.Label(row, text=' display data here')
         l.grid(row=0, column=0)
 
+    def edit_tags(self, items, other_ids=()):
+        '''
+        Add, change and delete the tags of several ec2 resources at once.
+
+        items     -- listed records, their rows show the new tags
+        other_ids -- ids of resources that aren't listed, eg volumes
+        '''
+        ids = [i.id for i in items] + list(other_ids)
+        if not len(ids): return
+        w = tk.Toplevel(self)
+        w.title(f'Tags of {ids[0]}' if len(ids) == 1 else f'Tags of {len(ids)} resources')
+        w.minsize(450, 120)
+        # key: values of the key, a key is only shown with a value when
+        # every resource has the same value
+        values = {}
+        for i in items:
+            for k,v in i.tags:
+                values.setdefault(k, []).append(v)
+        frame = ttk.Frame(w)
+        frame.grid(row=0, column=0, columnspan=3, sticky=tk.NSEW, padx=PADDING, pady=PADDING)
+        for c,txt in enumerate(['Key', 'Value', 'Delete']):
+            l = ttk.Label(frame, text=txt)
+            l.grid(row=0, column=c, sticky=tk.W, padx=PADDING)
+        frame.columnconfigure(1, weight=1)
+        rows = [] # (key var, value var, delete var, shown value or None)
+
+        def add_row(key='', vals=()):
+            shared = len(vals) == len(ids) and len(set(vals)) == 1
+            k_var = tk.StringVar(value=key)
+            v_var = tk.StringVar(value=vals[0] if shared else '')
+            d_var = tk.BooleanVar(value=False)
+            r = len(rows) + 1
+            e = ttk.Entry(frame, textvariable=k_var, width=24,
+                            state='readonly' if key else tk.NORMAL)
+            e.grid(row=r, column=0, sticky=tk.EW, padx=PADDING)
+            e = ttk.Entry(frame, textvariable=v_var, width=40)
+            e.grid(row=r, column=1, sticky=tk.EW, padx=PADDING)
+            if key and not shared:
+                tt = ToolTip(e, text='The resources have different values, left empty they are kept')
+            cb = ttk.Checkbutton(frame, variable=d_var)
+            cb.grid(row=r, column=2, padx=PADDING)
+            rows.append((k_var, v_var, d_var, v_var.get() if shared else None))
+
+        for k in sorted(values):
+            add_row(k, values[k])
+
+        def do_apply():
+            set_tags = {}
+            remove_keys = []
+            for k_var,v_var,d_var,shown in rows:
+                k = k_var.get().strip()
+                if not k: continue
+                if d_var.get():
+                    remove_keys.append(k)
+                elif shown is None and v_var.get() == '' and k in values:
+                    # differing values are kept
+                    continue
+                elif v_var.get() != shown:
+                    set_tags[k] = v_var.get()
+            w.destroy()
+            if len(set_tags) or len(remove_keys):
+                self.run_worker(self.thr_change_tags, items, list(other_ids),
+                                set_tags, remove_keys)
+
+        b = ttk.Button(w, text='+', bootstyle='success-outline', command=add_row)
+        b.grid(row=1, column=0, sticky=tk.W, padx=PADDING*3, pady=PADDING)
+        tt = ToolTip(b, text='Add a tag')
+        b = ttk.Button(w, text='Apply', command=do_apply)
+        b.grid(row=1, column=2, sticky=tk.E, padx=PADDING*3, pady=PADDING)
+        w.columnconfigure(1, weight=1)
+        if not len(values):
+            add_row()
+
+    def thr_change_tags(self, items, other_ids, set_tags, remove_keys):
+        # instances can be of several profiles and regions
+        by_target = {}
+        for i in items:
+            target = (getattr(i, 'profile', None), getattr(i, 'region', '') or None)
+            by_target.setdefault(target, []).append(i.id)
+        if len(other_ids):
+            by_target.setdefault((None, None), []).extend(other_ids)
+        failed = {}
+        for (profile,region),ids in by_target.items():
+            failed.update(change_tags(ids, set_tags, remove_keys, region, profile))
+        for i in items:
+            if i.id not in failed:
+                self.queue_render(self.replace_item, retag(i, set_tags, remove_keys))
+            elif failed[i.id][0]:
+                # the tags were set, only deleting the keys failed
+                self.queue_render(self.replace_item, retag(i, set_tags))
+        for r,(tags_set,err) in failed.items():
+            if tags_set:
+                print(f'Unable to delete tags of {r}, its other tags were set: {err}')
+            else:
+                print(f'Unable to change the tags of {r}: {err}')
+        if len(failed):
+            self.queue_render(lambda: mb.ok(f'The tags of {len(failed)} resources could not'
+                                            ' all be changed, see the console for why.',
+                                            title='Tags not changed', parent=self))
+
 
 class ItemBase(ttk.Frame):
     def __init__(self, par, **kwargs):
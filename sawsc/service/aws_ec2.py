@@ -30,7 +30,6 @@
 #  OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 #
 
-import boto3
 import subprocess as sp
 import tkinter as tk
 import ttkbootstrap as ttk
@@ -38,292 +37,372 @@ from ttkbootstrap.dialogs import Messagebox as mb
 from ttkbootstrap.tooltip import ToolTip
 
 from . import ListBase
+from ..core import cache
+from ..core.catalog import type_choices
+from ..core.ec2 import (States, change_instances, change_type, follow_transitions,
+                        instance_filters, load_instances)
+from ..core.exposure import group_names
+from ..core.inventory import gather, targets
+from ..core.models import Instance
 
 Opts = None # set from gui when making ListFrame
 PADDING = 2
 
-class States:
-    # https://docs.aws.amazon.com/AWSEC2/latest/APIReference/API_InstanceState.html
-    PENDING = 0
-    RUNNING = 16
-    SHUTTING_DOWN = 32
-    TERMINATED = 48
-    STOPPING = 64
-    STOPPED = 80
-
-# types lists - valid aws type to use is [0] from split by space
-# only a personal selection here
-TYPE_CHOICES = {
-    'arm': [
-        'c7g.medium - 1cpu arm 2G',
-        'm7g.medium - 1cpu arm 4G',
-        'r7g.medium - 1cpu arm 8G',
-
-        'c7g.large - 2cpu arm 4G',
-        'm7g.large - 2cpu arm 8G',
-        'r7g.large - 2cpu arm 16G',
-
-        'c7g.xlarge - 4cpu arm 8G',
-        'm7g.xlarge - 4cpu arm 16G',
-        'r7g.xlarge - 4cpu arm 32G',
-
-        'c7g.2xlarge - 8cpu arm 16G',
-        'm7g.2xlarge - 8cpu arm 32G',
-        'r7g.2xlarge - 8cpu arm 64G',
-
-        'c7g.4xlarge - 16cpu arm 32G',
-        'm7g.4xlarge - 16cpu arm 64G',
-        'r7g.4xlarge - 16cpu arm 128G',
-
-        'c7g.8xlarge - 32cpu arm 64G',
-        'm7g.8xlarge - 32cpu arm 128G',
-        'r7g.8xlarge - 32cpu arm 256G',
-
-        'c7g.16xlarge - 64cpu arm 128G',
-        'm7g.16xlarge - 64cpu arm 256G',
-        'r7g.16xlarge - 64cpu arm 512G',
-        ],
-
-    'x86': [
-        't3a.nano - 2cpu 0.5G',
-        't3a.micro - 2cpu 1G',
-        't3a.small - 2cpu 2G',
-        't3a.medium - 2cpu 4G',
-        't3a.large - 2cpu 8G',
-
-        't3a.xlarge - 4cpu 16G',
-
-        'c6a.2xlarge - 8cpu 16G',
-        'm6a.2xlarge - 8cpu 32G',
-        'r6a.2xlarge - 8cpu 64G',
-
-        'c6a.4xlarge - 16cpu 32G',
-        'm6a.4xlarge - 16cpu 64G',
-        'r6a.4xlarge - 16cpu 128G',
-
-        'c6a.8xlarge - 32cpu 64G',
-        'm6a.8xlarge - 32cpu 128G',
-        'r6a.8xlarge - 32cpu 256G',
-
-        'c6a.16xlarge - 64cpu 128G',
-        'm6a.16xlarge - 64cpu 256G',
-        'r6a.16xlarge - 64cpu 512G',
-
-        'c6a.32xlarge - 128cpu 256G',
-        'm6a.32xlarge - 128cpu 512G',
-        'r6a.32xlarge - 128cpu 1024G',
-
-        'c6a.48xlarge - 192cpu 384G',
-        'm6a.48xlarge - 192cpu 768G',
-        'r6a.48xlarge - 192cpu 1536G',
-        ],
-
-    'gpu': [
-        'g5.xlarge - 4cpu 16G +GPU',
-        'g5.2xlarge - 8cpu 32G +GPU',
-        'g5.4xlarge - 16cpu 64G +GPU',
-        ],
-
-    'mac': [], # TODO find some mac choices
-    }
-
 
 name = 'EC2'
 
-ec2 = boto3.client('ec2')
+
+# treeview columns - (id, heading, width)
+COLUMNS = [
+    ('name', 'Name', 160),
+    ('account', 'Account', 100),
+    ('region', 'Region', 110),
+    ('id', 'Instance ID', 160),
+    ('state', 'State', 90),
+    ('type', 'Type', 100),
+    ('cpus', 'CPUs / arch', 100),
+    ('az', 'Availability zone', 120),
+    ('vpc', 'VPC ID', 170),
+    ('key', 'SSH Key', 120),
+    ('keypath', 'Key path', 200),
+    ('ipv4', 'Public IPv4', 120),
+    ('dns', 'Public DNS', 280),
+    ('ipv6', 'IPv6', 280),
+    ]
+COLUMN_IDS = [c[0] for c in COLUMNS]
+
 
 class ListFrame(ListBase):
-    def thr_get_data(self):
-        response = ec2.describe_security_groups()
-        sec_grp_names = {}
-        for g in response['SecurityGroups']:
-            sec_grp_names[g['GroupId']] = self.tag_name(g)
-        response = ec2.describe_instances()
-        self.clear_list()
-        self.instance_ips = {}
-        while True:
-            for resp in response['Reservations']:
-                for i in resp['Instances']:
-                    # fill in while listing net ifs
-                    self.instance_ips[i['InstanceId']] = {'ipv4': '', 'ipv6': '', 'dns': ''}
-                    # if i['State']['Code'] > 255: # clear top byte ?
-                    nt = self.tag_name(i)
-                    if nt == '': nt = 'Unnamed'
-                    item = ttk.Frame(self, borderwidth=2, relief=tk.RIDGE)
-                    item.pack(side=tk.TOP, expand=True, fill=tk.X)
-                    # name
-                    l = ttk.Button(item, text=nt, bootstyle='link',
-                                command=lambda tx=nt: self.copy_to_clip(tx))
-                    l.grid(row=0, column=0, sticky=tk.W, padx=PADDING)
-                    tt = ToolTip(l, text='Name tag of EC2 instance')
-                    # right click to edit name tag
-                    l.bind('<Button-3>', lambda evnt, iid=i['InstanceId'], iname=nt: self.change_name(evnt, iid, iname))
-
-                    # inst id
-                    l = ttk.Button(item, text=i['InstanceId'], bootstyle='link',
-                                command=lambda tx=i['InstanceId']: self.copy_to_clip(tx))
-                    l.grid(row=0, column=1, sticky=tk.W, padx=PADDING)
-                    tt = ToolTip(l, text='Instance ID')
-
-                    # vpcid
-                    if 'VpcId' in i:
-                        l = ttk.Button(item, text=i['VpcId'], bootstyle='link',
-                                    command=lambda tx=i['VpcId']: self.copy_to_clip(tx))
-                        l.grid(row=0, column=2, sticky=tk.W, padx=PADDING)
-                        tt = ToolTip(l, text='VPC ID')
-
-                    # type
-                    if i['State']['Code'] == States.TERMINATED:
-                        l = ttk.Label(item, text=i['InstanceType'], bootstyle='danger')
-                        l.grid(row=1, column=0, sticky=tk.W, padx=PADDING)
-                        tt = ToolTip(l, text='Waiting for AWS to cleanup this resource.')
-                    else:
-                        l = ttk.Button(item, text=i['InstanceType'], bootstyle='link',
-                                    command=lambda iid=i['InstanceId'],
-                                            it=i['InstanceType'], ia=i['Architecture']:
-                                        self.change_type(iid, it, ia))
-                        l.grid(row=1, column=0, sticky=tk.W, padx=PADDING)
-                        tt = ToolTip(l, text='Instance Type.\nClick to change.')
-
-                    # cores/arch
-                    cpus = int(i['CpuOptions']['CoreCount']) * int(i['CpuOptions']['ThreadsPerCore'])
-                    txt = f'''{cpus} / {i['Architecture']}'''
-                    l = ttk.Button(item, text=txt, bootstyle='link',
-                                command=lambda tx=txt: self.copy_to_clip(tx))
-                    l.grid(row=1, column=1, sticky=tk.W, padx=PADDING)
-                    tt = ToolTip(l, text='Number of cpus / cpu arch')
-
-                    # az
-                    txt = i['Placement']['AvailabilityZone']
-                    l = ttk.Button(item, text=txt, bootstyle='link',
-                                command=lambda tx=txt: self.copy_to_clip(tx))
-                    l.grid(row=1, column=2, sticky=tk.W, padx=PADDING)
-                    tt = ToolTip(l, text='Availability zone')
-
-                    # state
-                    if i['State']['Code'] == States.TERMINATED:
-                        s_style = 'danger' # green
-                    elif i['State']['Code'] != States.STOPPED:
-                        s_style = 'success-link' # green
-                    else:
-                        s_style = 'link'
-                    if i['State']['Code'] == States.TERMINATED:
-                        l = ttk.Label(item, text=i['State']['Name'], bootstyle=s_style)
-                        l.grid(row=2, column=0, sticky=tk.W, padx=PADDING)
-                        tt = ToolTip(l, text='Waiting for AWS to cleanup this resource.')
-                    else:
-                        l = ttk.Button(item, text=i['State']['Name'], bootstyle=s_style,
-                                    command=lambda iid=i['InstanceId'], istate=i['State']['Code'], iname=nt:
-                                        self.change_state(iid, istate, iname))
-                        l.grid(row=2, column=0, sticky=tk.W, padx=PADDING)
-                        tt = ToolTip(l, text='Instance state.\nClick to change.')
-
-                    # key
-                    l = ttk.Button(item, text=i['KeyName'], bootstyle='link',
-                                command=lambda tx=i['KeyName']: self.copy_to_clip(tx))
-                    l.grid(row=2, column=2, sticky=tk.W, padx=PADDING)
-                    tt = ToolTip(l, text='Name of SSH Key')
-
-                    # ssh into
-                    b = ttk.Button(item, text='start SSH', bootstyle='primary-outline')
-                    b.configure(command=lambda iid=i['InstanceId'], btn=b:
-                                        self.ssh_into(iid, btn=btn))
-                    b.grid(row=3, column=0, sticky=tk.W, padx=PADDING, pady=PADDING)
-                    tt = ToolTip(b, text='Open a terminal and start SSH to this server')
-                    if i['State']['Code'] != States.RUNNING:
-                        b['state'] = tk.DISABLED
-
-                    # key path
-                    if i['InstanceId'] in Opts.known_keys:
-                        l = ttk.Button(item,
-                                    text=Opts.known_keys[i['InstanceId']],
-                                    bootstyle='link',
-                                    command=lambda tx=Opts.known_keys[i['InstanceId']]:
-                                        self.copy_to_clip(tx))
-                        l.grid(row=3, column=2, sticky=tk.W, padx=PADDING)
-                        tt = ToolTip(l, text='Path to SSH Key')
-
-                    # ip address
-                    l = ttk.Label(item, text='Public IPv4:')
-                    l.grid(row=20, column=0, sticky=tk.E)
-                    if 'PublicIpAddress' in i:
-                        self.instance_ips[i['InstanceId']]['ipv4'] = i['PublicIpAddress']
-                        l = ttk.Button(item, text=i['PublicIpAddress'], bootstyle='link',
-                                    command=lambda tx=i['PublicIpAddress']: self.copy_to_clip(tx))
-                        l.grid(row=20, column=1, sticky=tk.W, padx=PADDING)
-                        tt = ToolTip(l, text='Public IPv4 Address')
-                    if 'PublicDnsName' in i:
-                        self.instance_ips[i['InstanceId']]['dns'] = i['PublicDnsName']
-                        l = ttk.Button(item, text=i['PublicDnsName'], bootstyle='link',
-                                    command=lambda tx=i['PublicDnsName']: self.copy_to_clip(tx))
-                        l.grid(row=20, column=2, sticky=tk.W, padx=PADDING)
-                        tt = ToolTip(l, text='Public IPv4 DNS')
-
-                    # network ifaces
-                    net_frame = ttk.Frame(item, borderwidth=1, relief=tk.SOLID, padding=1)
-                    net_frame.grid(row=30, column=0, columnspan=5, sticky=tk.NW)
-                    for nir,ni in enumerate(i['NetworkInterfaces']):
-                        ni_frame = ttk.Frame(net_frame)
-                        ni_frame.grid(row=nir, column=0, sticky=tk.W)
-
-                        l = ttk.Label(ni_frame, text='Network Interface:')
-                        l.grid(row=0, column=0, sticky=tk.E, padx=PADDING)
-                        l = ttk.Button(ni_frame, text=ni['NetworkInterfaceId'], bootstyle='link',
-                                command=lambda tx=ni['NetworkInterfaceId']: self.copy_to_clip(tx))
-                        l.grid(row=0, column=1, sticky=tk.W, padx=PADDING)
-                        tt = ToolTip(l, text='Network interface ID')
-
-                        # ipv4
-                        ## frame
-                        ipv4_frame = ttk.Frame(ni_frame)
-                        ipv4_frame.grid(row=10, column=0, columnspan=5, sticky=tk.W)
-                        for row,ip4 in enumerate(ni['PrivateIpAddresses']):
-                            l = ttk.Button(ipv4_frame, text=ip4['PrivateIpAddress'], bootstyle='link',
-                                        command=lambda tx=ip4['PrivateIpAddress']: self.copy_to_clip(tx))
-                            l.grid(row=row, column=0, sticky=tk.E)
-                            tt = ToolTip(l, text='Private IP address')
-                            l = ttk.Button(ipv4_frame, text=ip4['PrivateDnsName'], bootstyle='link',
-                                        command=lambda tx=ip4['PrivateDnsName']: self.copy_to_clip(tx))
-                            l.grid(row=row, column=1, sticky=tk.W)
-                            tt = ToolTip(l, text='Private DNS name')
-
-                        # ipv6
-                        if 'Ipv6Addresses' in ni:
-                            ipv6_frame = ttk.Frame(ni_frame)
-                            ipv6_frame.grid(row=20, column=0, columnspan=5, sticky=tk.W)
-                            if len(ni['Ipv6Addresses']):
-                                self.instance_ips[i['InstanceId']]['ipv6'] = \
-                                                ni['Ipv6Addresses'][0]['Ipv6Address']
-                            for row,ip6 in enumerate(ni['Ipv6Addresses']):
-                                l = ttk.Button(ipv6_frame, text=ip6['Ipv6Address'], bootstyle='link',
-                                            command=lambda tx=ip6['Ipv6Address']: self.copy_to_clip(tx))
-                                l.grid(row=row, column=0)
-                                tt = ToolTip(l, text='IPv6 address')
-
-                        # sg
-                        sg_frame = ttk.Frame(ni_frame)
-                        sg_frame.grid(row=30, column=0, columnspan=5, sticky=tk.W)
-                        for row,sg in enumerate(ni['Groups']):
-                            l = ttk.Button(sg_frame, text=sg['GroupId'], bootstyle='link',
-                                        command=lambda tx=sg['GroupId']: self.copy_to_clip(tx))
-                            l.grid(row=row, column=0, sticky=tk.E)
-                            tt = ToolTip(l, text='Security group ID')
-                            sg_tag_name = sec_grp_names[sg['GroupId']]
-                            l = ttk.Button(sg_frame, text=sg_tag_name, bootstyle='link',
-                                        command=lambda tx=sg_tag_name: self.copy_to_clip(tx))
-                            l.grid(row=row, column=1, sticky=tk.W)
-                            tt = ToolTip(l, text='Security group name tag')
-                            l = ttk.Button(sg_frame, text=sg['GroupName'], bootstyle='link',
-                                        command=lambda tx=sg['GroupName']: self.copy_to_clip(tx))
-                            l.grid(row=row, column=2, sticky=tk.W)
-                            tt = ToolTip(l, text='Security group name')
-
-            if 'NextToken' in response and response['NextToken'] is not None:
-                response = ec2.describe_instances(NextToken=response['NextToken'])
-            else:
-                break
+    '''
+    Instances are shown in a Treeview which only draws the visible rows,
+    the network interface rows are only added when an instance is opened.
+    '''
+    scrolled = False
+    resource_type = 'instances'
+    record_type = Instance
+
+    def layout(self):
+        self.instances = {}
+        self.sec_grp_names = {}
+        self.filters = []
+
+        # filter bar, the filters are sent to aws
+        fbar = ttk.Frame(self)
+        fbar.grid(row=0, column=0, columnspan=2, sticky=tk.EW, pady=PADDING)
+        self.f_state = tk.StringVar()
+        self.f_name = tk.StringVar()
+        self.f_vpc = tk.StringVar()
+        self.f_tag = tk.StringVar()
+        l = ttk.Label(fbar, text='State:')
+        l.grid(row=0, column=0, sticky=tk.E, padx=PADDING)
+        cb = ttk.Combobox(fbar, textvariable=self.f_state, width=12, values=['',
+                    'pending', 'running', 'stopping', 'stopped', 'shutting-down', 'terminated'])
+        cb.grid(row=0, column=1, sticky=tk.W, padx=PADDING)
+        cb.bind('<<ComboboxSelected>>', self.apply_filters)
+        for c,(txt,var,tip) in enumerate([('Name:', self.f_name, 'Name tag, * and ? match any text'),
+                                    ('VPC:', self.f_vpc, 'VPC ID'),
+                                    ('Tag:', self.f_tag, 'Key=Value or Key')]):
+            l = ttk.Label(fbar, text=txt)
+            l.grid(row=0, column=c*2+2, sticky=tk.E, padx=PADDING)
+            e = ttk.Entry(fbar, textvariable=var, width=16)
+            e.grid(row=0, column=c*2+3, sticky=tk.W, padx=PADDING)
+            e.bind('<Return>', self.apply_filters)
+            tt = ToolTip(e, text=tip)
+        b = ttk.Button(fbar, text='Filter', bootstyle='primary-outline', command=self.apply_filters)
+        b.grid(row=0, column=10, padx=PADDING)
+        b = ttk.Button(fbar, text='Clear', bootstyle='secondary-outline', command=self.clear_filters)
+        b.grid(row=0, column=11, padx=PADDING)
+        self.all_regions = tk.BooleanVar(value=False)
+        self.use_all_regions = False # read by the worker threads
+        cb = ttk.Checkbutton(fbar, text='All regions', variable=self.all_regions,
+                                command=self.change_regions, bootstyle='round-toggle')
+        cb.grid(row=0, column=12, padx=PADDING)
+        # how long each profile took, or why it failed
+        self.status = ttk.Label(fbar)
+        self.status.grid(row=0, column=13, sticky=tk.W, padx=PADDING)
+        self.status_tip = ToolTip(self.status, text='')
+        fbar.columnconfigure(13, weight=1)
+
+        self.tree = ttk.Treeview(self, columns=COLUMN_IDS, selectmode=tk.EXTENDED)
+        self.tree.column('#0', width=30, stretch=False)
+        for c,txt,w in COLUMNS:
+            self.tree.heading(c, text=txt, anchor=tk.W)
+            self.tree.column(c, width=w, stretch=False)
+        ysb = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self.tree.yview)
+        xsb = ttk.Scrollbar(self, orient=tk.HORIZONTAL, command=self.tree.xview)
+        self.tree.configure(yscrollcommand=ysb.set, xscrollcommand=xsb.set)
+        self.show_columns()
+        self.tree.grid(row=1, column=0, sticky=tk.NSEW)
+        ysb.grid(row=1, column=1, sticky=tk.NS)
+        xsb.grid(row=2, column=0, sticky=tk.EW)
+        self.rowconfigure(1, weight=1)
+        self.columnconfigure(0, weight=1)
+
+        colours = ttk.Style().colors
+        self.tree.tag_configure('active', foreground=colours.success)
+        self.tree.tag_configure('terminated', foreground=colours.danger)
+        self.tree.bind('<<TreeviewOpen>>', self.open_row)
+        self.tree.bind('<Double-1>', self.click_row)
+        self.tree.bind('<Button-3>', self.show_menu)
+
+    def clear_list(self):
+        self.tree.delete(*self.tree.get_children())
+        self.instances = {}
+        self.rows = {}
+
+    def apply_filters(self, evnt=None):
+        states = [self.f_state.get()] if self.f_state.get() else None
+        tags = [self.f_tag.get()] if self.f_tag.get() else None
+        self.filters = instance_filters(states, tags, self.f_vpc.get(), self.f_name.get())
+        self.refresh()
+
+    def clear_filters(self, evnt=None):
+        for v in [self.f_state, self.f_name, self.f_vpc, self.f_tag]:
+            v.set('')
+        self.apply_filters()
+
+    def profiles(self):
+        return Opts.profiles or [None]
+
+    def show_columns(self):
+        # account and region are only shown when there can be several
+        hide = []
+        if len(self.profiles()) < 2:
+            hide.append('account')
+        if not self.use_all_regions:
+            hide.append('region')
+        self.tree.configure(displaycolumns=[c for c in COLUMN_IDS if c not in hide])
+
+    def change_regions(self):
+        self.use_all_regions = self.all_regions.get()
+        self.show_columns()
+        self.refresh(force=False)
+
+    def thr_get_data(self, force=True, gen=None):
+        '''
+        Runs in a worker thread. Every profile, and with all regions every
+        region of each, is fetched at the same time and the instances of
+        each are shown as soon as it is done.
+
+        Unless forced the cached instances are shown first, even when older
+        than their ttl, and only those older are fetched again.
+        '''
+        fetch_from, results = targets(self.profiles(), self.use_all_regions, Opts.max_workers)
+        fresh = {}
+        if not force and not len(self.filters):
+            cached = {t: cache.load(self.resource_type, t[0], t[1]) for t in fetch_from}
+            if any(items is not None for items,_ in cached.values()):
+                self.queue_render(self.begin_update, gen)
+                for (profile,region),(items,age) in cached.items():
+                    if items is None:
+                        self.queue_render(self.keep_profile, profile, region, gen)
+                        continue
+                    items = [Instance.from_dict(i) for i in items]
+                    for i in items:
+                        self.queue_render(self.update_item, i, gen)
+                    if age <= cache.ttl.get(self.resource_type, 0):
+                        fresh[(profile, region)] = items
+                for res in results:
+                    self.queue_render(self.keep_profile, res.profile, None, gen)
+                self.queue_render(self.end_update, gen)
+
+        self.queue_render(self.begin_update, gen)
+        for res in results:
+            self.queue_render(self.keep_profile, res.profile, None, gen)
+        for res in gather(lambda p,r: self.fetch_profile(p, r, fresh.get((p, r))),
+                            fetch_from, Opts.max_workers):
+            results.append(res)
+            for i in res.items:
+                self.queue_render(self.update_item, i, gen)
+            if not res.ok:
+                # keep showing what was last listed for the profile
+                self.queue_render(self.keep_profile, res.profile, res.region, gen)
+        self.queue_render(self.end_update, gen)
+        self.queue_render(self.show_results, results, gen)
+
+    def fetch_profile(self, profile, region, cached=None):
+        # runs in a pool thread, cached is the fresh cached instances
+        if cached is not None:
+            instances = cached
+        else:
+            instances = load_instances(self.filters, False, region, profile)
+        # only the groups used by the instances are looked up
+        used = {gid for i in instances for n in i.interfaces for gid,_ in n.groups}
+        try:
+            self.sec_grp_names.update(group_names(used, region, profile))
+        except Exception as e:
+            print(f'Unable to get security group names: {e}')
+        return instances
+
+    def keep_profile(self, profile, region, gen=None):
+        # region None keeps every region of the profile
+        if self.is_stale(gen): return
+        for key,(i,_) in self.rows.items():
+            if i.profile == profile and region in (None, i.region):
+                self.seen.add(key)
+
+    def show_results(self, results, gen=None):
+        if self.is_stale(gen): return
+        failed = [r for r in results if not r.ok]
+        if len(results) < 2 and not failed:
+            self.status.configure(text='')
+        elif failed:
+            self.status.configure(text=f'{len(failed)} of {len(results)} failed',
+                                    bootstyle='danger')
+        else:
+            slowest = max(results, key=lambda r: r.seconds)
+            self.status.configure(text=f'{len(results)} fetched, slowest'
+                                    f' {slowest.name} {slowest.seconds:.2f}s',
+                                    bootstyle='default')
+        self.status_tip.text = '\n'.join(r.summary() for r in results)
+
+    def add_row(self, i):
+        iid = i.id
+        self.instances[iid] = i
+        self.tree.insert('', tk.END, iid=iid, values=self.instance_values(i),
+                            tags=(self.state_tag(i),))
+        if len(i.interfaces):
+            # placeholder so the row can be opened
+            self.tree.insert(iid, tk.END, iid=iid+'/')
+        return iid
+
+    def update_row(self, iid, i):
+        self.instances[iid] = i
+        self.tree.item(iid, values=self.instance_values(i), tags=(self.state_tag(i),))
+        # network interfaces are listed again when next opened
+        was_open = self.tree.item(iid, 'open')
+        self.tree.delete(*self.tree.get_children(iid))
+        if len(i.interfaces):
+            self.tree.insert(iid, tk.END, iid=iid+'/')
+            if was_open:
+                self.open_row(iid=iid)
+
+    def remove_row(self, iid):
+        self.tree.delete(iid)
+        self.instances.pop(iid, None)
+
+    def instance_values(self, i):
+        vals = {'name': i.name or 'Unnamed',
+                'account': i.account,
+                'region': i.region,
+                'id': i.id,
+                'state': i.state_name,
+                'type': i.type,
+                'cpus': f'{i.cpus} / {i.arch}',
+                'az': i.az,
+                'vpc': i.vpc,
+                'key': i.key_name,
+                'keypath': Opts.known_keys[i.id][1] if i.id in Opts.known_keys else '',
+                'ipv4': i.public_ip,
+                'dns': i.public_dns,
+                'ipv6': i.ipv6[0] if len(i.ipv6) else '',
+                }
+        return [vals[c] for c in COLUMN_IDS]
+
+    def state_tag(self, i):
+        if i.state == States.TERMINATED:
+            return 'terminated'
+        elif i.state != States.STOPPED:
+            return 'active'
+        return 'stopped'
+
+    def open_row(self, evnt=None, iid=None):
+        if iid is None:
+            iid = self.tree.focus()
+        if not self.tree.exists(iid+'/'): return
+        self.tree.delete(iid+'/')
+        rows = []
+        for ni in self.instances[iid].interfaces:
+            ips = ni.private_ips
+            rows.append({'name': 'Network interface',
+                         'id': ni.id,
+                         'vpc': ni.subnet,
+                         'ipv4': ips[0][0] if len(ips) else '',
+                         'dns': ips[0][1] if len(ips) else '',
+                         'ipv6': ni.ipv6[0] if len(ni.ipv6) else '',
+                         })
+            for ip4,dns in ips[1:]:
+                rows.append({'name': 'Private IP', 'ipv4': ip4, 'dns': dns})
+            for ip6 in ni.ipv6[1:]:
+                rows.append({'name': 'IPv6', 'ipv6': ip6})
+            for sg_id,sg_name in ni.groups:
+                rows.append({'name': 'Security group',
+                             'id': sg_id,
+                             'type': sg_name,
+                             'dns': self.sec_grp_names.get(sg_id, '')})
+        for n,r in enumerate(rows):
+            self.tree.insert(iid, tk.END, iid=f'{iid}/{n}',
+                                values=[r.get(c, '') for c in COLUMN_IDS])
+
+    def click_row(self, evnt):
+        row = self.tree.identify_row(evnt.y)
+        col = self.tree.identify_column(evnt.x)
+        if row not in self.instances or col == '#0':
+            self.copy_cell(row, col)
+            return
+        # the state and type columns open the change dialogs
+        i = self.instances[row]
+        c_name = self.tree.column(col, 'id')
+        if c_name in ['state', 'type'] and i.state == States.TERMINATED:
+            mb.ok('Waiting for AWS to cleanup this resource.', title='Terminated', parent=self)
+        elif c_name == 'state':
+            sel = self.selected_instances()
+            self.change_state(sel if row in sel else [row])
+        elif c_name == 'type':
+            self.change_type(i)
+        else:
+            self.copy_cell(row, col)
+
+    def selected_instances(self):
+        '''
+        Ids of the selected instances that can still change state, a
+        selected network interface row counts as its instance.
+        '''
+        ids = dict.fromkeys(r.split('/')[0] for r in self.tree.selection())
+        return [i for i in ids if i in self.instances
+                    and self.instances[i].state != States.TERMINATED]
+
+    def copy_cell(self, row, col):
+        if not row or col == '#0': return
+        self.copy_to_clip(self.tree.set(row, col))
+
+    def show_menu(self, evnt):
+        row = self.tree.identify_row(evnt.y)
+        if not row: return
+        col = self.tree.identify_column(evnt.x)
+        if row not in self.tree.selection():
+            self.tree.selection_set(row)
+        menu = tk.Menu(self, tearoff=0)
+        menu.add_command(label='Copy', command=lambda: self.copy_cell(row, col))
+        inst_id = row.split('/')[0]
+        i = self.instances.get(inst_id)
+        if i is not None:
+            nt = i.name
+            menu.add_separator()
+            menu.add_command(label='Rename',
+                    command=lambda: self.change_name(None, inst_id, nt))
+            tagged = [self.instances[r] for r in dict.fromkeys(
+                        r.split('/')[0] for r in self.tree.selection()) if r in self.instances]
+            menu.add_command(label='Edit tags' if len(tagged) < 2 else
+                                    f'Edit tags of {len(tagged)} instances',
+                    command=lambda: self.edit_tags(tagged))
+            sel = self.selected_instances()
+            if len(sel) > 1:
+                menu.add_command(label=f'Change state of {len(sel)} instances',
+                        command=lambda: self.change_state(sel))
+            elif i.state != States.TERMINATED:
+                menu.add_command(label='Change state',
+                        command=lambda: self.change_state([inst_id]))
+            if i.state != States.TERMINATED:
+                menu.add_command(label='Change type',
+                        command=lambda: self.change_type(i))
+            menu.add_command(label='Start SSH',
+                    command=lambda: self.ssh_into(inst_id, btn=self),
+                    state=tk.NORMAL if i.state == States.RUNNING else tk.DISABLED)
+        menu.tk_popup(evnt.x_root, evnt.y_root)
 
     def change_name(self, evnt, inst_id, inst_name):
+        inst = self.instances[inst_id]
         w = tk.Toplevel(self)
         w.title(f'{inst_id} name change')
         w.minsize(350, 80)
@@ -338,70 +417,96 @@ class ListFrame(ListBase):
 
         def do_change():
             print(f'Change {inst_id} name tag to {name_change.get()}')
-            try:
-                ec2.create_tags(Resources=[inst_id], Tags=[{'Key': 'Name', 'Value': name_change.get()}])
-            except Exception as e:
-                print(e)
             w.destroy()
-            self.after(5000, self.refresh())
+            self.run_worker(self.thr_change_tags, [inst], [], {'Name': name_change.get()}, [])
 
         b = ttk.Button(w, text='Change', command=do_change)
         b.grid(row=99, column=1, sticky=tk.W, padx=PADDING*3, pady=PADDING)
 
         w.columnconfigure(0, weight=1)
 
-    def change_state(self, inst_id, inst_state, inst_name):
+    def change_state(self, inst_ids):
         w = tk.Toplevel(self)
         w.title('Change state to:')
         w.resizable(0,0)
 
-        def start():
-            try:
-                ec2.start_instances(InstanceIds=[inst_id])
-            except Exception as e:
-                print(e)
-            w.destroy()
-            self.after(5000, self.refresh())
-
-        def restart():
-            ec2.reboot_instances(InstanceIds=[inst_id])
-            w.destroy()
-
-        def stop():
-            ec2.stop_instances(InstanceIds=[inst_id])
+        def do_change(action, force=False):
             w.destroy()
-
-        def force_stop():
-            ec2.stop_instances(InstanceIds=[inst_id], Force=True)
-            w.destroy()
-
-        l = ttk.Label(w, text='Instance:')
-        l.grid(row=0, column=0, sticky=tk.E, padx=PADDING)
-        l = ttk.Label(w, text=inst_id)
-        l.grid(row=0, column=1, sticky=tk.W, padx=PADDING)
-        l = ttk.Label(w, text='Name:')
-        l.grid(row=1, column=0, sticky=tk.E, padx=PADDING)
-        l = ttk.Label(w, text=inst_name)
-        l.grid(row=1, column=1, sticky=tk.W, padx=PADDING)
+            self.run_worker(self.thr_change_state, action, inst_ids, force)
+
+        if len(inst_ids) == 1:
+            l = ttk.Label(w, text='Instance:')
+            l.grid(row=0, column=0, sticky=tk.E, padx=PADDING)
+            l = ttk.Label(w, text=inst_ids[0])
+            l.grid(row=0, column=1, sticky=tk.W, padx=PADDING)
+            l = ttk.Label(w, text='Name:')
+            l.grid(row=1, column=0, sticky=tk.E, padx=PADDING)
+            l = ttk.Label(w, text=self.instances[inst_ids[0]].name)
+            l.grid(row=1, column=1, sticky=tk.W, padx=PADDING)
+        else:
+            l = ttk.Label(w, text='Instances:')
+            l.grid(row=0, column=0, sticky=tk.E, padx=PADDING)
+            l = ttk.Label(w, text=f'{len(inst_ids)} selected')
+            l.grid(row=0, column=1, sticky=tk.W, padx=PADDING)
         bf = ttk.Frame(w)
         bf.grid(row=10, column=0, columnspan=2, sticky=tk.EW, pady=PADDING)
         bf.columnconfigure(0, weight=1)
         bf.columnconfigure(2, weight=1)
         # start
-        if inst_state == States.STOPPED:
-            b = ttk.Button(bf, text='Start', command=start, bootstyle='success-outline')
+        if any(self.instances[i].state == States.STOPPED for i in inst_ids):
+            b = ttk.Button(bf, text='Start', command=lambda: do_change('start'), bootstyle='success-outline')
             b.grid(row=10, column=1, sticky=tk.EW, padx=PADDING, pady=PADDING)
         # force restart
-        b = ttk.Button(bf, text='Restart', command=restart, bootstyle='danger-outline')
+        b = ttk.Button(bf, text='Restart', command=lambda: do_change('reboot'), bootstyle='danger-outline')
         b.grid(row=20, column=1, sticky=tk.EW,  padx=PADDING, pady=PADDING)
         # stop
-        b = ttk.Button(bf, text='Stop', command=stop, bootstyle='danger-outline')
+        b = ttk.Button(bf, text='Stop', command=lambda: do_change('stop'), bootstyle='danger-outline')
         b.grid(row=30, column=1, sticky=tk.EW,  padx=PADDING, pady=PADDING)
         # force stop
-        b = ttk.Button(bf, text='Force Stop', command=force_stop, bootstyle='danger-outline')
+        b = ttk.Button(bf, text='Force Stop', command=lambda: do_change('stop', True), bootstyle='danger-outline')
         b.grid(row=40, column=1, sticky=tk.EW,  padx=PADDING, pady=PADDING)
 
-    def change_type(self, inst_id, inst_type, inst_arch):
+    def thr_change_state(self, action, inst_ids, force):
+        # runs in a worker, the ids are sent in batches
+        results = change_instances(action, [self.instances[i] for i in inst_ids], force)
+        self.queue_render(self.show_state_results, action, results)
+
+    def show_state_results(self, action, results):
+        failed = []
+        for inst_id,(ok,msg) in results.items():
+            if not ok:
+                failed.append(f'{inst_id}: {msg}')
+            elif self.tree.exists(inst_id):
+                self.tree.set(inst_id, 'state', msg)
+        if len(failed):
+            print('\n'.join(failed))
+            mb.ok('\n'.join(failed[:10] + ([f'and {len(failed)-10} more'] if len(failed) > 10 else [])),
+                    title=f'Unable to {action} {len(failed)} of {len(results)}', parent=self)
+        self.follow([i for i in results if results[i][0]])
+
+    def follow(self, inst_ids):
+        '''
+        Update the rows of changed instances until their state settles,
+        only those instances are fetched again.
+        '''
+        by_target = {}
+        for i in inst_ids:
+            if i in self.instances:
+                inst = self.instances[i]
+                by_target.setdefault((inst.profile, inst.region or None), []).append(i)
+        for (profile,region),ids in by_target.items():
+            self.run_worker(lambda ids=ids, profile=profile, region=region: follow_transitions(ids,
+                        lambda i: self.queue_render(self.update_followed, i),
+                        region=region, profile=profile))
+
+    def update_followed(self, i):
+        # the list may have been refreshed or filtered since the change
+        if self.item_key(i) in self.rows:
+            self.update_item(i)
+
+    def change_type(self, i):
+        inst_id = i.id
+        inst_type = i.type
         w = tk.Toplevel(self)
         w.title('Change Type to:')
         w.resizable(0,0)
@@ -418,31 +523,50 @@ class ListFrame(ListBase):
 
         l = ttk.Label(w, text='Change to:')
         l.grid(row=2, column=0, sticky=tk.E, padx=PADDING)
-        if inst_arch == 'x86_64':
-            if inst_type.startswith('g5'):
-                type_options = TYPE_CHOICES['gpu']
-            else:
-                type_options = TYPE_CHOICES['x86']
-        elif inst_arch == 'arm64':
-            type_options = TYPE_CHOICES['arm']
-        else:
-            type_options = ['Unknown arch']
-        target_type = tk.StringVar()
-        target_type.set([t for t in type_options if t.startswith(inst_type)][0])
-        cb = ttk.Combobox(w, textvariable=target_type, values=type_options, width=30)
+        # filled in when the types valid for this instance are found
+        choices = {}
+        target_type = tk.StringVar(value='Finding types...')
+        cb = ttk.Combobox(w, textvariable=target_type, width=30, state=tk.DISABLED)
         cb.grid(row=2, column=1, sticky=tk.W, padx=PADDING)
 
+        def find_types():
+            try:
+                found = type_choices(inst_type, i.arch, i.az, i.region or None, i.profile)
+            except Exception as e:
+                print(e)
+                found = []
+            self.queue_render(show_types, found)
+
+        def show_types(found):
+            if not w.winfo_exists(): return
+            choices.update({label: t for t,label in found})
+            if len(choices) == 0:
+                target_type.set('No types available')
+                return
+            cb.configure(values=list(choices), state='readonly')
+            target_type.set(next((label for t,label in found if t == inst_type), found[0][1]))
+
         def make_change():
-            if target_type.get() not in TYPE_CHOICES['x86'] + TYPE_CHOICES['arm'] + TYPE_CHOICES['gpu']:
+            if target_type.get() not in choices:
                 print('nope')
                 return
-            ec2.modify_instance_attribute(InstanceId=inst_id,
-                            InstanceType={'Value': target_type.get().split(' ')[0]})
+            new_type = choices[target_type.get()]
             w.destroy()
-            self.after(5000, self.refresh())
+            self.run_worker(thr_change, new_type)
+
+        def thr_change(new_type):
+            try:
+                change_type(inst_id, new_type, i.region or None, i.profile)
+            except Exception as e:
+                msg = f'Unable to change {inst_id} to {new_type}: {e}'
+                print(msg)
+                self.queue_render(lambda: mb.ok(msg, title='Type not changed', parent=self))
+                return
+            self.queue_render(self.follow, [inst_id])
 
         b = ttk.Button(w, text='Change', command=make_change)
         b.grid(row=999, column=1, sticky=tk.E, padx=PADDING, pady=PADDING)
+        self.run_worker(find_types)
 
     def ssh_into(self, inst_id, btn):
         '''
@@ -453,12 +577,13 @@ class ListFrame(ListBase):
         if inst_id in Opts.known_keys:
             username = Opts.known_keys[inst_id][0]
             key_path = f'-i {Opts.known_keys[inst_id][1]}'
-        if self.instance_ips[inst_id]['ipv6'] != '':
-            ssh_cmd = f'''ssh -t -6 -o IdentitiesOnly=yes {key_path} {username}@{self.instance_ips[inst_id]['ipv6']}''' #+ ';exec ${SHELL} ' # to keep term open
-        elif self.instance_ips[inst_id]['dns'] != '':
-            ssh_cmd = f'ssh -t -o IdentitiesOnly=yes {key_path} {username}@'+self.instance_ips[inst_id]['dns']
-        elif self.instance_ips[inst_id]['ipv4'] != '':
-            ssh_cmd = f'ssh -t -o IdentitiesOnly=yes {key_path} {username}@'+self.instance_ips[inst_id]['ipv4']
+        i = self.instances[inst_id]
+        if len(i.ipv6):
+            ssh_cmd = f'''ssh -t -6 -o IdentitiesOnly=yes {key_path} {username}@{i.ipv6[0]}''' #+ ';exec ${SHELL} ' # to keep term open
+        elif i.public_dns != '':
+            ssh_cmd = f'ssh -t -o IdentitiesOnly=yes {key_path} {username}@'+i.public_dns
+        elif i.public_ip != '':
+            ssh_cmd = f'ssh -t -o IdentitiesOnly=yes {key_path} {username}@'+i.public_ip
         else:
             mb.ok('Unable to ssh without an ip address', title='No IP Address', parent=btn)
             return
@@ -30,76 +30,202 @@
 #  OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 #
 
-import boto3
 import tkinter as tk
 import ttkbootstrap as ttk
-from ttkbootstrap.tooltip import ToolTip
 
 from . import ListBase
+from ..core.models import Snapshot
 
 name = 'EC2 snapshots'
 
 Opts = None # set from gui when making ListFrame
 PADDING = 2
 
-ec2 = boto3.client('ec2')
+
+# treeview columns - (id, heading, width), volume rows and their
+# snapshot rows share the columns
+COLUMNS = [
+    ('name', 'Volume / Name', 200),
+    ('id', 'Snapshot ID', 200),
+    ('count', 'Snapshots', 80),
+    ('size', 'Size GiB', 90),
+    ('oldest', 'Oldest / Created', 230),
+    ('newest', 'Newest', 230),
+    ('state', 'State', 90),
+    ('desc', 'Description', 300),
+    ]
+COLUMN_IDS = [c[0] for c in COLUMNS]
+# row of the snapshots without a volume id
+NO_VOLUME = 'No volume'
+
+
+class VolumeSnapshots:
+    '''
+    Totals of the snapshots of one volume, kept up to date as snapshots
+    are added so a volume row can be shown before every page arrives.
+    '''
+    def __init__(self, volume):
+        self.volume = volume
+        self.snapshots = {}
+        self.size = 0
+        self.oldest = ''
+        self.newest = ''
+
+    def add(self, s):
+        old = self.snapshots.get(s.id)
+        if old is not None:
+            self.size -= old.size or 0
+        self.snapshots[s.id] = s
+        self.size += s.size or 0
+        # the times are iso strings so they sort as text
+        if not self.oldest or s.start_time < self.oldest:
+            self.oldest = s.start_time
+        if s.start_time > self.newest:
+            self.newest = s.start_time
+
+    def remove(self, s):
+        self.snapshots.pop(s.id, None)
+        self.size = sum(s.size or 0 for s in self.snapshots.values())
+        times = [s.start_time for s in self.snapshots.values()]
+        self.oldest = min(times, default='')
+        self.newest = max(times, default='')
+
+    def values(self):
+        vals = {'name': self.volume,
+                'count': len(self.snapshots),
+                'size': self.size,
+                'oldest': self.oldest,
+                'newest': self.newest,
+                }
+        return [vals.get(c, '') for c in COLUMN_IDS]
+
 
 class ListFrame(ListBase):
-    def thr_get_data(self):
-        vpcs = ec2.describe_snapshots(OwnerIds=[Opts.aws_customer_id])
-        self.clear_list()
-        while True:
-            for s in vpcs['Snapshots']:
-                nt = self.tag_name(s)
-                if nt == '': nt = 'Unnamed'
-                item = ttk.Frame(self, borderwidth=2, relief=tk.RIDGE)
-                item.pack(side=tk.TOP, expand=True, fill=tk.X)
-                # name
-                l = ttk.Button(item, text=nt, bootstyle='link',
-                            command=lambda tx=nt: self.copy_to_clip(tx))
-                l.grid(row=0, column=0, sticky=tk.W, padx=PADDING)
-                tt = ToolTip(l, text='Name tag of snapshot')
-
-                l = ttk.Button(item, text=s['SnapshotId'], bootstyle='link',
-                            command=lambda tx=s['SnapshotId']: self.copy_to_clip(tx))
-                l.grid(row=0, column=1, sticky=tk.W, padx=PADDING)
-                tt = ToolTip(l, text='Snapshot ID')
-
-                l = ttk.Button(item, text=s['VolumeId'], bootstyle='link',
-                            command=lambda tx=s['VolumeId']: self.copy_to_clip(tx))
-                l.grid(row=0, column=2, sticky=tk.W, padx=PADDING)
-                tt = ToolTip(l, text='VolumeId snapshot was created from')
-
-                # size
-                l = ttk.Label(item, text='Size:')
-                l.grid(row=1, column=0, sticky=tk.E, padx=PADDING)
-                l = ttk.Button(item, text=s['VolumeSize'], bootstyle='link',
-                            command=lambda tx=s['VolumeSize']: self.copy_to_clip(tx))
-                l.grid(row=1, column=1, sticky=tk.W, padx=PADDING)
-
-                # start time
-                l = ttk.Label(item, text='Created:')
-                l.grid(row=2, column=0, sticky=tk.E, padx=PADDING)
-                l = ttk.Button(item, text=s['StartTime'], bootstyle='link',
-                            command=lambda tx=s['StartTime']: self.copy_to_clip(tx))
-                l.grid(row=2, column=1, sticky=tk.W, padx=PADDING)
-
-                # frame for tags
-                if len(s['Tags']) > 1 or (len(s['Tags']) ==1 and s['Tags'][0]['Key'] != 'Name'):
-                    l = ttk.Label(item, text='Tags:')
-                    l.grid(row=9, column=0, sticky=tk.E, padx=PADDING)
-                    t_frame = ttk.Frame(item)
-                    t_frame.grid(row=10, column=0, columnspan=10, sticky=tk.NW)
-                    for r,t in enumerate(s['Tags']):
-                        if t['Key'] == 'Name': continue
-                        l = ttk.Label(t_frame, text=t['Key'])
-                        l.grid(row=r, column=0, sticky=tk.E, padx=PADDING)
-                        l = ttk.Button(t_frame, text=t['Value'], bootstyle='link',
-                                command=lambda tx=t['Value']: self.copy_to_clip(tx))
-                        l.grid(row=r, column=1, sticky=tk.W, padx=PADDING)
-
-            if 'NextToken' in vpcs and vpcs['NextToken'] is not None:
-                vpcs = ec2.describe_vpcs(NextToken=vpcs['NextToken'])
-            else:
-                break
+    '''
+    Snapshots are listed as one row per volume holding their count, size
+    and age, the snapshot rows are only added when a volume is opened.
+    '''
+    scrolled = False
+    resource_type = 'snapshots'
+    record_type = Snapshot
+
+    def layout(self):
+        self.volumes = {}
+        self.tree = ttk.Treeview(self, columns=COLUMN_IDS, selectmode=tk.EXTENDED)
+        self.tree.column('#0', width=30, stretch=False)
+        for c,txt,w in COLUMNS:
+            self.tree.heading(c, text=txt, anchor=tk.W)
+            self.tree.column(c, width=w, stretch=False)
+        ysb = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self.tree.yview)
+        xsb = ttk.Scrollbar(self, orient=tk.HORIZONTAL, command=self.tree.xview)
+        self.tree.configure(yscrollcommand=ysb.set, xscrollcommand=xsb.set)
+        self.tree.grid(row=0, column=0, sticky=tk.NSEW)
+        ysb.grid(row=0, column=1, sticky=tk.NS)
+        xsb.grid(row=1, column=0, sticky=tk.EW)
+        self.rowconfigure(0, weight=1)
+        self.columnconfigure(0, weight=1)
+        self.tree.bind('<<TreeviewOpen>>', self.open_row)
+        self.tree.bind('<Double-1>', self.click_row)
+        self.tree.bind('<Button-3>', self.show_menu)
+
+    def clear_list(self):
+        self.tree.delete(*self.tree.get_children())
+        self.volumes = {}
+        self.rows = {}
+
+    def fetch_data(self):
+        # streamed a page at a time, each page is merged as it arrives
+        return self.fetch_records('ec2', 'describe_snapshots', 'Snapshots',
+                                OwnerIds=[Opts.aws_customer_id or 'self'])
+
+    def add_row(self, s):
+        vid = s.volume or NO_VOLUME
+        vol = self.volumes.get(vid)
+        if vol is None:
+            vol = self.volumes[vid] = VolumeSnapshots(vid)
+            self.tree.insert('', tk.END, iid=vid)
+            # placeholder so the row can be opened
+            self.tree.insert(vid, tk.END, iid=vid+'/')
+        vol.add(s)
+        self.tree.item(vid, values=vol.values())
+        if not self.tree.exists(vid+'/'):
+            # the volume is open so show the snapshot now
+            self.tree.insert(vid, tk.END, iid=s.id, values=self.snapshot_values(s))
+        return s.id
+
+    def update_row(self, sid, s):
+        if self.rows[sid][0].volume != s.volume:
+            self.remove_row(sid)
+            self.add_row(s)
+            return
+        vid = s.volume or NO_VOLUME
+        vol = self.volumes[vid]
+        vol.add(s)
+        self.tree.item(vid, values=vol.values())
+        if self.tree.exists(sid):
+            self.tree.item(sid, values=self.snapshot_values(s))
+
+    def remove_row(self, sid):
+        s = self.rows[sid][0]
+        if self.tree.exists(sid):
+            self.tree.delete(sid)
+        vid = s.volume or NO_VOLUME
+        vol = self.volumes[vid]
+        vol.remove(s)
+        if len(vol.snapshots):
+            self.tree.item(vid, values=vol.values())
+        else:
+            self.tree.delete(vid)
+            del self.volumes[vid]
+
+    def end_update(self, gen=None):
+        if self.is_stale(gen): return
+        # remove_row needs the record of the row
+        for key in [k for k in self.rows if k not in self.seen]:
+            self.remove_row(key)
+            del self.rows[key]
+
+    def snapshot_values(self, s):
+        vals = {'name': s.name or 'Unnamed',
+                'id': s.id,
+                'size': s.size,
+                'oldest': s.start_time,
+                'state': s.state,
+                'desc': s.description,
+                }
+        return [vals.get(c, '') for c in COLUMN_IDS]
+
+    def open_row(self, evnt=None, iid=None):
+        if iid is None:
+            iid = self.tree.focus()
+        if not self.tree.exists(iid+'/'): return
+        self.tree.delete(iid+'/')
+        snaps = sorted(self.volumes[iid].snapshots.values(), key=lambda s: s.start_time)
+        for s in snaps:
+            self.tree.insert(iid, tk.END, iid=s.id, values=self.snapshot_values(s))
+
+    def click_row(self, evnt):
+        row = self.tree.identify_row(evnt.y)
+        col = self.tree.identify_column(evnt.x)
+        if not row or col == '#0': return
+        self.copy_to_clip(self.tree.set(row, col))
 
+    def show_menu(self, evnt):
+        row = self.tree.identify_row(evnt.y)
+        if not row: return
+        col = self.tree.identify_column(evnt.x)
+        if row not in self.tree.selection():
+            self.tree.selection_set(row)
+        menu = tk.Menu(self, tearoff=0)
+        menu.add_command(label='Copy', command=lambda: self.copy_to_clip(self.tree.set(row, col))
+                            if col != '#0' else None)
+        # volume rows tag the volume, not its snapshots
+        sel = self.tree.selection()
+        snaps = [self.rows[r][0] for r in sel if r in self.rows]
+        volumes = [r for r in sel if r in self.volumes and r != NO_VOLUME]
+        count = len(snaps) + len(volumes)
+        if count:
+            menu.add_separator()
+            menu.add_command(label='Edit tags' if count < 2 else f'Edit tags of {count} resources',
+                    command=lambda: self.edit_tags(snaps, volumes))
+        menu.tk_popup(evnt.x_root, evnt.y_root)
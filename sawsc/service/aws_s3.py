@@ -30,31 +30,322 @@
 #  OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 #
 
-import boto3
+import os
 import tkinter as tk
+from tkinter import filedialog
 import ttkbootstrap as ttk
-from ttkbootstrap.tooltip import ToolTip
 
 from . import ListBase
+from .. import hs
+from ..core.models import Bucket
+from ..core.s3 import (LevelCache, Progress, download_jobs, load_details, transfer,
+                        transfer_config, upload_jobs)
 
 Opts = None # set from gui when making ListFrame
+PADDING = 2
 
 name = 'S3'
 
-s3 = boto3.client('s3')
+
+# treeview columns - (id, heading, width)
+COLUMNS = [
+    ('name', 'Bucket / Key', 260),
+    ('created', 'Created / Modified', 230),
+    ('region', 'Region', 120),
+    ('versioning', 'Versioning', 90),
+    ('objects', 'Objects', 100),
+    ('size', 'Size', 100),
+    ('counted', 'Counted by', 100),
+    ]
+COLUMN_IDS = [c[0] for c in COLUMNS]
+
 
 class ListFrame(ListBase):
-    def thr_get_data(self):
-        bucket_list = s3.list_buckets()
-        self.clear_list()
-        for b in bucket_list['Buckets']:
-            item = ttk.Frame(self, borderwidth=2, relief=tk.RIDGE)
-            item.pack(side=tk.TOP, expand=True, fill=tk.X)
-            l = ttk.Button(item, text=b['CreationDate'], bootstyle='link',
-                            command=lambda tx=b['CreationDate']: self.copy_to_clip(tx))
-            l.grid(row=0, column=1, sticky=tk.W, padx=PADDING)
-            tt = ToolTip(l, text='Created')
-            l = ttk.Button(item, text=b['Name'], bootstyle='link',
-                            command=lambda tx=b['Name']: self.copy_to_clip(tx))
-            l.grid(row=0, column=2, sticky=tk.W, padx=PADDING)
-            tt = ToolTip(l, text='Bucket name')
+    '''
+    Buckets are listed as soon as list_buckets returns, their region,
+    versioning and size are filled in as each is fetched.
+
+    Opening a bucket or prefix lists one level of it a page at a time,
+    the rows of a closed level are removed and the levels kept in a
+    LevelCache to open again. Files are uploaded and downloaded from the
+    right click menu of the rows.
+    '''
+    scrolled = False
+    resource_type = 'buckets'
+    record_type = Bucket
+
+    def layout(self):
+        self.details = {}
+        self.levels = LevelCache()
+        self.nodes = {} # iid: (bucket, prefix) of openable rows
+        self.placeholders = {} # iid of an unopened row: its placeholder child
+        self.more = {} # iid of a more row: its parent row
+        self.shown = {} # iid of an open row: (prefixes, objects) of its level shown
+        self.objects = {} # iid: (bucket, key) of object rows
+        self.loading = set()
+        self.tree = ttk.Treeview(self, columns=COLUMN_IDS, selectmode=tk.BROWSE)
+        self.tree.column('#0', width=30, stretch=False)
+        for c,txt,w in COLUMNS:
+            self.tree.heading(c, text=txt, anchor=tk.W)
+            self.tree.column(c, width=w, stretch=False)
+        ysb = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self.tree.yview)
+        xsb = ttk.Scrollbar(self, orient=tk.HORIZONTAL, command=self.tree.xview)
+        self.tree.configure(yscrollcommand=ysb.set, xscrollcommand=xsb.set)
+        self.tree.grid(row=0, column=0, sticky=tk.NSEW)
+        ysb.grid(row=0, column=1, sticky=tk.NS)
+        xsb.grid(row=1, column=0, sticky=tk.EW)
+        # progress of transfers
+        self.status = ttk.Label(self)
+        self.status.grid(row=2, column=0, sticky=tk.W, padx=PADDING)
+        self.rowconfigure(0, weight=1)
+        self.columnconfigure(0, weight=1)
+        colours = ttk.Style().colors
+        self.tree.tag_configure('failed', foreground=colours.danger)
+        self.tree.tag_configure('more', foreground=colours.info)
+        self.tree.bind('<<TreeviewOpen>>', self.open_row)
+        self.tree.bind('<<TreeviewClose>>', self.close_row)
+        self.tree.bind('<Double-1>', self.click_row)
+        self.tree.bind('<Button-3>', self.show_menu)
+
+    def clear_list(self):
+        self.tree.delete(*self.tree.get_children())
+        self.rows = {}
+        self.nodes = {}
+        self.placeholders = {}
+        self.more = {}
+        self.shown = {}
+        self.objects = {}
+
+    def fetch_data(self):
+        return self.fetch_records('s3', 'list_buckets', 'Buckets')
+
+    def thr_get_data(self, force=True, gen=None):
+        listed = super().thr_get_data(force, gen)
+        # the buckets are listed, now fill in their details
+        for d in load_details([b.name for b in listed], not force,
+                                max_workers=Opts.max_workers):
+            self.queue_render(self.show_details, d)
+
+    def add_row(self, b):
+        self.tree.insert('', tk.END, iid=b.name, values=self.bucket_values(b))
+        self.add_node(b.name, b.name, '')
+        return b.name
+
+    def update_row(self, iid, b):
+        self.tree.item(iid, values=self.bucket_values(b))
+
+    def remove_row(self, iid):
+        self.drop_children(iid)
+        self.nodes.pop(iid, None)
+        self.placeholders.pop(iid, None)
+        self.levels.drop(iid)
+        self.tree.delete(iid)
+
+    def add_node(self, iid, bucket, prefix):
+        self.nodes[iid] = (bucket, prefix)
+        # placeholder so the row can be opened
+        self.placeholders[iid] = self.tree.insert(iid, tk.END)
+
+    def drop_children(self, iid):
+        for c in self.tree.get_children(iid):
+            self.drop_children(c)
+            self.nodes.pop(c, None)
+            self.placeholders.pop(c, None)
+            self.more.pop(c, None)
+            self.objects.pop(c, None)
+            # a level still loading has nowhere to be shown
+            self.loading.discard(c)
+        if iid in self.nodes:
+            # the level is closed, the cache may drop it now
+            self.levels.unpin(*self.nodes[iid])
+        self.shown.pop(iid, None)
+        self.tree.delete(*self.tree.get_children(iid))
+
+    def open_row(self, evnt=None, iid=None):
+        if iid is None:
+            iid = self.tree.focus()
+        if iid not in self.placeholders: return
+        self.tree.item(self.placeholders.pop(iid), text='', values=['Loading...'])
+        # an open level is kept until closed, the next page adds to the
+        # rows shown from it
+        self.levels.pin(*self.nodes[iid])
+        self.load_level(iid)
+
+    def close_row(self, evnt=None, iid=None):
+        # only the open levels have rows, the cache keeps the listing
+        if iid is None:
+            iid = self.tree.focus()
+        if iid not in self.nodes or iid in self.placeholders: return
+        self.loading.discard(iid)
+        self.drop_children(iid)
+        self.add_node(iid, *self.nodes[iid])
+
+    def load_level(self, iid, more=False):
+        if iid in self.loading: return
+        self.loading.add(iid)
+        bucket, prefix = self.nodes[iid]
+        d = self.details.get(bucket)
+        self.run_worker(self.thr_load_level, iid, bucket, prefix, more,
+                        d.region if d is not None and d.region else None)
+
+    def thr_load_level(self, iid, bucket, prefix, more, region):
+        try:
+            level = self.levels.load(bucket, prefix, more, region)
+        except Exception as e:
+            print(f'Unable to list {bucket}/{prefix}: {e}')
+            level = None
+        self.queue_render(self.show_level, iid, level)
+
+    def show_level(self, iid, level):
+        if iid not in self.loading or iid not in self.nodes:
+            # closed or removed while loading
+            return
+        self.loading.discard(iid)
+        bucket, prefix = self.nodes[iid]
+        shown = self.shown.get(iid)
+        for c in self.tree.get_children(iid):
+            # the loading row, or the more row of the last page
+            if shown is None or c in self.more:
+                self.more.pop(c, None)
+                self.tree.delete(c)
+        if level is None:
+            row = self.tree.insert(iid, tk.END, values=['Unable to list, double click to try again'
+                                    if shown else 'Unable to list'], tags=('failed',))
+            if shown:
+                self.more[row] = iid
+            return
+        # add what wasn't shown yet
+        n_prefixes, n_objects = shown or (0, 0)
+        for p in level.prefixes[n_prefixes:]:
+            row = self.tree.insert(iid, tk.END, values=[p[len(prefix):]])
+            self.add_node(row, bucket, p)
+        for key,size,modified in level.objects[n_objects:]:
+            # a key ending in / can mark the prefix itself
+            if key != prefix:
+                row = self.tree.insert(iid, tk.END,
+                                values=self.object_values(prefix, key, size, modified))
+                self.objects[row] = (bucket, key)
+        self.shown[iid] = (len(level.prefixes), len(level.objects))
+        if level.more:
+            row = self.tree.insert(iid, tk.END, tags=('more',),
+                            values=[f'More... ({len(level)} listed, double click for the next page)'])
+            self.more[row] = iid
+
+    def object_values(self, prefix, key, size, modified):
+        vals = {'name': key[len(prefix):], 'created': modified, 'size': hs(size, 1)}
+        return [vals.get(c, '') for c in COLUMN_IDS]
+
+    def bucket_values(self, b):
+        vals = {'name': b.name, 'created': b.created}
+        d = self.details.get(b.name)
+        if d is not None and d.error:
+            vals['region'] = d.region
+            vals['versioning'] = d.versioning
+            vals['objects'] = d.error
+        elif d is not None:
+            vals['region'] = d.region
+            vals['versioning'] = d.versioning
+            vals['objects'] = f'{d.objects:,}' + ('+' if d.counted == 'partial scan' else '')
+            vals['size'] = hs(d.size, 1)
+            vals['counted'] = d.counted
+        return [vals.get(c, '') for c in COLUMN_IDS]
+
+    def show_details(self, d):
+        self.details[d.name] = d
+        if d.name in self.rows:
+            self.tree.item(d.name, values=self.bucket_values(self.rows[d.name][0]),
+                            tags=('failed',) if d.error else ())
+
+    def click_row(self, evnt):
+        row = self.tree.identify_row(evnt.y)
+        col = self.tree.identify_column(evnt.x)
+        if not row: return
+        if row in self.more:
+            self.tree.item(row, values=['Loading...'])
+            self.load_level(self.more[row], more=True)
+        elif col != '#0':
+            self.copy_to_clip(self.tree.set(row, col))
+
+    def show_menu(self, evnt):
+        row = self.tree.identify_row(evnt.y)
+        if row not in self.nodes and row not in self.objects: return
+        self.tree.selection_set(row)
+        menu = tk.Menu(self, tearoff=0)
+        if row in self.nodes:
+            bucket, prefix = self.nodes[row]
+            menu.add_command(label='Upload files...', command=lambda: self.upload(row, False))
+            menu.add_command(label='Upload folder...', command=lambda: self.upload(row, True))
+            menu.add_command(label='Download folder...',
+                                command=lambda: self.download(bucket, prefix))
+        else:
+            bucket, key = self.objects[row]
+            menu.add_command(label='Download...', command=lambda: self.download(bucket, key))
+        menu.tk_popup(evnt.x_root, evnt.y_root)
+
+    def region_of(self, bucket):
+        d = self.details.get(bucket)
+        return d.region if d is not None and d.region else None
+
+    def upload(self, row, folder):
+        bucket, prefix = self.nodes[row]
+        title = f'Upload to {bucket}/{prefix}'
+        if folder:
+            path = filedialog.askdirectory(parent=self, title=title)
+            paths = [path] if path else []
+        else:
+            paths = filedialog.askopenfilenames(parent=self, title=title)
+        if not len(paths): return
+        # a folder is put in a prefix of its name
+        def make_jobs():
+            return [j for p in paths for j in upload_jobs(p, bucket,
+                    prefix + os.path.basename(p) + '/' if os.path.isdir(p) else prefix)]
+        self.run_worker(self.thr_transfer, title, True, make_jobs, bucket, row)
+
+    def download(self, bucket, key):
+        dest = filedialog.askdirectory(parent=self, title=f'Download {bucket}/{key} into')
+        if not dest: return
+        if not key.endswith('/') and key:
+            dest += os.sep
+        else:
+            # a folder is saved in a folder of its name
+            dest = os.path.join(dest, key.rstrip('/').rsplit('/', 1)[-1] or bucket)
+        self.run_worker(self.thr_transfer, f'Download of {bucket}/{key}', False,
+                    lambda: download_jobs(bucket, key, dest, self.region_of(bucket)),
+                    bucket, None)
+
+    def thr_transfer(self, title, upload, make_jobs, bucket, row):
+        try:
+            jobs = make_jobs()
+        except Exception as e:
+            # e is unbound once the except block ends, so the text is made here
+            msg = f'{title} failed: {e}'
+            print(msg)
+            self.queue_render(lambda: self.status.configure(text=msg, bootstyle='danger'))
+            return
+        progress = Progress(jobs)
+        self.queue_render(self.show_progress, title, progress)
+        config = transfer_config(Opts.transfer_part_size, Opts.transfer_concurrency)
+        for (path,_,key,_),err in transfer(jobs, upload, config, Opts.max_workers, progress,
+                                            self.region_of(bucket)):
+            if err is not None:
+                print(f'Failed {path} {"to" if upload else "from"} {bucket}/{key}: {err}')
+        self.queue_render(self.show_progress, title, progress)
+        if upload:
+            self.queue_render(self.reload_level, row)
+
+    def show_progress(self, title, progress):
+        self.status.configure(text=f'{title}: {progress.summary()}',
+                                bootstyle='danger' if progress.failed else 'default')
+        if progress.finished < progress.files:
+            # the totals are updated by the transfer threads
+            self.after(500, self.show_progress, title, progress)
+
+    def reload_level(self, row):
+        # only the uploaded to prefix changed, other open levels are kept
+        if row not in self.nodes: return
+        is_open = row not in self.placeholders
+        if is_open:
+            self.close_row(iid=row)
+        self.levels.drop(*self.nodes[row])
+        if is_open:
+            self.open_row(iid=row)
@@ -30,59 +30,100 @@
 #  OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 #
 
-import boto3
 import tkinter as tk
 import ttkbootstrap as ttk
-from ttkbootstrap.tooltip import ToolTip
 
 from . import ListBase
+from ..core.models import Vpc
 
 name = 'VPC'
 
 Opts = None # set from gui when making ListFrame
 PADDING = 2
 
-ec2 = boto3.client('ec2')
+
+# treeview columns - (id, heading, width)
+COLUMNS = [
+    ('name', 'Name', 200),
+    ('id', 'VPC ID', 200),
+    ('cidr', 'IPv4 CIDR', 150),
+    ('ipv6', 'IPv6 CIDR', 300),
+    ]
+COLUMN_IDS = [c[0] for c in COLUMNS]
+
 
 class ListFrame(ListBase):
-    def thr_get_data(self):
-        vpcs = ec2.describe_vpcs()
-        self.clear_list()
-        while True:
-            for v in vpcs['Vpcs']:
-                nt = self.tag_name(v)
-                if nt == '': nt = 'Unnamed'
-                item = ttk.Frame(self, borderwidth=2, relief=tk.RIDGE)
-                item.pack(side=tk.TOP, expand=True, fill=tk.X)
-                # name
-                l = ttk.Button(item, text=nt, bootstyle='link',
-                            command=lambda tx=nt: self.copy_to_clip(tx))
-                l.grid(row=0, column=0, sticky=tk.W, padx=PADDING)
-                tt = ToolTip(l, text='Name tag of VPC')
-                # VpcId
-                l = ttk.Button(item, text=v['VpcId'], bootstyle='link',
-                            command=lambda tx=v['VpcId']: self.copy_to_clip(tx))
-                l.grid(row=0, column=2, sticky=tk.W, padx=PADDING)
-                tt = ToolTip(l, text='VPC ID')
-                # CidrBlock
-                l = ttk.Button(item, text=v['CidrBlock'], bootstyle='link',
-                            command=lambda tx=v['CidrBlock']: self.copy_to_clip(tx))
-                l.grid(row=1, column=0, sticky=tk.W, padx=PADDING)
-                tt = ToolTip(l, text='IPv4 CIDR block')
-                # Ipv6CidrBlockAssociationSet - Ipv6CidrBlock
-                if 'Ipv6CidrBlockAssociationSet' in v:
-                    ip6f = ttk.Frame(item)
-                    ip6f.grid(row=1, column=2)
-                    for r,ip6bas in enumerate(v['Ipv6CidrBlockAssociationSet']):
-                        l = ttk.Button(ip6f, text=ip6bas['Ipv6CidrBlock'], bootstyle='link',
-                                    command=lambda tx=ip6bas['Ipv6CidrBlock']: self.copy_to_clip(tx))
-                        l.grid(row=r, column=0, sticky=tk.W, padx=PADDING)
-                        tt = ToolTip(l, text='IPv6 CIDR block')
-                else:
-                    l = ttk.Label(item, text='No IPv6 CIDR')
-                    l.grid(row=1, column=2, padx=PADDING, pady=PADDING)
-            if 'NextToken' in vpcs and vpcs['NextToken'] is not None:
-                vpcs = ec2.describe_vpcs(NextToken=vpcs['NextToken'])
-            else:
-                break
+    '''
+    VPCs are rows of a Treeview so several can be selected to tag them
+    together.
+    '''
+    scrolled = False
+    resource_type = 'vpcs'
+    record_type = Vpc
+
+    def layout(self):
+        self.vpcs = {}
+        self.tree = ttk.Treeview(self, columns=COLUMN_IDS, show='headings',
+                                    selectmode=tk.EXTENDED)
+        for c,txt,w in COLUMNS:
+            self.tree.heading(c, text=txt, anchor=tk.W)
+            self.tree.column(c, width=w, stretch=False)
+        ysb = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self.tree.yview)
+        xsb = ttk.Scrollbar(self, orient=tk.HORIZONTAL, command=self.tree.xview)
+        self.tree.configure(yscrollcommand=ysb.set, xscrollcommand=xsb.set)
+        self.tree.grid(row=0, column=0, sticky=tk.NSEW)
+        ysb.grid(row=0, column=1, sticky=tk.NS)
+        xsb.grid(row=1, column=0, sticky=tk.EW)
+        self.rowconfigure(0, weight=1)
+        self.columnconfigure(0, weight=1)
+        self.tree.bind('<Double-1>', self.click_row)
+        self.tree.bind('<Button-3>', self.show_menu)
+
+    def clear_list(self):
+        self.tree.delete(*self.tree.get_children())
+        self.vpcs = {}
+        self.rows = {}
+
+    def fetch_data(self):
+        return self.fetch_records('ec2', 'describe_vpcs', 'Vpcs')
+
+    def add_row(self, v):
+        self.vpcs[v.id] = v
+        self.tree.insert('', tk.END, iid=v.id, values=self.vpc_values(v))
+        return v.id
+
+    def update_row(self, iid, v):
+        self.vpcs[iid] = v
+        self.tree.item(iid, values=self.vpc_values(v))
+
+    def remove_row(self, iid):
+        self.tree.delete(iid)
+        self.vpcs.pop(iid, None)
+
+    def vpc_values(self, v):
+        vals = {'name': v.name or 'Unnamed',
+                'id': v.id,
+                'cidr': v.cidr,
+                'ipv6': ', '.join(v.ipv6_cidrs) or 'No IPv6 CIDR',
+                }
+        return [vals[c] for c in COLUMN_IDS]
+
+    def click_row(self, evnt):
+        row = self.tree.identify_row(evnt.y)
+        col = self.tree.identify_column(evnt.x)
+        if not row: return
+        self.copy_to_clip(self.tree.set(row, col))
 
+    def show_menu(self, evnt):
+        row = self.tree.identify_row(evnt.y)
+        if not row: return
+        col = self.tree.identify_column(evnt.x)
+        if row not in self.tree.selection():
+            self.tree.selection_set(row)
+        vpcs = [self.vpcs[r] for r in self.tree.selection() if r in self.vpcs]
+        menu = tk.Menu(self, tearoff=0)
+        menu.add_command(label='Copy', command=lambda: self.copy_to_clip(self.tree.set(row, col)))
+        menu.add_separator()
+        menu.add_command(label='Edit tags' if len(vpcs) < 2 else f'Edit tags of {len(vpcs)} VPCs',
+                command=lambda: self.edit_tags(vpcs))
+        menu.tk_popup(evnt.x_root, evnt.y_root)
@@ -30,147 +30,254 @@
 #  OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 #
 
-import boto3
+import time
 import tkinter as tk
 import ttkbootstrap as ttk
 from ttkbootstrap.tooltip import ToolTip
 
 from . import ListBase
+from ..core.exposure import WORLD, load_index, rule_permissions
+from ..core.models import SecurityGroup
 
 name = 'VPC Security Groups'
 
 Opts = None # set from gui when making ListFrame
 PADDING = 2
 
-ec2 = boto3.client('ec2')
+
+# treeview columns - (id, heading, width), a group row and its rule
+# rows share the columns
+COLUMNS = [
+    ('name', 'Name', 180),
+    ('id', 'Group ID', 180),
+    ('vpc', 'VPC ID', 180),
+    ('proto', 'Protocol', 80),
+    ('ports', 'Ports', 100),
+    ('peer', 'Source / Destination', 200),
+    ('desc', 'Description', 300),
+    ]
+COLUMN_IDS = [c[0] for c in COLUMNS]
+
 
 class ListFrame(ListBase):
-    def thr_get_data(self):
-        sgs = ec2.describe_security_groups()
-        self.clear_list()
-        while True:
-            for g in sgs['SecurityGroups']:
-                nt = self.tag_name(g)
-                if nt == '': nt = 'Unnamed'
-                item = ttk.Frame(self, borderwidth=2, relief=tk.RIDGE)
-                item.pack(side=tk.TOP, expand=True, fill=tk.X)
-                # tagged name
-                l = ttk.Button(item, text=nt, bootstyle='link',
-                            command=lambda tx=nt: self.copy_to_clip(tx))
-                l.grid(row=0, column=0, sticky=tk.W, padx=PADDING)
-                tt = ToolTip(l, text='Name tag of security group')
-                # SG id
-                l = ttk.Button(item, text=g['GroupId'], bootstyle='link',
-                            command=lambda tx=g['GroupId']: self.copy_to_clip(tx))
-                l.grid(row=0, column=1, sticky=tk.W, padx=PADDING)
-                tt = ToolTip(l, text='Security Group ID')
-                # VpcId
-                l = ttk.Button(item, text=g['VpcId'], bootstyle='link',
-                            command=lambda tx=g['VpcId']: self.copy_to_clip(tx))
-                l.grid(row=0, column=2, sticky=tk.W, padx=PADDING)
-                tt = ToolTip(l, text='VPC ID using this SG')
-                # desc
-                l = ttk.Button(item, text=g['Description'], bootstyle='link',
-                            command=lambda tx=g['Description']: self.copy_to_clip(tx))
-                l.grid(row=2, column=0, columnspan=5, sticky=tk.W, padx=PADDING)
-                tt = ToolTip(l, text='Description')
-                rules_frame = ttk.Frame(item)
-                rules_frame.grid(row=10, column=0, columnspan=10, sticky=tk.EW, padx=PADDING, pady=PADDING)
-                # inbound rules
-                l = ttk.Label(rules_frame, text='Inbound Allow:')
-                l.grid(row=0, column=0, sticky=tk.W, padx=PADDING)
-                in_rules = ttk.Frame(rules_frame)
-                in_rules.grid(row=1, column=0, sticky=tk.NW, padx=PADDING, pady=PADDING)
-                for r,rule in enumerate(g['IpPermissions']):
-                    r_frame = ttk.Frame(in_rules, borderwidth=1, relief=tk.SOLID, padding=1)
-                    r_frame.grid(row=r+1, column=0)
-                    l = ttk.Label(r_frame, text='From port:')
-                    l.grid(row=0, column=0, sticky=tk.E, padx=PADDING)
-                    if 'FromPort' in rule:
-                        l = ttk.Button(r_frame, text=rule['FromPort'], bootstyle='link',
-                                command=lambda tx=rule['FromPort']: self.copy_to_clip(tx))
-                        l.grid(row=0, column=1, sticky=tk.W, padx=PADDING)
-                    l = ttk.Label(r_frame, text='To port:')
-                    l.grid(row=1, column=0, sticky=tk.E, padx=PADDING)
-                    if 'ToPort' in rule:
-                        l = ttk.Button(r_frame, text=rule['ToPort'], bootstyle='link',
-                                command=lambda tx=rule['ToPort']: self.copy_to_clip(tx))
-                        l.grid(row=1, column=1, sticky=tk.W, padx=PADDING)
-                    l = ttk.Label(r_frame, text='Protocol:')
-                    l.grid(row=2, column=0, sticky=tk.E, padx=PADDING)
-                    l = ttk.Button(r_frame, text=rule['IpProtocol'], bootstyle='link',
-                            command=lambda tx=rule['IpProtocol']: self.copy_to_clip(tx))
-                    l.grid(row=2, column=1, sticky=tk.W, padx=PADDING)
-                    ip4_frame = ttk.Frame(r_frame)
-                    ip4_frame.grid(row=3, column=0, columnspan=5)
-                    for ir,ip4 in enumerate(rule['IpRanges']):
-                        l = ttk.Button(ip4_frame, text=ip4['CidrIp'], bootstyle='link',
-                            command=lambda tx=ip4['CidrIp']: self.copy_to_clip(tx))
-                        l.grid(row=ir, column=0, padx=PADDING)
-                        tt = ToolTip(l, text='IPv4 CIDR block')
-                        if 'Description' in ip4:
-                            l = ttk.Button(ip4_frame, text=ip4['Description'], bootstyle='link',
-                                command=lambda tx=ip4['Description']: self.copy_to_clip(tx))
-                            l.grid(row=ir, column=1, padx=PADDING)
-                    ip6_frame = ttk.Frame(r_frame)
-                    ip6_frame.grid(row=5, column=0, columnspan=5)
-                    for ir,ip6 in enumerate(rule['Ipv6Ranges']):
-                        l = ttk.Button(ip6_frame, text=ip6['CidrIpv6'], bootstyle='link',
-                            command=lambda tx=ip6['CidrIpv6']: self.copy_to_clip(tx))
-                        l.grid(row=ir, column=0, padx=PADDING)
-                        tt = ToolTip(l, text='IPv6 CIDR block')
-                        if 'Description' in ip6:
-                            l = ttk.Button(ip6_frame, text=ip6['Description'], bootstyle='link',
-                                command=lambda tx=ip6['Description']: self.copy_to_clip(tx))
-                            l.grid(row=ir, column=1, padx=PADDING)
-                # outbound rules
-                l = ttk.Label(rules_frame, text='Outbound Allow:')
-                l.grid(row=0, column=1, sticky=tk.W, padx=PADDING)
-                out_rules = ttk.Frame(rules_frame)
-                out_rules.grid(row=1, column=1, sticky=tk.NE, padx=PADDING, pady=PADDING)
-                for r,rule in enumerate(g['IpPermissionsEgress']):
-                    r_frame = ttk.Frame(out_rules, borderwidth=1, relief=tk.SOLID, padding=1)
-                    r_frame.grid(row=r+1, column=0)
-                    l = ttk.Label(r_frame, text='From port:')
-                    l.grid(row=0, column=0, sticky=tk.E, padx=PADDING)
-                    if 'FromPort' in rule:
-                        l = ttk.Button(r_frame, text=rule['FromPort'], bootstyle='link',
-                                command=lambda tx=rule['FromPort']: self.copy_to_clip(tx))
-                        l.grid(row=0, column=1, sticky=tk.W, padx=PADDING)
-                    l = ttk.Label(r_frame, text='To port:')
-                    l.grid(row=1, column=0, sticky=tk.E, padx=PADDING)
-                    if 'ToPort' in rule:
-                        l = ttk.Button(r_frame, text=rule['ToPort'], bootstyle='link',
-                                command=lambda tx=rule['ToPort']: self.copy_to_clip(tx))
-                        l.grid(row=1, column=1, sticky=tk.W, padx=PADDING)
-                    l = ttk.Label(r_frame, text='Protocol:')
-                    l.grid(row=2, column=0, sticky=tk.E, padx=PADDING)
-                    l = ttk.Button(r_frame, text=rule['IpProtocol'], bootstyle='link',
-                            command=lambda tx=rule['IpProtocol']: self.copy_to_clip(tx))
-                    l.grid(row=2, column=1, sticky=tk.W, padx=PADDING)
-                    ip4_frame = ttk.Frame(r_frame)
-                    ip4_frame.grid(row=3, column=0, columnspan=5)
-                    for ir,ip4 in enumerate(rule['IpRanges']):
-                        l = ttk.Button(ip4_frame, text=ip4['CidrIp'], bootstyle='link',
-                            command=lambda tx=ip4['CidrIp']: self.copy_to_clip(tx))
-                        l.grid(row=ir, column=0, padx=PADDING)
-                        tt = ToolTip(l, text='IPv4 CIDR block')
-                        if 'Description' in ip4:
-                            l = ttk.Button(ip4_frame, text=ip4['Description'], bootstyle='link',
-                                command=lambda tx=ip4['Description']: self.copy_to_clip(tx))
-                            l.grid(row=ir, column=1, padx=PADDING)
-                    ip6_frame = ttk.Frame(r_frame)
-                    ip6_frame.grid(row=5, column=0, columnspan=5)
-                    for ir,ip6 in enumerate(rule['Ipv6Ranges']):
-                        l = ttk.Button(ip6_frame, text=ip6['CidrIpv6'], bootstyle='link',
-                            command=lambda tx=ip6['CidrIpv6']: self.copy_to_clip(tx))
-                        l.grid(row=ir, column=0, padx=PADDING)
-                        tt = ToolTip(l, text='IPv6 CIDR block')
-                        if 'Description' in ip6:
-                            l = ttk.Button(ip6_frame, text=ip6['Description'], bootstyle='link',
-                                command=lambda tx=ip6['Description']: self.copy_to_clip(tx))
-                            l.grid(row=ir, column=1, padx=PADDING)
-            if 'NextToken' in sgs and sgs['NextToken'] is not None:
-                sgs = ec2.describe_security_groups(NextToken=sgs['NextToken'])
+    '''
+    Each group is one row of a Treeview, its rules are only added as
+    rows when the group is opened.
+    '''
+    scrolled = False
+    resource_type = 'security_groups'
+    record_type = SecurityGroup
+
+    def layout(self):
+        self.groups = {}
+        # the ExposureIndex is built by the first query and kept for the
+        # next, index_version counts the changes that make it outdated
+        self.index = None
+        self.index_version = 0
+        # query bar, asks the exposure index which rules allow a port
+        qbar = ttk.Frame(self)
+        qbar.grid(row=0, column=0, columnspan=2, sticky=tk.EW, pady=PADDING)
+        self.q_mode = tk.StringVar(value='Open to')
+        self.q_port = tk.StringVar(value='22')
+        self.q_proto = tk.StringVar(value='tcp')
+        self.q_addr = tk.StringVar()
+        cb = ttk.Combobox(qbar, textvariable=self.q_mode, width=14, state='readonly',
+                    values=['Open to', 'What can reach'])
+        cb.grid(row=0, column=0, padx=PADDING)
+        tt = ToolTip(cb, text='Open to: rules allowing the port from every address given,'
+                    ' the internet when empty.\nWhat can reach: rules allowing the port'
+                    ' into the interface with the address.')
+        for c,(txt,var,w) in enumerate([('Port:', self.q_port, 6),
+                                    ('Address:', self.q_addr, 18)]):
+            l = ttk.Label(qbar, text=txt)
+            l.grid(row=0, column=c*2+1, sticky=tk.E, padx=PADDING)
+            e = ttk.Entry(qbar, textvariable=var, width=w)
+            e.grid(row=0, column=c*2+2, sticky=tk.W, padx=PADDING)
+            e.bind('<Return>', self.query)
+        cb = ttk.Combobox(qbar, textvariable=self.q_proto, width=6,
+                    values=['tcp', 'udp', 'icmp', '-1'])
+        cb.grid(row=0, column=5, padx=PADDING)
+        b = ttk.Button(qbar, text='Query', bootstyle='primary-outline', command=self.query)
+        b.grid(row=0, column=6, padx=PADDING)
+
+        self.tree = ttk.Treeview(self, columns=COLUMN_IDS, selectmode=tk.EXTENDED)
+        self.tree.column('#0', width=30, stretch=False)
+        for c,txt,w in COLUMNS:
+            self.tree.heading(c, text=txt, anchor=tk.W)
+            self.tree.column(c, width=w, stretch=False)
+        ysb = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self.tree.yview)
+        xsb = ttk.Scrollbar(self, orient=tk.HORIZONTAL, command=self.tree.xview)
+        self.tree.configure(yscrollcommand=ysb.set, xscrollcommand=xsb.set)
+        self.tree.grid(row=1, column=0, sticky=tk.NSEW)
+        ysb.grid(row=1, column=1, sticky=tk.NS)
+        xsb.grid(row=2, column=0, sticky=tk.EW)
+        self.rowconfigure(1, weight=1)
+        self.columnconfigure(0, weight=1)
+        self.tree.bind('<<TreeviewOpen>>', self.open_row)
+        self.tree.bind('<Double-1>', self.click_row)
+        self.tree.bind('<Button-3>', self.show_menu)
+
+    def clear_list(self):
+        self.tree.delete(*self.tree.get_children())
+        self.groups = {}
+        self.rows = {}
+
+    def query(self, evnt=None):
+        try:
+            port = int(self.q_port.get())
+        except ValueError:
+            print(f'Invalid port {self.q_port.get()}')
+            return
+        addr = self.q_addr.get().strip()
+        reach = self.q_mode.get() == 'What can reach'
+        if reach and not addr:
+            print('An address is needed to find what can reach it')
+            return
+        # the listed groups are current, only the interfaces need loading
+        groups = list(self.groups.values()) if self.index is None else None
+        self.run_worker(self.thr_query, reach, port, self.q_proto.get(), addr,
+                        self.index, self.index_version, groups or None)
+
+    def thr_query(self, reach, port, proto, addr, idx, version, groups):
+        started = time.perf_counter()
+        try:
+            if idx is None:
+                idx = load_index(groups=groups)
+                self.queue_render(self.keep_index, idx, version)
+            if reach:
+                perms = idx.reaching(addr, port, proto)
             else:
-                break
+                perms = idx.exposed(port, proto, addr.split() or WORLD)
+        except Exception as e:
+            print(f'Unable to query security groups: {e}')
+            return
+        secs = time.perf_counter() - started
+        title = f'{"Reaching" if reach else "Open to"} {addr or "the internet"} on {proto} {port}'
+        self.queue_render(self.show_query, title, idx, perms, secs)
+
+    def keep_index(self, idx, version):
+        # unless the groups changed while it was built
+        if version == self.index_version:
+            self.index = idx
+
+    def drop_index(self):
+        self.index = None
+        self.index_version += 1
+
+    def end_update(self, gen=None):
+        if self.is_stale(gen): return
+        super().end_update(gen)
+        self.drop_index()
+
+    def replace_item(self, item):
+        super().replace_item(item)
+        self.drop_index()
+
+    def show_query(self, title, idx, perms, secs):
+        w = tk.Toplevel(self)
+        w.title(title)
+        w.minsize(600, 250)
+        tree = ttk.Treeview(w, columns=['name', 'ports', 'peer', 'desc'])
+        for c,txt,wd in [('#0', 'Group', 180), ('name', 'Name / Protocol', 140),
+                        ('ports', 'Ports', 90), ('peer', 'Peer', 180), ('desc', 'Description', 220)]:
+            tree.heading(c, text=txt, anchor=tk.W)
+            tree.column(c, width=wd)
+        ysb = ttk.Scrollbar(w, orient=tk.VERTICAL, command=tree.yview)
+        tree.configure(yscrollcommand=ysb.set)
+        tree.grid(row=0, column=0, sticky=tk.NSEW)
+        ysb.grid(row=0, column=1, sticky=tk.NS)
+        # one row per group holding its matching permissions and users
+        for p in sorted(perms, key=lambda p: (p.group, p.protocol, p.low)):
+            if not tree.exists(p.group):
+                g = idx.groups[p.group]
+                tree.insert('', tk.END, iid=p.group, text=p.group, open=True,
+                        values=[g.name or g.group_name, '', g.vpc, g.description])
+            proto = 'all' if p.protocol == '-1' else p.protocol
+            tree.insert(p.group, tk.END, text='allows',
+                        values=[proto, p.ports, p.peer, p.description])
+        for gid in tree.get_children():
+            for n in idx.users(gid):
+                tree.insert(gid, tk.END, text='used by',
+                        values=[n.instance or n.id, '', n.private_ips[0][0] if n.private_ips else '',
+                                n.description])
+        l = ttk.Label(w, text=f'{len(perms)} of {idx.rule_count} rules match, {secs*1000:.0f}ms')
+        l.grid(row=1, column=0, sticky=tk.W, padx=PADDING, pady=PADDING)
+        w.rowconfigure(0, weight=1)
+        w.columnconfigure(0, weight=1)
+
+    def fetch_data(self):
+        return self.fetch_records('ec2', 'describe_security_groups', 'SecurityGroups')
+
+    def add_row(self, g):
+        iid = g.id
+        self.groups[iid] = g
+        self.tree.insert('', tk.END, iid=iid, values=self.group_values(g))
+        if len(g.ingress) or len(g.egress):
+            # placeholder so the row can be opened
+            self.tree.insert(iid, tk.END, iid=iid+'/')
+        return iid
+
+    def update_row(self, iid, g):
+        self.groups[iid] = g
+        self.tree.item(iid, values=self.group_values(g))
+        # rules are listed again when next opened
+        was_open = self.tree.item(iid, 'open')
+        self.tree.delete(*self.tree.get_children(iid))
+        if len(g.ingress) or len(g.egress):
+            self.tree.insert(iid, tk.END, iid=iid+'/')
+            if was_open:
+                self.open_row(iid=iid)
+
+    def remove_row(self, iid):
+        self.tree.delete(iid)
+        self.groups.pop(iid, None)
+
+    def group_values(self, g):
+        vals = {'name': g.name or 'Unnamed',
+                'id': g.id,
+                'vpc': g.vpc,
+                'peer': f'{len(g.ingress)} inbound, {len(g.egress)} outbound rules',
+                'desc': g.description,
+                }
+        return [vals.get(c, '') for c in COLUMN_IDS]
+
+    def open_row(self, evnt=None, iid=None):
+        if iid is None:
+            iid = self.tree.focus()
+        if not self.tree.exists(iid+'/'): return
+        self.tree.delete(iid+'/')
+        g = self.groups[iid]
+        n = 0
+        for direction,label,rules in [('ingress', 'Inbound', g.ingress),
+                                      ('egress', 'Outbound', g.egress)]:
+            for rule in rules:
+                # one row per cidr or group the rule allows
+                for p in rule_permissions(g.id, direction, rule):
+                    self.tree.insert(iid, tk.END, iid=f'{iid}/{n}', values=[
+                            label, '', '', 'all' if p.protocol == '-1' else p.protocol,
+                            p.ports, p.peer, p.description])
+                    n += 1
+
+    def click_row(self, evnt):
+        row = self.tree.identify_row(evnt.y)
+        col = self.tree.identify_column(evnt.x)
+        if not row or col == '#0': return
+        self.copy_to_clip(self.tree.set(row, col))
+
+    def show_menu(self, evnt):
+        row = self.tree.identify_row(evnt.y)
+        if not row: return
+        col = self.tree.identify_column(evnt.x)
+        if row not in self.tree.selection():
+            self.tree.selection_set(row)
+        menu = tk.Menu(self, tearoff=0)
+        menu.add_command(label='Copy', command=lambda: self.copy_to_clip(self.tree.set(row, col))
+                            if col != '#0' else None)
+        # a selected rule row counts as its group
+        groups = [self.groups[g] for g in dict.fromkeys(
+                    r.split('/')[0] for r in self.tree.selection()) if g in self.groups]
+        menu.add_separator()
+        menu.add_command(label='Edit tags' if len(groups) < 2 else
+                                f'Edit tags of {len(groups)} groups',
+                command=lambda: self.edit_tags(groups))
+        menu.tk_popup(evnt.x_root, evnt.y_root)
@@ -0,0 +1,63 @@
+#
+#  tests/conftest.py
+#
+#  Copyright (c)2023 Shane Ambler <Develop@ShaneWare.biz>
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are
+#  met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following disclaimer
+#    in the documentation and/or other materials provided with the
+#    distribution.
+#  * Neither the name of the  nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+#  A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+#  OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+#  SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+#  LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+#  DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+#  THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+#  (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+#  OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+import pytest
+
+from sawsc.core import cache, clients
+
+
+@pytest.fixture
+def aws(tmp_path, monkeypatch):
+    '''
+    A mocked aws with the region only set in ~/.aws/config, as most
+    users have it, and a cache in a temporary directory.
+    '''
+    moto = pytest.importorskip('moto')
+    home = tmp_path / 'home'
+    (home / '.aws').mkdir(parents=True)
+    (home / '.aws' / 'config').write_text('[default]\nregion = us-west-2\n')
+    (home / '.aws' / 'credentials').write_text('[default]\n'
+                'aws_access_key_id = testing\naws_secret_access_key = testing\n')
+    monkeypatch.setenv('HOME', str(home))
+    for var in ('AWS_REGION', 'AWS_DEFAULT_REGION', 'AWS_PROFILE',
+                'AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY', 'AWS_SESSION_TOKEN',
+                'AWS_CONFIG_FILE', 'AWS_SHARED_CREDENTIALS_FILE'):
+        monkeypatch.delenv(var, raising=False)
+    clients._sessions.clear()
+    clients._clients.clear()
+    cache.configure(str(tmp_path / 'cache.db'))
+    with moto.mock_aws():
+        yield
+    clients._sessions.clear()
+    clients._clients.clear()
+    cache.configure(None)
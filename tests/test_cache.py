@@ -0,0 +1,69 @@
+#
+#  tests/test_cache.py
+#
+#  Copyright (c)2023 Shane Ambler <Develop@ShaneWare.biz>
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are
+#  met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following disclaimer
+#    in the documentation and/or other materials provided with the
+#    distribution.
+#  * Neither the name of the  nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+#  A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+#  OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+#  SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+#  LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+#  DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+#  THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+#  (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+#  OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+from sawsc.core import cache, clients, ec2
+
+
+def run_instances(count):
+    c = clients.client('ec2')
+    image = c.describe_images()['Images'][0]['ImageId']
+    res = c.run_instances(ImageId=image, MinCount=count, MaxCount=count)
+    return [i['InstanceId'] for i in res['Instances']]
+
+
+def test_key_uses_config_region(aws):
+    assert cache.current_account() == ('default', 'us-west-2')
+    assert cache.current_account(region='eu-west-1') == ('default', 'eu-west-1')
+
+
+def test_expire_after_state_change(aws):
+    ids = run_instances(2)
+    listed = ec2.load_instances()
+    assert {i.id for i in listed} == set(ids)
+    assert all(i.region == 'us-west-2' for i in listed)
+    assert cache.fresh('instances') is not None
+
+    results = ec2.change_instances('stop', listed[:1])
+    assert results[listed[0].id][0]
+    assert cache.fresh('instances') is None
+    states = {i.id: i.state_name for i in ec2.load_instances()}
+    assert states[listed[0].id] in ('stopping', 'stopped')
+    assert states[listed[1].id] == 'running'
+
+
+def test_cache_round_trip(aws):
+    cache.save('regions', ['us-west-2'])
+    assert cache.fresh('regions', 'default', 'us-west-2') == ['us-west-2']
+    cache.expire('regions', None, 'us-west-2')
+    assert cache.fresh('regions') is None
+    assert cache.load('regions')[0] == ['us-west-2']
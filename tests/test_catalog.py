@@ -0,0 +1,70 @@
+#
+#  tests/test_catalog.py
+#
+#  Copyright (c)2023 Shane Ambler <Develop@ShaneWare.biz>
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are
+#  met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following disclaimer
+#    in the documentation and/or other materials provided with the
+#    distribution.
+#  * Neither the name of the  nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+#  A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+#  OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+#  SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+#  LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+#  DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+#  THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+#  (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+#  OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+from sawsc.core.catalog import COLUMN_NAMES, Catalog
+
+
+def make_catalog():
+    cat = Catalog()
+    for name,arch,vcpus,ram,gpus in [('m5.large', 'x86_64', 2, 8.0, 0),
+                                     ('t4g.small', 'arm64', 2, 2.0, 0),
+                                     ('c5.xlarge', 'x86_64', 4, 8.0, 0),
+                                     ('g4dn.xlarge', 'x86_64', 4, 16.0, 1),
+                                     ('m5.4xlarge', 'x86_64', 16, 64.0, 0)]:
+        row = dict.fromkeys(COLUMN_NAMES, '')
+        row.update(type=name, arch=arch, vcpus=vcpus, ram_gib=ram, gpu_count=gpus)
+        cat.append([row[c] for c in COLUMN_NAMES])
+    return cat
+
+
+def names(cat, rows):
+    return [cat.columns['type'][n] for n in sorted(rows)]
+
+
+def test_query_ranges():
+    cat = make_catalog()
+    assert names(cat, cat.query(vcpus=(2, 4))) == ['m5.large', 't4g.small', 'c5.xlarge',
+                                                   'g4dn.xlarge']
+    assert names(cat, cat.query(vcpus=(4, None), ram_gib=(None, 16.0))) == ['c5.xlarge',
+                                                                            'g4dn.xlarge']
+    assert names(cat, cat.query(ram_gib=(8.0, 8.0))) == ['m5.large', 'c5.xlarge']
+    assert names(cat, cat.query(vcpus=(None, None))) == names(cat, range(len(cat)))
+    assert cat.query(vcpus=(5, 8)) == set()
+
+
+def test_query_conditions():
+    cat = make_catalog()
+    assert names(cat, cat.query(arch='arm64')) == ['t4g.small']
+    assert names(cat, cat.query(gpu=True)) == ['g4dn.xlarge']
+    assert names(cat, cat.query(gpu=False, vcpus=(4, 4))) == ['c5.xlarge']
+    assert names(cat, cat.query(types={'m5.large', 'm6i.large'})) == ['m5.large']
@@ -0,0 +1,55 @@
+#
+#  tests/test_clients.py
+#
+#  Copyright (c)2023 Shane Ambler <Develop@ShaneWare.biz>
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are
+#  met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following disclaimer
+#    in the documentation and/or other materials provided with the
+#    distribution.
+#  * Neither the name of the  nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+#  A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+#  OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+#  SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+#  LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+#  DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+#  THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+#  (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+#  OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+from sawsc.core import catalog, clients
+
+
+def test_fit_page_size(aws):
+    ec2 = clients.client('ec2')
+    assert clients.fit_page_size(ec2, 'describe_instance_types', 200) == 100
+    assert clients.fit_page_size(ec2, 'describe_instance_types', 2) == 5
+    assert clients.fit_page_size(ec2, 'describe_security_groups', 200) == 200
+    # no limits in the model
+    assert clients.fit_page_size(ec2, 'describe_instances', 5000) == 5000
+    assert clients.fit_page_size(clients.client('s3'), 'list_objects_v2', 1000) == 1000
+    # no page size at all
+    assert clients.fit_page_size(clients.client('cloudwatch'), 'list_metrics', 200) is None
+
+
+def test_catalog_pages_within_limit(aws):
+    asked = []
+    clients.client('ec2').meta.events.register('provide-client-params.ec2.DescribeInstanceTypes',
+                        lambda params, **kw: asked.append(params.get('MaxResults')))
+    assert len(catalog.fetch_catalog()) > 100
+    # moto sends every type at once, aws would page them
+    assert set(asked) == {100}
@@ -0,0 +1,124 @@
+#
+#  tests/test_ec2.py
+#
+#  Copyright (c)2023 Shane Ambler <Develop@ShaneWare.biz>
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are
+#  met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following disclaimer
+#    in the documentation and/or other materials provided with the
+#    distribution.
+#  * Neither the name of the  nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+#  A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+#  OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+#  SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+#  LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+#  DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+#  THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+#  (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+#  OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+import pytest
+
+from sawsc.core import clients, ec2
+
+MISSING = 'i-0123456789abcdef0'
+
+
+def run_instances(count):
+    c = clients.client('ec2')
+    image = c.describe_images()['Images'][0]['ImageId']
+    res = c.run_instances(ImageId=image, MinCount=count, MaxCount=count)
+    return [i['InstanceId'] for i in res['Instances']]
+
+
+@pytest.mark.parametrize('txt,choices', [
+    ('1,3,5-7', [1, 3, 5, 6, 7]),
+    (' 2 , 1, 2 ', [1, 2]),
+    ('9-7', [7, 8, 9]),
+    ('4-4,4', [4]),
+    ('1,,2,', [1, 2]),
+    ('', []),
+    ])
+def test_parse_choices(txt, choices):
+    assert ec2.parse_choices(txt) == choices
+
+
+@pytest.mark.parametrize('txt', ['a', '1;2', '-3', '1-2-3', '1-x'])
+def test_parse_choices_bad(txt):
+    with pytest.raises(ValueError):
+        ec2.parse_choices(txt)
+
+
+def count_calls(operation):
+    calls = []
+    clients.client('ec2').meta.events.register(f'provide-client-params.ec2.{operation}',
+                        lambda params, **kw: calls.append(list(params['InstanceIds'])))
+    return calls
+
+
+def test_change_states_chunks(aws, monkeypatch):
+    monkeypatch.setattr(ec2, 'BATCH_SIZE', 2)
+    ids = run_instances(5)
+    calls = count_calls('StopInstances')
+    results = ec2.change_states('stop', ids + ids[:1])
+    assert calls == [ids[0:2], ids[2:4], ids[4:]]
+    assert set(results) == set(ids)
+    assert all(ok and state == 'stopping' for ok,state in results.values())
+
+
+def test_change_states_finds_failed_id(aws, monkeypatch):
+    monkeypatch.setattr(ec2, 'BATCH_SIZE', 3)
+    ids = run_instances(3)
+    calls = count_calls('StartInstances')
+    ec2.change_states('stop', ids)
+    results = ec2.change_states('start', [ids[0], MISSING, ids[1], ids[2]])
+    # the chunk holding the missing id is tried again one id at a time
+    assert calls == [[ids[0], MISSING, ids[1]], [ids[0]], [MISSING], [ids[1]], [ids[2]]]
+    assert not results[MISSING][0]
+    assert 'InvalidInstanceID' in results[MISSING][1]
+    assert [results[i] for i in ids] == [(True, 'pending')] * 3
+
+
+def test_reboot(aws):
+    ids = run_instances(2)
+    assert ec2.change_states('reboot', ids) == {i: (True, 'rebooting') for i in ids}
+
+
+def test_follow_drops_missing_ids(aws):
+    ids = run_instances(2)
+    ec2.change_states('stop', ids[:1])
+    seen = []
+    ec2.follow_transitions([MISSING] + ids, seen.append, delay=0)
+    assert sorted({i.id for i in seen}) == sorted(ids)
+
+
+def test_follow_gives_up_on_repeated_errors(aws, monkeypatch):
+    calls = []
+    def fail(*args):
+        calls.append(args)
+        raise Exception('throttled')
+    monkeypatch.setattr(ec2, 'describe_ids', fail)
+    ec2.follow_transitions(run_instances(1), calls.append, delay=0)
+    assert len(calls) == ec2.FOLLOW_ERRORS
+
+
+def test_change_type_expires_cache(aws):
+    ids = run_instances(1)
+    ec2.change_states('stop', ids)
+    assert ec2.load_instances()[0].type != 't3.large'
+    ec2.change_type(ids[0], 't3.large')
+    assert ec2.load_instances()[0].type == 't3.large'
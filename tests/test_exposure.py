@@ -0,0 +1,171 @@
+#
+#  tests/test_exposure.py
+#
+#  Copyright (c)2023 Shane Ambler <Develop@ShaneWare.biz>
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are
+#  met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following disclaimer
+#    in the documentation and/or other materials provided with the
+#    distribution.
+#  * Neither the name of the  nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+#  A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+#  OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+#  SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+#  LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+#  DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+#  THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+#  (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+#  OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+import random
+
+from sawsc.core.exposure import (ExposureIndex, Permission, PortTree, load_index,
+                                 rule_permissions)
+from sawsc.core.models import NetworkInterface, Rule, SecurityGroup
+
+
+def rule(protocol='tcp', ports=(22, 22), ipv4=(), ipv6=(), groups=()):
+    return Rule(protocol=protocol, from_port=ports[0], to_port=ports[1],
+                ipv4=tuple((c, '') for c in ipv4), ipv6=tuple((c, '') for c in ipv6),
+                groups=tuple(groups))
+
+
+def group(gid, ingress=(), egress=()):
+    return SecurityGroup(id=gid, name=gid, group_name=gid, vpc='vpc-1',
+                         description='', ingress=tuple(ingress), egress=tuple(egress), tags=())
+
+
+def interface(nid, ips, groups, ipv6=(), public_ip=''):
+    return NetworkInterface(id=nid, subnet='subnet-1', private_ips=tuple((ip, '') for ip in ips),
+                            ipv6=tuple(ipv6), groups=tuple((g, g) for g in groups),
+                            public_ip=public_ip, instance='', description='')
+
+
+def make_index():
+    groups = [
+        group('sg-ssh', [rule(ipv4=['0.0.0.0/0'])]),
+        group('sg-web', [rule(ports=(80, 443), ipv4=['10.0.0.0/8'], ipv6=['::/0'])]),
+        group('sg-db', [rule(ports=(5432, 5432), groups=['sg-web'])]),
+        group('sg-admin', [rule(protocol='-1', ports=('', ''), ipv4=['192.168.1.5/32'])]),
+        ]
+    interfaces = [
+        interface('eni-web', ['10.0.0.10'], ['sg-web'], ipv6=['2001:db8::10']),
+        interface('eni-db', ['10.0.1.20'], ['sg-db', 'sg-ssh'], public_ip='54.1.2.3'),
+        ]
+    return ExposureIndex(groups, interfaces)
+
+
+def peers(perms):
+    return sorted((p.group, p.peer) for p in perms)
+
+
+def test_rule_permissions_ports():
+    every = [rule(protocol='-1', ports=('', ''), ipv4=['0.0.0.0/0']),
+             rule(protocol='tcp', ports=(-1, -1), ipv4=['0.0.0.0/0']),
+             rule(protocol='icmp', ports=(8, 0), ipv4=['0.0.0.0/0']),
+             rule(protocol='58', ports=(128, 0), ipv6=['::/0'])]
+    for r in every:
+        assert [p.ports for p in rule_permissions('sg-1', 'ingress', r)] == ['all']
+    (p,) = rule_permissions('sg-1', 'ingress', rule(protocol='6', ports=(80, 443), ipv4=['10.0.0.0/8']))
+    assert (p.protocol, p.low, p.high, p.ports) == ('tcp', 80, 443, '80-443')
+
+
+def test_rule_permissions_peers():
+    r = rule(ipv4=['10.0.0.0/8', '10.1.2.3'], ipv6=['::/0'], groups=['sg-2', 'sg-3'])
+    perms = list(rule_permissions('sg-1', 'egress', r))
+    assert [p.peer for p in perms] == ['10.0.0.0/8', '10.1.2.3/32', '::/0', 'sg-2', 'sg-3']
+    assert all(p.group == 'sg-1' and p.direction == 'egress' for p in perms)
+    assert [p.network is None for p in perms] == [False]*3 + [True]*2
+
+
+def test_allowing():
+    index = make_index()
+    assert peers(index.allowing(22)) == [('sg-admin', '192.168.1.5/32'), ('sg-ssh', '0.0.0.0/0')]
+    assert peers(index.allowing(443)) == [('sg-admin', '192.168.1.5/32'),
+                                          ('sg-web', '10.0.0.0/8'), ('sg-web', '::/0')]
+    assert peers(index.allowing(53, 'udp')) == [('sg-admin', '192.168.1.5/32')]
+    assert index.allowing(22, direction='egress') == []
+    assert index.rule_count == 5
+
+
+def test_exposed_world_and_address():
+    index = make_index()
+    assert peers(index.exposed(22)) == [('sg-ssh', '0.0.0.0/0')]
+    # one address is inside more cidrs than the whole internet
+    assert peers(index.exposed(22, peer='192.168.1.5')) == [('sg-admin', '192.168.1.5/32'),
+                                                             ('sg-ssh', '0.0.0.0/0')]
+    assert peers(index.exposed(22, peer='192.168.1.0/24')) == [('sg-ssh', '0.0.0.0/0')]
+    assert index.exposed(3389) == []
+
+
+def test_exposed_ip_versions():
+    index = make_index()
+    assert peers(index.exposed(443)) == [('sg-web', '::/0')]
+    assert peers(index.exposed(443, peer='0.0.0.0/0')) == []
+    assert peers(index.exposed(443, peer='10.2.3.4')) == [('sg-web', '10.0.0.0/8')]
+    assert peers(index.exposed(443, peer='2001:db8::1')) == [('sg-web', '::/0')]
+
+
+def test_exposed_peer_groups():
+    index = make_index()
+    assert index.groups_of('10.0.0.10') == {'sg-web'}
+    assert index.groups_of('2001:db8::10') == {'sg-web'}
+    assert index.groups_of('10.9.9.9') == set()
+    assert peers(index.exposed(5432, peer='10.0.0.10')) == [('sg-db', 'sg-web')]
+    assert peers(index.exposed(5432, peer='10.0.0.11')) == []
+    # a range is never matched to the groups of its addresses
+    assert peers(index.exposed(5432, peer='10.0.0.10/31')) == []
+
+
+def test_reaching_and_users():
+    index = make_index()
+    assert peers(index.reaching('10.0.1.20', 5432)) == [('sg-db', 'sg-web')]
+    assert peers(index.reaching('54.1.2.3', 22)) == [('sg-ssh', '0.0.0.0/0')]
+    assert peers(index.reaching('10.0.0.10', 22)) == []
+    assert [n.id for n in index.users('sg-ssh')] == ['eni-db']
+    assert index.users('sg-admin') == []
+
+
+def test_cached_groups():
+    index = make_index()
+    groups = [SecurityGroup.from_dict(g.to_dict()) for g in index.groups.values()]
+    interfaces = [NetworkInterface.from_dict(n.to_dict()) for n in index.interfaces.values()]
+    cached = ExposureIndex(groups, interfaces)
+    for port in (22, 80, 443, 5432, 8080):
+        assert peers(cached.allowing(port)) == peers(index.allowing(port))
+    assert peers(cached.exposed(5432, peer='10.0.0.10')) == [('sg-db', 'sg-web')]
+    assert peers(cached.reaching('10.0.1.20', 22)) == [('sg-ssh', '0.0.0.0/0')]
+
+
+def test_port_tree():
+    rnd = random.Random(1)
+    for _ in range(100):
+        perms = []
+        for _ in range(rnd.randint(1, 50)):
+            low = rnd.randint(0, 100)
+            perms.append(Permission('sg-1', 'ingress', 'tcp', low, rnd.randint(low, 100)))
+        tree = PortTree(perms)
+        for port in range(-1, 102):
+            assert (sorted(map(id, tree.find(port))) ==
+                    sorted(id(p) for p in perms if p.low <= port <= p.high))
+
+
+def test_load_index_with_groups(aws):
+    index = make_index()
+    index = load_index(groups=list(index.groups.values()))
+    assert peers(index.exposed(22)) == [('sg-ssh', '0.0.0.0/0')]
+    assert index.interfaces == {}
@@ -0,0 +1,203 @@
+#
+#  tests/test_refresh.py
+#
+#  Copyright (c)2023 Shane Ambler <Develop@ShaneWare.biz>
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are
+#  met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following disclaimer
+#    in the documentation and/or other materials provided with the
+#    distribution.
+#  * Neither the name of the  nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+#  A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+#  OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+#  SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+#  LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+#  DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+#  THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+#  (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+#  OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+from sawsc import CLIOptions
+from sawsc.core import cache, clients, ec2
+from sawsc.core.exposure import ExposureIndex
+from sawsc.core.models import Vpc
+from sawsc.service import ListBase, RenderQueue, aws_ec2, aws_vpc_sg
+
+
+class Rows:
+    # the merging of ListBase without any widgets, so no display is needed
+    is_stale = ListBase.is_stale
+    begin_update = ListBase.begin_update
+    update_item = ListBase.update_item
+    end_update = ListBase.end_update
+    item_key = ListBase.item_key
+
+    def __init__(self):
+        self.rows = {}
+        self.seen = set()
+        self.generation = 0
+
+    def add_row(self, item):
+        return item.id
+
+    def update_row(self, row, item):
+        pass
+
+    def remove_row(self, row):
+        pass
+
+
+def vpc(vid):
+    return Vpc(id=vid, name='', cidr='10.0.0.0/16', ipv6_cidrs=(), tags=())
+
+
+def test_older_refresh_is_ignored():
+    rows = Rows()
+    rows.generation = 1
+    rows.begin_update(1)
+    rows.update_item(vpc('vpc-1'), 1)
+    # a second refresh starts before the first worker is done
+    rows.generation = 2
+    rows.begin_update(2)
+    rows.update_item(vpc('vpc-2'), 2)
+    rows.update_item(vpc('vpc-3'), 1)
+    rows.end_update(2)
+    assert set(rows.rows) == {'vpc-2'}
+    # the first worker finishing late changes nothing
+    rows.end_update(1)
+    rows.begin_update(1)
+    rows.end_update(1)
+    assert set(rows.rows) == {'vpc-2'}
+
+
+def test_changes_outside_a_refresh_show():
+    rows = Rows()
+    rows.update_item(vpc('vpc-1'))
+    assert set(rows.rows) == {'vpc-1'}
+
+
+class Queue(RenderQueue):
+    # runs the ticks itself in place of the Tk main loop
+    def __init__(self):
+        self.init_render()
+        self.ticks = []
+
+    def winfo_exists(self):
+        return True
+
+    def after(self, ms, func):
+        self.ticks.append(func)
+
+
+def test_failed_render_call_keeps_draining(capsys):
+    q = Queue()
+    done = []
+    q.render_workers = 1
+    q.render_running = True
+    q.queue_render(lambda: 1/0)
+    q.queue_render(done.append, 1)
+    q.render_q.put(None)
+    q.drain_render()
+    assert done == [1]
+    assert not q.render_running
+    assert 'ZeroDivisionError' in capsys.readouterr().err
+
+
+class Ec2Rows:
+    # the worker side of the ec2 view, the queued calls are recorded
+    resource_type = 'instances'
+    thr_get_data = aws_ec2.ListFrame.thr_get_data
+    fetch_profile = aws_ec2.ListFrame.fetch_profile
+    profiles = aws_ec2.ListFrame.profiles
+
+    def __init__(self):
+        self.use_all_regions = False
+        self.filters = []
+        self.sec_grp_names = {}
+        self.queued = []
+
+    def queue_render(self, func, *args):
+        self.queued.append((func.__name__, args[0].id if func.__name__ == 'update_item' else None))
+
+    def begin_update(self, gen=None): pass
+    def update_item(self, item, gen=None): pass
+    def end_update(self, gen=None): pass
+    def keep_profile(self, profile, region, gen=None): pass
+    def show_results(self, results, gen=None): pass
+
+
+def test_ec2_shows_stale_cache_first(aws, monkeypatch):
+    monkeypatch.setattr(aws_ec2, 'Opts', CLIOptions())
+    c = clients.client('ec2')
+    image = c.describe_images()['Images'][0]['ImageId']
+    old = c.run_instances(ImageId=image, MinCount=1, MaxCount=1)['Instances'][0]['InstanceId']
+    ec2.load_instances()
+    new = c.run_instances(ImageId=image, MinCount=1, MaxCount=1)['Instances'][0]['InstanceId']
+
+    rows = Ec2Rows()
+    rows.thr_get_data(force=False)
+    # still fresh, so only the cached instance is shown
+    assert ('update_item', new) not in rows.queued
+
+    monkeypatch.setitem(cache.ttl, 'instances', -1)
+    rows = Ec2Rows()
+    rows.thr_get_data(force=False)
+    merges = [n for n,(f,_) in enumerate(rows.queued) if f == 'end_update']
+    assert len(merges) == 2
+    assert rows.queued[:merges[0]+1] == [('begin_update', None), ('update_item', old),
+                                         ('end_update', None)]
+    assert {i for f,i in rows.queued[merges[0]:] if f == 'update_item'} == {old, new}
+
+
+class SgQueries:
+    # the query side of the security group view, calls run at once
+    thr_query = aws_vpc_sg.ListFrame.thr_query
+    keep_index = aws_vpc_sg.ListFrame.keep_index
+    drop_index = aws_vpc_sg.ListFrame.drop_index
+
+    def __init__(self):
+        self.index = None
+        self.index_version = 0
+        self.shown = []
+
+    def queue_render(self, func, *args):
+        func(*args)
+
+    def show_query(self, title, idx, perms, secs):
+        self.shown.append(perms)
+
+    def query(self):
+        self.thr_query(False, 22, 'tcp', '', self.index, self.index_version, [])
+
+
+def test_query_index_kept(monkeypatch):
+    built = []
+    def load_index(groups=None):
+        built.append(groups)
+        return ExposureIndex([], [])
+    monkeypatch.setattr(aws_vpc_sg, 'load_index', load_index)
+    view = SgQueries()
+    view.query()
+    view.query()
+    assert len(built) == 1 and len(view.shown) == 2
+    view.drop_index()
+    view.query()
+    assert len(built) == 2
+    # an index built before a change isn't kept
+    view.index = None
+    view.thr_query(False, 22, 'tcp', '', None, view.index_version - 1, [])
+    assert view.index is None
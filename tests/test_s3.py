@@ -0,0 +1,140 @@
+#
+#  tests/test_s3.py
+#
+#  Copyright (c)2023 Shane Ambler <Develop@ShaneWare.biz>
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are
+#  met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following disclaimer
+#    in the documentation and/or other materials provided with the
+#    distribution.
+#  * Neither the name of the  nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+#  A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+#  OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+#  SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+#  LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+#  DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+#  THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+#  (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+#  OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+import datetime
+import os
+
+from sawsc.core import clients, s3
+
+
+def make_bucket(name, region='us-west-2'):
+    c = clients.client('s3')
+    c.create_bucket(Bucket=name, CreateBucketConfiguration={'LocationConstraint': region})
+    return c
+
+
+def test_storage_metrics_sum_storage_types(aws):
+    # no bucket is made, moto would add metrics of its own for it
+    cw = clients.client('cloudwatch')
+    when = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=5)
+    for metric,storage,value in [('NumberOfObjects', 'AllStorageTypes', 30),
+                                 ('BucketSizeBytes', 'StandardStorage', 5000),
+                                 ('BucketSizeBytes', 'GlacierStorage', 700)]:
+        cw.put_metric_data(Namespace='AWS/S3', MetricData=[{'MetricName': metric,
+                    'Dimensions': [{'Name': 'BucketName', 'Value': 'bucket-one'},
+                                   {'Name': 'StorageType', 'Value': storage}],
+                    'Value': value, 'Timestamp': when}])
+    assert s3.storage_metrics('bucket-one', 'us-west-2') == (30, 5700)
+
+
+def test_scan_pages_of_1000(aws):
+    c = make_bucket('bucket-one')
+    for n in range(30):
+        c.put_object(Bucket='bucket-one', Key=f'k{n}', Body=b'x' * n)
+    asked = []
+    scanner = clients.client('s3', 'us-west-2')
+    scanner.meta.events.register('provide-client-params.s3.ListObjectsV2',
+                                 lambda params, **kw: asked.append(params.get('MaxKeys')))
+    assert s3.scan_objects('bucket-one', 'us-west-2') == (30, sum(range(30)), True)
+    assert asked == [1000]
+    assert s3.scan_objects('bucket-one', 'us-west-2', limit=10) == (30, sum(range(30)), False)
+
+
+def test_transfer_keeps_shared_clients(aws, tmp_path):
+    shared = make_bucket('bucket-one')
+    src = tmp_path / 'src'
+    (src / 'sub').mkdir(parents=True)
+    for n in range(4):
+        (src / f'f{n}').write_bytes(os.urandom(1000 * n))
+    (src / 'sub' / 'big').write_bytes(os.urandom(12 * s3.MIB))
+
+    config = s3.transfer_config(5, 4)
+    jobs = s3.upload_jobs(str(src), 'bucket-one', 'up')
+    assert [err for _,err in s3.transfer(jobs, True, config, max_workers=8)] == [None] * 5
+    # 32 connections were needed, the shared clients weren't remade for them
+    assert clients.max_pool_connections == 10
+    assert clients.client('s3') is shared
+    assert shared.meta.config.max_pool_connections == 10
+
+    dest = tmp_path / 'dest'
+    asked = []
+    shared.meta.events.register('provide-client-params.s3.ListObjectsV2',
+                                lambda params, **kw: asked.append(params.get('MaxKeys')))
+    jobs = s3.download_jobs('bucket-one', 'up/', str(dest))
+    assert asked == [1000]
+    progress = s3.Progress(jobs)
+    assert all(err is None for _,err in s3.transfer(jobs, False, config, 8, progress))
+    assert progress.moved == progress.total
+    for path in ['f0', 'f1', 'f2', 'f3', os.path.join('sub', 'big')]:
+        assert (dest / path).read_bytes() == (src / path).read_bytes()
+
+
+def test_pinned_level_kept(aws, monkeypatch):
+    c = make_bucket('bucket-one')
+    for d in 'abc':
+        for n in range(5):
+            c.put_object(Bucket='bucket-one', Key=f'{d}/k{n}', Body=b'')
+    list_level = s3.list_level
+    monkeypatch.setattr(s3, 'list_level', lambda *args: list_level(*args, max_keys=2))
+    levels = s3.LevelCache(size=2)
+    levels.pin('bucket-one', 'a/')
+    first = levels.load('bucket-one', 'a/')
+    assert first.pages == 1 and first.more
+    levels.load('bucket-one', 'b/')
+    levels.load('bucket-one', 'c/')
+    assert levels.get('bucket-one', 'b/') is None
+    # the open level gets its second page, not its first again
+    assert levels.load('bucket-one', 'a/', more=True) is first
+    assert [k for k,_,_ in first.objects] == ['a/k0', 'a/k1', 'a/k2', 'a/k3']
+
+    levels.unpin('bucket-one', 'a/')
+    levels.load('bucket-one', 'b/')
+    levels.load('bucket-one', 'c/')
+    assert levels.get('bucket-one', 'a/') is None
+    assert len(levels.levels) == 2
+
+
+def test_drop_prefix(aws):
+    c = make_bucket('bucket-one')
+    for key in ['a/k', 'a/b/k', 'ab/k', 'c/k']:
+        c.put_object(Bucket='bucket-one', Key=key, Body=b'')
+    levels = s3.LevelCache()
+    for prefix in ['', 'a/', 'a/b/', 'ab/', 'c/']:
+        levels.pin('bucket-one', prefix)
+        levels.load('bucket-one', prefix)
+    levels.drop('bucket-one', 'a/')
+    assert sorted(p for _,p in levels.levels) == ['', 'ab/', 'c/']
+    assert sorted(p for _,p in levels.pinned) == ['', 'ab/', 'c/']
+    assert levels.count == sum(len(l) for l in levels.levels.values())
+    levels.drop('bucket-one')
+    assert not levels.levels and not levels.pinned and levels.count == 0
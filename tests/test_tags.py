@@ -0,0 +1,114 @@
+#
+#  tests/test_tags.py
+#
+#  Copyright (c)2023 Shane Ambler <Develop@ShaneWare.biz>
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions are
+#  met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following disclaimer
+#    in the documentation and/or other materials provided with the
+#    distribution.
+#  * Neither the name of the  nor the names of its
+#    contributors may be used to endorse or promote products derived from
+#    this software without specific prior written permission.
+#
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+#  "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+#  LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+#  A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+#  OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+#  SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+#  LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+#  DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+#  THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+#  (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+#  OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+
+from sawsc.core import clients, tags
+from sawsc.core.models import Vpc
+
+
+class FakeEc2:
+    # moto tags any id, this rejects a whole call holding a bad id as aws does
+    def __init__(self, bad_create=(), bad_delete=()):
+        self.bad_create = set(bad_create)
+        self.bad_delete = set(bad_delete)
+        self.calls = 0
+        self.tags = {}
+
+    def check(self, ids, bad):
+        self.calls += 1
+        found = sorted(bad.intersection(ids))
+        if found:
+            raise Exception(f'InvalidID: {", ".join(found)}')
+
+    def create_tags(self, Resources, Tags):
+        self.check(Resources, self.bad_create)
+        for r in Resources:
+            self.tags.setdefault(r, {}).update((t['Key'], t['Value']) for t in Tags)
+
+    def delete_tags(self, Resources, Tags):
+        self.check(Resources, self.bad_delete)
+        for r in Resources:
+            for t in Tags:
+                self.tags.get(r, {}).pop(t['Key'], None)
+
+
+def use_fake(monkeypatch, ec2):
+    monkeypatch.setattr(tags, 'client', lambda *args: ec2)
+
+
+def test_bad_ids_found_by_halving(monkeypatch):
+    ids = [f'vol-{n:04d}' for n in range(2500)]
+    ec2 = FakeEc2(bad_create=['vol-0007', 'vol-1500'])
+    use_fake(monkeypatch, ec2)
+    failed = tags.change_tags(ids, {'team': 'a'})
+    assert set(failed) == {'vol-0007', 'vol-1500'}
+    assert all(not tags_set for tags_set,_ in failed.values())
+    assert len(ec2.tags) == 2498
+    # three chunks and two bad ids, about 2 * log2(1000) calls each
+    assert ec2.calls < 50
+
+
+def test_tags_set_but_not_deleted(monkeypatch):
+    ec2 = FakeEc2(bad_delete=['vol-2'])
+    ec2.tags = {r: {'old': 'x'} for r in ('vol-1', 'vol-2', 'vol-3')}
+    use_fake(monkeypatch, ec2)
+    failed = tags.change_tags(['vol-1', 'vol-2', 'vol-3'], {'new': 'y'}, ['old'])
+    assert list(failed) == ['vol-2']
+    assert failed['vol-2'][0]
+    assert ec2.tags['vol-2'] == {'old': 'x', 'new': 'y'}
+    assert ec2.tags['vol-1'] == {'new': 'y'}
+
+
+def test_keys_not_deleted_when_not_set(monkeypatch):
+    ec2 = FakeEc2(bad_create=['vol-2'])
+    ec2.tags = {r: {'old': 'x'} for r in ('vol-1', 'vol-2')}
+    use_fake(monkeypatch, ec2)
+    failed = tags.change_tags(['vol-1', 'vol-2'], {'new': 'y'}, ['old'])
+    assert failed['vol-2'][0] is False
+    assert ec2.tags['vol-2'] == {'old': 'x'}
+
+
+def test_retag():
+    v = Vpc(id='vpc-1', name='old', cidr='10.0.0.0/16', ipv6_cidrs=(),
+            tags=(('Name', 'old'), ('team', 'a')))
+    r = tags.retag(v, {'Name': 'new'}, ['team'])
+    assert (r.name, r.tags) == ('new', (('Name', 'new'),))
+    assert v.name == 'old'
+
+
+def test_change_tags(aws):
+    ec2 = clients.client('ec2')
+    vpc = ec2.create_vpc(CidrBlock='10.0.0.0/16')['Vpc']['VpcId']
+    ec2.create_tags(Resources=[vpc], Tags=[{'Key': 'old', 'Value': 'x'}])
+    assert tags.change_tags([vpc], {'team': 'a'}, ['old']) == {}
+    found = ec2.describe_vpcs(VpcIds=[vpc])['Vpcs'][0]['Tags']
+    assert found == [{'Key': 'team', 'Value': 'a'}]